@@ -0,0 +1,268 @@
+"""
+Student Analytics - Per-student test and attendance statistics for the dashboards
+Marks and attendance are loaded into NumPy arrays once per snapshot and every
+student's numbers are computed together instead of looping in the templates
+"""
+from datetime import datetime
+
+import numpy as np
+
+from leaderboard import class_key
+from sheets_snapshot import normalize_id
+
+# Tests in each student's moving average
+MOVING_WINDOW = 3
+
+
+def day_numbers(values):
+    """Day ordinals for 'YYYY-MM-DD' strings; unreadable dates sort first"""
+    parsed = {}
+    days = np.empty(len(values), dtype=np.int64)
+    for i, value in enumerate(values):
+        value = str(value).strip()
+        if value not in parsed:
+            try:
+                parsed[value] = datetime.strptime(value, '%Y-%m-%d').toordinal()
+            except ValueError:
+                parsed[value] = 0
+        days[i] = parsed[value]
+    return days
+
+
+def _to_float(values):
+    out = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(str(value).strip())
+        except ValueError:
+            pass
+    return out
+
+
+def _group_starts(groups):
+    """For rows sorted by group code, the index where each row's group begins"""
+    n = len(groups)
+    if not n:
+        return np.zeros(0, dtype=np.int64)
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = groups[1:] != groups[:-1]
+    return np.maximum.accumulate(np.where(is_start, np.arange(n), 0))
+
+
+def _moving_average(values, starts, window):
+    """Trailing mean over the last `window` values, restarting at every group boundary"""
+    n = len(values)
+    cumsum = np.concatenate(([0.0], np.cumsum(values)))
+    index = np.arange(n)
+    begin = np.maximum(starts, index - window + 1)
+    return (cumsum[index + 1] - cumsum[begin]) / (index - begin + 1)
+
+
+def _slopes(groups, x, y, count):
+    """Least-squares slope of y against x for every group at once (0 with fewer than 2 points)"""
+    n = np.bincount(groups, minlength=count).astype(float)
+    sx = np.bincount(groups, x, count)
+    sy = np.bincount(groups, y, count)
+    sxx = np.bincount(groups, x * x, count)
+    sxy = np.bincount(groups, x * y, count)
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, 0.0)
+    return slope
+
+
+def _percentile_ranks(groups, scores):
+    """Percentile rank of each score within its group: (below + half of ties) / group size"""
+    order = np.lexsort((scores, groups))
+    g, s = groups[order], scores[order]
+    # Equal (group, score) pairs form one run; its bounds give the below/tie counts
+    new_group = np.ones(len(g), dtype=bool)
+    new_group[1:] = g[1:] != g[:-1]
+    new_run = new_group.copy()
+    new_run[1:] |= s[1:] != s[:-1]
+    index = np.arange(len(g))
+    group_start = np.maximum.accumulate(np.where(new_group, index, 0))
+    run_start = np.maximum.accumulate(np.where(new_run, index, 0))
+    run_ids = np.cumsum(new_run) - 1
+    group_size = np.bincount(g)[g]
+    run_size = np.bincount(run_ids)[run_ids]
+    ranks = np.empty(len(g))
+    ranks[order] = 100.0 * ((run_start - group_start) + 0.5 * run_size) / group_size
+    return ranks
+
+
+def status_runs(groups, status):
+    """
+    Runs of equal status within each group, for rows already sorted by group and date.
+    Returns (group, status, length) arrays with one entry per run, in order.
+    """
+    new_run = np.ones(len(groups), dtype=bool)
+    new_run[1:] = (groups[1:] != groups[:-1]) | (status[1:] != status[:-1])
+    run_lengths = np.bincount(np.cumsum(new_run) - 1)
+    return groups[new_run], status[new_run], run_lengths
+
+
+def factorize(keys):
+    """Integer codes for hashable keys, in first-seen order"""
+    lookup = {}
+    codes = np.fromiter((lookup.setdefault(k, len(lookup)) for k in keys), dtype=np.int64, count=len(keys))
+    return codes, list(lookup)
+
+
+def test_history(records, stats):
+    """
+    One student's test records oldest first, each with its percentage and the class
+    percentile from `stats`. Queued marks have no percentile yet and unreadable marks
+    no percentage; both stay in the history.
+    """
+    computed = {(t['name'], t['date']): t for t in stats['tests']}
+    history = []
+    for record in records:
+        name, date = str(record.get('testname', '')).strip(), str(record.get('date', '')).strip()
+        marks, total = record.get('marks', ''), record.get('total', '')
+        # Same rule as the statistics: numeric marks over a positive total
+        value, out_of = _to_float([marks, total])
+        usable = out_of > 0 and not np.isnan(value)
+        history.append({
+            'name': name, 'date': date, 'marks': marks, 'total': total,
+            'percentage': round(float(value / out_of * 100.0), 1) if usable else None,
+            'percentile': computed.get((name, date), {}).get('percentile')
+        })
+    days = day_numbers([t['date'] for t in history])
+    # Stable, so same-day tests keep their sheet order
+    return [history[i] for i in sorted(range(len(history)), key=lambda i: days[i])]
+
+
+class StudentAnalytics:
+    def __init__(self, snapshot):
+        """Compute every student's statistics from one snapshot"""
+        self.snapshot = snapshot
+        self.students = {}
+        classes = {}
+        for student in snapshot.students.records():
+            classes[normalize_id(student.get('id'))] = str(student.get('student_class', '')).strip()
+        self._compute_tests(snapshot.tests, classes)
+        self._compute_attendance(snapshot.attendance)
+        self._add_archived_attendance(snapshot)
+
+    @staticmethod
+    def empty():
+        return {
+            'tests': [], 'average': None, 'latest_average': None, 'trend': 0.0, 'best': None,
+            'attendance': {'present': 0, 'total': 0, 'percentage': 0.0,
+                           'current_streak': 0, 'longest_streak': 0, 'absent_streak': 0}
+        }
+
+    def _entry(self, student_id):
+        if student_id not in self.students:
+            self.students[student_id] = self.empty()
+        return self.students[student_id]
+
+    def _compute_tests(self, table, classes):
+        columns = [table.index(c) for c in ('studentid', 'testname', 'date', 'marks', 'total')]
+        if -1 in columns[:2] or columns[3] == -1 or not table.rows:
+            return
+        sid_idx, name_idx, date_idx, marks_idx, total_idx = columns
+        rows = table.rows
+        student_ids = [normalize_id(r[sid_idx]) for r in rows]
+        names = [str(r[name_idx]).strip() for r in rows]
+        marks = _to_float([r[marks_idx] for r in rows])
+        totals = _to_float([r[total_idx] for r in rows]) if total_idx != -1 else np.full(len(rows), np.nan)
+        days = day_numbers([r[date_idx] for r in rows]) if date_idx != -1 else np.zeros(len(rows), dtype=np.int64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percentages = np.where(totals > 0, marks / totals * 100.0, np.nan)
+
+        # Only rows with a usable percentage take part in the statistics
+        valid = ~np.isnan(percentages)
+        students, student_keys = factorize(student_ids)
+        tests, _ = factorize([(class_key(classes.get(s, ''), n), n) for s, n in zip(student_ids, names)])
+
+        ranks = np.full(len(rows), np.nan)
+        if valid.any():
+            ranks[valid] = _percentile_ranks(tests[valid], percentages[valid])
+
+        # Chronological order per student (sheet order breaks date ties)
+        order = np.lexsort((np.arange(len(rows)), days, students))
+        order = order[valid[order]]
+        groups = students[order]
+        starts = _group_starts(groups)
+        sequence = np.arange(len(order)) - starts
+        moving = _moving_average(percentages[order], starts, MOVING_WINDOW) if len(order) else np.zeros(0)
+        count = len(student_keys)
+        slopes = _slopes(groups, sequence.astype(float), percentages[order], count)
+        sums = np.bincount(groups, percentages[order], count)
+        sizes = np.bincount(groups, minlength=count)
+        best = np.full(count, -np.inf)
+        np.maximum.at(best, groups, percentages[order])
+
+        for k, position in enumerate(order):
+            row = rows[position]
+            entry = self._entry(student_keys[groups[k]])
+            entry['tests'].append({
+                'name': names[position],
+                'date': str(row[date_idx]).strip() if date_idx != -1 else '',
+                'marks': row[marks_idx],
+                'total': row[total_idx] if total_idx != -1 else '',
+                'percentage': round(float(percentages[position]), 1),
+                'moving_average': round(float(moving[k]), 1),
+                'percentile': round(float(ranks[position]), 1)
+            })
+        for code in np.flatnonzero(sizes):
+            entry = self._entry(student_keys[code])
+            entry['average'] = round(float(sums[code] / sizes[code]), 1)
+            entry['latest_average'] = entry['tests'][-1]['moving_average']
+            entry['trend'] = round(float(slopes[code]), 2)
+            entry['best'] = round(float(best[code]), 1)
+
+    def _compute_attendance(self, table):
+        sid_idx, date_idx, status_idx = (table.index(c) for c in ('studentid', 'date', 'status'))
+        if -1 in (sid_idx, status_idx) or not table.rows:
+            return
+        rows = table.rows
+        if date_idx != -1:
+            # A resubmitted day replaces the earlier mark, as in compaction: keep the last row per (student, date)
+            pairs, _ = factorize([(normalize_id(r[sid_idx]), str(r[date_idx]).strip()) for r in rows])
+            _, last_from_end = np.unique(pairs[::-1], return_index=True)
+            rows = [rows[i] for i in np.sort(len(pairs) - 1 - last_from_end)]
+        students, student_keys = factorize([normalize_id(r[sid_idx]) for r in rows])
+        present = np.array([str(r[status_idx]).strip().lower() == 'present' for r in rows])
+        days = day_numbers([r[date_idx] for r in rows]) if date_idx != -1 else np.zeros(len(rows), dtype=np.int64)
+
+        order = np.lexsort((np.arange(len(rows)), days, students))
+        groups, status = students[order], present[order]
+        count = len(student_keys)
+        totals = np.bincount(groups, minlength=count)
+        presents = np.bincount(groups, status.astype(float), count)
+
+        run_group, run_status, run_lengths = status_runs(groups, status)
+        longest = np.zeros(count, dtype=np.int64)
+        np.maximum.at(longest, run_group[run_status], run_lengths[run_status])
+        # The last run of each student is their current streak
+        last = np.zeros(count, dtype=np.int64)
+        np.maximum.at(last, run_group, np.arange(len(run_group)))
+
+        for code in np.flatnonzero(totals):
+            run = last[code]
+            self._entry(student_keys[code])['attendance'] = {
+                'present': int(presents[code]),
+                'total': int(totals[code]),
+                'percentage': round(float(presents[code] / totals[code] * 100.0), 1),
+                'current_streak': int(run_lengths[run]) if run_status[run] else 0,
+                'longest_streak': int(longest[code]),
+                'absent_streak': 0 if run_status[run] else int(run_lengths[run])
+            }
+
+    def _add_archived_attendance(self, snapshot):
+        """Fold compacted months into the totals; streaks only cover the live rows"""
+        for student_id in snapshot.summary_by_student:
+            present, total = snapshot.student_attendance_summary(student_id)
+            if not total:
+                continue
+            attendance = self._entry(student_id)['attendance']
+            attendance['present'] += present
+            attendance['total'] += total
+            attendance['percentage'] = round(attendance['present'] / attendance['total'] * 100.0, 1)
+
+    def for_student(self, student_id):
+        """Precomputed statistics for one student (empty defaults if they have no rows)"""
+        return self.students.get(normalize_id(student_id)) or self.empty()
@@ -0,0 +1,132 @@
+"""
+Attendance Compaction - Move closed months out of the hot Attendance sheet
+Rows older than the cutoff are counted into AttendanceSummary (present/total per
+student per month), copied verbatim to AttendanceArchive and deleted from
+Attendance, all in one batchUpdate. Run it from a shell or a scheduler:
+
+    python attendance_compaction.py [--before YYYY-MM] [--dry-run]
+"""
+import argparse
+import os
+from datetime import date, datetime
+
+from sheets_snapshot import date_month, normalize_id
+from sheets_batch import update_cell_request, delete_rows_requests, append_rows_request
+from shared_cache import get_shared_cache
+from google_sheets_direct import ATTENDANCE_LOCK, create_sheets_service
+
+# Months (including the current one) that stay in the hot sheet by default
+KEEP_MONTHS = int(os.getenv('ATTENDANCE_KEEP_MONTHS', '3'))
+# Seconds the Attendance lock is held for at most; queued upserts wait behind it
+COMPACTION_LEASE = 300
+
+
+def default_cutoff(today=None, keep_months=KEEP_MONTHS):
+    """First month kept live ('YYYY-MM'), counting the current month as one"""
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1 - (max(1, keep_months) - 1)
+    return f"{months // 12:04d}-{months % 12 + 1:02d}"
+
+
+def plan_compaction(snapshot, before):
+    """
+    Work out what compacting every month earlier than `before` changes, without
+    touching the spreadsheet. Rows with unreadable dates are left in place and a
+    resubmitted (StudentID, Date) pair only counts its last row.
+    """
+    table = snapshot.attendance
+    sid_idx, date_idx, status_idx = (table.index(c) for c in ('studentid', 'date', 'status'))
+    plan = {'before': before, 'positions': [], 'archive': [], 'updates': [], 'appends': []}
+    if -1 in (sid_idx, date_idx, status_idx):
+        return plan
+
+    latest = {}
+    for position, row in enumerate(table.rows):
+        month = date_month(row[date_idx])
+        if month is None or month >= before:
+            continue
+        plan['positions'].append(position)
+        plan['archive'].append([row[sid_idx], row[date_idx], row[status_idx]])
+        latest[(normalize_id(row[sid_idx]), str(row[date_idx]).strip())] = (row[sid_idx], month, row[status_idx])
+
+    counts = {}
+    for student_id, month, status in latest.values():
+        entry = counts.setdefault((normalize_id(student_id), month), [student_id, 0, 0])
+        entry[1] += str(status).strip().lower() == 'present'
+        entry[2] += 1
+
+    # Months compacted before (late rows for a closed month) are added to the existing row
+    summary = snapshot.attendance_summary
+    columns = [summary.index(c) for c in ('studentid', 'month', 'present', 'total')]
+    if -1 not in columns:
+        s_idx, m_idx, p_idx, t_idx = columns
+        for position, row in enumerate(summary.rows):
+            key = (normalize_id(row[s_idx]), str(row[m_idx]).strip())
+            if key not in counts:
+                continue
+            try:
+                present, total = int(row[p_idx]), int(row[t_idx])
+            except (ValueError, IndexError):
+                continue
+            _, add_present, add_total = counts.pop(key)
+            plan['updates'].append((summary.row_number(position), p_idx, present + add_present))
+            plan['updates'].append((summary.row_number(position), t_idx, total + add_total))
+    plan['appends'] = [[str(student_id), month, str(present), str(total)]
+                       for (_, month), (student_id, present, total) in sorted(counts.items())]
+    return plan
+
+
+def compaction_requests(service, snapshot, plan):
+    """batchUpdate requests for a plan: summary and archive writes first, then the deletes"""
+    summary_id = service.attendance_summary_sheet.id
+    requests = [update_cell_request(summary_id, r, c, v) for r, c, v in plan['updates']]
+    if plan['appends']:
+        requests.append(append_rows_request(summary_id, plan['appends']))
+    if plan['archive']:
+        requests.append(append_rows_request(service.attendance_archive_sheet.id, plan['archive']))
+    requests += delete_rows_requests(service.attendance_sheet.id,
+                                     [snapshot.attendance.row_number(p) for p in plan['positions']])
+    return requests
+
+
+def compact_attendance(service, before=None, dry_run=False):
+    """Compact every month earlier than `before` under the Attendance lock; returns the plan"""
+    before = before or default_cutoff()
+    shared = get_shared_cache()
+    # Upserts address Attendance rows by number, so none may run while rows are deleted
+    if not shared.acquire_lease(ATTENDANCE_LOCK, COMPACTION_LEASE):
+        print("[WARNING] Attendance sheet is busy, compaction skipped")
+        return None
+    try:
+        snapshot = service._get_snapshot(force=True)
+        plan = plan_compaction(snapshot, before)
+        print(f"[INFO] Compacting attendance before {before}: {len(plan['positions'])} rows, "
+              f"{len(plan['updates']) // 2} summary rows updated, {len(plan['appends'])} added")
+        if dry_run or not plan['positions']:
+            return plan
+        service._batch_update(compaction_requests(service, snapshot, plan))
+        service._invalidate_snapshot()
+        print("[INFO] Attendance compaction complete")
+        return plan
+    finally:
+        shared.release_lease(ATTENDANCE_LOCK)
+
+
+def _month_arg(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').strftime('%Y-%m')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM, got {value!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--before', type=_month_arg, help="first month to keep live, YYYY-MM "
+                                         f"(default: the last {KEEP_MONTHS} months)")
+    parser.add_argument('--dry-run', action='store_true', help="report what would move without writing")
+    args = parser.parse_args()
+    compact_attendance(create_sheets_service(start_background=False), args.before, args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Attendance Report - Class-level attendance over the full Attendance log
+Builds a date x class matrix with rolling rates, monthly trends and per-student
+absence streaks in vectorized passes, once per snapshot
+"""
+from datetime import date
+
+import numpy as np
+
+from analytics import day_numbers, factorize, status_runs
+from sheets_snapshot import normalize_id
+
+# Attendance dates (sessions in the log) covered by the rolling rate
+ROLLING_WINDOW = 7
+# A student is flagged below this attendance rate or after this many absences in a row
+CHRONIC_RATE = 75.0
+CHRONIC_STREAK = 3
+
+
+def _rate(present, total):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, present / total * 100.0, np.nan)
+
+
+def _cell(rate):
+    return None if np.isnan(rate) else round(float(rate), 1)
+
+
+class AttendanceReport:
+    def __init__(self, snapshot):
+        """Aggregate the attendance log of one snapshot"""
+        self.snapshot = snapshot
+        self.classes = []
+        self.dates = []
+        self.daily = []
+        self.monthly = []
+        self.students = []
+        self.summary = {'sessions': 0, 'records': 0, 'rate': None}
+        # month -> class -> [present, total], shared by the live rows and the compacted months
+        self._month_counts = {}
+
+        names, class_of = {}, {}
+        for student in snapshot.students.records():
+            s_id = normalize_id(student.get('id'))
+            names[s_id] = student.get('name', student.get('id'))
+            class_of[s_id] = str(student.get('student_class', '')).strip() or 'Unknown'
+
+        self._compute_live(snapshot.attendance, names, class_of)
+        self._merge_archived(snapshot, names, class_of)
+
+    def _compute_live(self, table, names, class_of):
+        sid_idx, date_idx, status_idx = (table.index(c) for c in ('studentid', 'date', 'status'))
+        if -1 in (sid_idx, date_idx, status_idx) or not table.rows:
+            return
+
+        rows = table.rows
+        days = day_numbers([r[date_idx] for r in rows])
+        dated = np.flatnonzero(days > 0)
+        if not len(dated):
+            return
+        student_ids = [normalize_id(rows[i][sid_idx]) for i in dated]
+        students, student_keys = factorize(student_ids)
+        present = np.array([str(rows[i][status_idx]).strip().lower() == 'present' for i in dated])
+        days = days[dated]
+
+        # A resubmitted day replaces the earlier mark: keep the last row per (student, date)
+        day_values, day_codes = np.unique(days, return_inverse=True)
+        pair = students * len(day_values) + day_codes
+        _, last_from_end = np.unique(pair[::-1], return_index=True)
+        keep = np.sort(len(pair) - 1 - last_from_end)
+        students, day_codes, present = students[keep], day_codes[keep], present[keep]
+
+        class_codes, self.classes = factorize([class_of.get(s, 'Unknown') for s in student_keys])
+        order = np.argsort(self.classes, kind='stable')
+        self.classes = [self.classes[i] for i in order]
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        row_class = rank[class_codes][students]
+
+        n_days, n_classes = len(day_values), len(self.classes)
+        flat = day_codes * n_classes + row_class
+        totals = np.bincount(flat, minlength=n_days * n_classes).reshape(n_days, n_classes)
+        presents = np.bincount(flat, present.astype(float), n_days * n_classes).reshape(n_days, n_classes)
+
+        # Rolling rate per class over the last ROLLING_WINDOW dates in the log
+        cum_total = np.vstack([np.zeros((1, n_classes)), np.cumsum(totals, axis=0)])
+        cum_present = np.vstack([np.zeros((1, n_classes)), np.cumsum(presents, axis=0)])
+        start = np.maximum(np.arange(n_days) - ROLLING_WINDOW + 1, 0)
+        rolling = _rate(cum_present[1:] - cum_present[start], cum_total[1:] - cum_total[start])
+        daily = _rate(presents, totals)
+
+        self.dates = [date.fromordinal(int(d)).isoformat() for d in day_values]
+        day_rate = _rate(presents.sum(axis=1), totals.sum(axis=1))
+        self.daily = [{
+            'date': self.dates[i],
+            'rate': _cell(day_rate[i]),
+            'cells': [{'rate': _cell(daily[i, c]), 'rolling': _cell(rolling[i, c]),
+                       'present': int(presents[i, c]), 'total': int(totals[i, c])} for c in range(n_classes)]
+        } for i in range(n_days)]
+
+        # Month x class trend from the same matrix
+        months, month_codes = np.unique([d[:7] for d in self.dates], return_inverse=True)
+        month_totals = np.zeros((len(months), n_classes))
+        month_presents = np.zeros((len(months), n_classes))
+        np.add.at(month_totals, month_codes, totals)
+        np.add.at(month_presents, month_codes, presents)
+        for i, month in enumerate(months):
+            self._month_counts[str(month)] = {
+                cls: [float(month_presents[i, c]), float(month_totals[i, c])] for c, cls in enumerate(self.classes)
+            }
+
+        self._student_streaks(students, day_codes, present, student_keys, names, class_of)
+        self.summary = {
+            'sessions': n_days,
+            'records': int(totals.sum()),
+            'rate': _cell(_rate(presents.sum(), totals.sum()))
+        }
+
+    def _student_streaks(self, students, day_codes, present, student_keys, names, class_of):
+        order = np.lexsort((day_codes, students))
+        groups, status = students[order], present[order]
+        count = len(student_keys)
+        totals = np.bincount(groups, minlength=count)
+        presents = np.bincount(groups, status.astype(float), count)
+        run_group, run_status, run_lengths = status_runs(groups, status)
+        absent = ~run_status
+        longest_absence = np.zeros(count, dtype=np.int64)
+        np.maximum.at(longest_absence, run_group[absent], run_lengths[absent])
+        last = np.zeros(count, dtype=np.int64)
+        np.maximum.at(last, run_group, np.arange(len(run_group)))
+        current_absence = np.where(run_status[last], 0, run_lengths[last])
+        rates = _rate(presents, totals)
+
+        report = []
+        for code in np.flatnonzero(totals):
+            key = student_keys[code]
+            report.append({
+                'id': key,
+                'name': names.get(key, key),
+                'class': class_of.get(key, 'Unknown'),
+                'rate': _cell(rates[code]),
+                'present': int(presents[code]),
+                'sessions': int(totals[code]),
+                'current_absence_streak': int(current_absence[code]),
+                'longest_absence_streak': int(longest_absence[code]),
+                'chronic': bool(rates[code] < CHRONIC_RATE or current_absence[code] >= CHRONIC_STREAK)
+            })
+        self.students = report
+
+    def _merge_archived(self, snapshot, names, class_of):
+        """Add the compacted months to the monthly trend and the per-student rates"""
+        table = snapshot.attendance_summary
+        columns = [table.index(c) for c in ('studentid', 'month', 'present', 'total')]
+        if -1 not in columns:
+            sid_idx, month_idx, present_idx, total_idx = columns
+            for position in sorted(p for positions in snapshot.summary_by_student.values() for p in positions):
+                row = table.rows[position]
+                try:
+                    present, total = int(row[present_idx]), int(row[total_idx])
+                except (ValueError, IndexError):
+                    continue
+                cls = class_of.get(normalize_id(row[sid_idx]), 'Unknown')
+                counts = self._month_counts.setdefault(str(row[month_idx]).strip(), {}).setdefault(cls, [0.0, 0.0])
+                counts[0] += present
+                counts[1] += total
+
+        # Classes seen only in compacted months get an empty column in the daily matrix
+        extra = sorted({cls for month in self._month_counts.values() for cls in month} - set(self.classes))
+        if extra:
+            live = self.classes
+            self.classes = sorted(live + extra)
+            empty = {'rate': None, 'rolling': None, 'present': 0, 'total': 0}
+            for day in self.daily:
+                cells = dict(zip(live, day['cells']))
+                day['cells'] = [cells.get(cls, empty) for cls in self.classes]
+        self.monthly = []
+        for month in sorted(self._month_counts):
+            counts = self._month_counts[month]
+            cells = [counts.get(cls, (0.0, 0.0)) for cls in self.classes]
+            self.monthly.append({'month': month, 'cells': [
+                round(present / total * 100.0, 1) if total else None for present, total in cells
+            ]})
+
+        by_id = {s['id']: s for s in self.students}
+        for student_id in snapshot.summary_by_student:
+            present, total = snapshot.student_attendance_summary(student_id)
+            if not total:
+                continue
+            entry = by_id.get(student_id)
+            if entry is None:
+                entry = by_id[student_id] = {
+                    'id': student_id, 'name': names.get(student_id, student_id),
+                    'class': class_of.get(student_id, 'Unknown'), 'rate': None, 'present': 0,
+                    'sessions': 0, 'current_absence_streak': 0, 'longest_absence_streak': 0
+                }
+            entry['present'] += present
+            entry['sessions'] += total
+            entry['rate'] = round(entry['present'] / entry['sessions'] * 100.0, 1)
+            entry['chronic'] = entry['rate'] < CHRONIC_RATE or entry['current_absence_streak'] >= CHRONIC_STREAK
+        report = list(by_id.values())
+        report.sort(key=lambda s: (-s['current_absence_streak'], s['rate'], str(s['name'])))
+        self.students = report
+
+    def chronic_absentees(self):
+        return [s for s in self.students if s['chronic']]
+
+    def recent(self, sessions):
+        """The latest `sessions` rows of the daily matrix, newest first"""
+        return self.daily[-sessions:][::-1] if sessions > 0 else []
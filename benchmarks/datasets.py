@@ -0,0 +1,76 @@
+"""
+Benchmark Datasets - Synthetic spreadsheets shaped like the institute's real one
+Students across classes 8-10 with logins, test marks and attendance for a number of
+academic years, laid out in base tabs or in per-year partitions
+"""
+import random
+from datetime import date, timedelta
+
+from google_sheets_direct import WORKSHEET_HEADERS
+from partitions import YEAR_START_MONTH, academic_year, partition_title
+
+CLASSES = ['Class 8', 'Class 9', 'Class 10']
+FIRST_NAMES = ['Aarav', 'Diya', 'Ishaan', 'Meera', 'Kabir', 'Ananya', 'Rohan', 'Saanvi', 'Vihaan', 'Nisha']
+LAST_NAMES = ['Sharma', 'Iyer', 'Reddy', 'Patel', 'Nair', 'Gupta', 'Rao', 'Menon', 'Das', 'Singh']
+SUBJECTS = ['Maths', 'Science', 'English', 'Social', 'Hindi']
+# Share of a session's attendance marks that are absences
+ABSENCE_RATE = 0.08
+
+
+def student_id(n):
+    return f"S{n:05d}"
+
+
+def student_password(n):
+    return f"pw{n:05d}"
+
+
+def session_dates(year, sessions, today=None):
+    """`sessions` evenly spaced class days of one academic year, none after today"""
+    today = today or date.today()
+    start = date(year, YEAR_START_MONTH, 1)
+    step = max(1, 365 // max(1, sessions))
+    days = [start + timedelta(days=i * step) for i in range(sessions)]
+    return [d for d in days if d <= today]
+
+
+def build_tables(students=1000, years=2, sessions_per_year=40, tests_per_year=10,
+                 partitioned=False, seed=0, today=None):
+    """{worksheet title: rows including the header} for every tab the service expects"""
+    rng = random.Random(seed)
+    tables = {title: [list(headers)] for title, headers in WORKSHEET_HEADERS.items()}
+    years_covered = [academic_year(today) - offset for offset in range(years)]
+
+    ids = []
+    for n in range(1, students + 1):
+        sid = student_id(n)
+        ids.append(sid)
+        name = f"{FIRST_NAMES[n % len(FIRST_NAMES)]} {LAST_NAMES[(n // len(FIRST_NAMES)) % len(LAST_NAMES)]}"
+        tables['Students'].append([sid, name, student_password(n), f"{sid.lower()}@example.com",
+                                   f"9{n:09d}", CLASSES[n % len(CLASSES)], '2024-04-01'])
+        tables['StudentAuth'].append([sid, student_password(n), sid])
+
+    for year in years_covered:
+        tests = tables.setdefault(partition_title('Tests', year), [list(WORKSHEET_HEADERS['Tests'])]) \
+            if partitioned else tables['Tests']
+        attendance = tables.setdefault(partition_title('Attendance', year), [list(WORKSHEET_HEADERS['Attendance'])]) \
+            if partitioned else tables['Attendance']
+
+        test_days = session_dates(year, tests_per_year, today)
+        for i, day in enumerate(test_days):
+            test_name = f"{SUBJECTS[i % len(SUBJECTS)]} Unit {i // len(SUBJECTS) + 1}"
+            for sid in ids:
+                tests.append([sid, test_name, day.isoformat(), str(rng.randint(20, 100)), '100'])
+
+        for day in session_dates(year, sessions_per_year, today):
+            stamp = day.isoformat()
+            for sid in ids:
+                attendance.append([sid, stamp, 'Absent' if rng.random() < ABSENCE_RATE else 'Present'])
+
+    tables['Updates'].append(['Benchmark notice', 'Synthetic announcement', '', 'notice',
+                              (today or date.today()).isoformat(), '', 'normal'])
+    return tables
+
+
+def row_count(tables):
+    return sum(len(rows) - 1 for rows in tables.values())
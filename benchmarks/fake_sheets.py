@@ -0,0 +1,232 @@
+"""
+Fake Sheets - In-process stand-in for the gspread surface the site uses
+Spreadsheet and Worksheet calls answer from in-memory rows after a configurable
+delay, fail with 429s at a configurable rate and are counted per method
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+CELL_RE = re.compile(r'([A-Z]+)(\d+)')
+
+
+class FakeAPIError(Exception):
+    """Shaped like gspread's APIError: the status is on `.response.status_code`"""
+
+    class _Response:
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.response = self._Response(status_code)
+
+
+def _column(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number
+
+
+def _split_range(name):
+    """("Title", "A1:C1" or "") from "'Title'!A1:C1" or "'Title'" """
+    title, _, cells = name.partition('!')
+    return title.strip("'"), cells
+
+
+class Backend:
+    """Latency, quota errors and per-method call counts shared by one fake spreadsheet"""
+
+    def __init__(self, latency=0.1, jitter=0.3, quota_error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_error_rate = quota_error_rate
+        self.calls = Counter()
+        self.errors = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def api(self, method):
+        with self._lock:
+            self.calls[method] += 1
+            fail = self._random.random() < self.quota_error_rate
+            delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            with self._lock:
+                self.errors[method] += 1
+            raise FakeAPIError(429, "Quota exceeded for quota metric 'Read requests'")
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, sheet_id, title, rows=None):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+        self.rows = [list(r) for r in rows or []]
+
+    def _api(self, method):
+        self.spreadsheet.backend.api(f'worksheet.{method}')
+
+    def _set(self, row, col, value):
+        """Write one cell (0-based), growing the grid like Sheets does"""
+        while len(self.rows) <= row:
+            self.rows.append([])
+        cells = self.rows[row]
+        if len(cells) <= col:
+            cells.extend([''] * (col + 1 - len(cells)))
+        cells[col] = '' if value is None else str(value)
+
+    def _write_block(self, start_row, start_col, values):
+        for r, row in enumerate(values):
+            for c, value in enumerate(row):
+                self._set(start_row + r, start_col + c, value)
+
+    def get_all_values(self):
+        self._api('get_all_values')
+        return [list(r) for r in self.rows]
+
+    def row_values(self, row):
+        self._api('row_values')
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        self._api('col_values')
+        return [r[col - 1] if col <= len(r) else '' for r in self.rows]
+
+    def append_row(self, values, **kwargs):
+        self._api('append_row')
+        self.rows.append([str(v) for v in values])
+        n = len(self.rows)
+        return {'updates': {'updatedRange': f"'{self.title}'!A{n}:{chr(64 + max(1, len(values)))}{n}"}}
+
+    def append_rows(self, values, **kwargs):
+        self._api('append_rows')
+        self.rows.extend([str(v) for v in row] for row in values)
+        return {'updates': {'updatedRows': len(values)}}
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self._api('update')
+        match = CELL_RE.match(range_name or 'A1')
+        self._write_block(int(match.group(2)) - 1, _column(match.group(1)) - 1, values or [])
+        return {}
+
+    def delete_rows(self, start_index, end_index=None):
+        self._api('delete_rows')
+        del self.rows[start_index - 1:(end_index or start_index)]
+        return {}
+
+
+class FakeSpreadsheet:
+    def __init__(self, tables=None, backend=None, title='Benchmark'):
+        self.backend = backend or Backend()
+        self.title = title
+        self._sheets = {}
+        self._next_id = 1
+        for name, rows in (tables or {}).items():
+            self._add(name, rows)
+
+    def _add(self, title, rows=None):
+        sheet = FakeWorksheet(self, self._next_id, title, rows)
+        self._sheets[title] = sheet
+        self._next_id += 1
+        return sheet
+
+    def _by_id(self, sheet_id):
+        return next(ws for ws in self._sheets.values() if ws.id == sheet_id)
+
+    def worksheets(self):
+        self.backend.api('spreadsheet.worksheets')
+        return list(self._sheets.values())
+
+    def worksheet(self, title):
+        self.backend.api('spreadsheet.worksheet')
+        return self._sheets[title]
+
+    def values_batch_get(self, ranges, **kwargs):
+        self.backend.api('spreadsheet.values_batch_get')
+        value_ranges = []
+        for name in ranges:
+            title, cells = _split_range(name)
+            sheet = self._sheets.get(title)
+            if sheet is None:
+                raise FakeAPIError(400, f"Unable to parse range: {name}")
+            rows = sheet.rows
+            if cells:
+                # Only whole-row ranges like 1:1 are requested
+                first, _, last = cells.partition(':')
+                rows = rows[int(first) - 1:int(last or first)]
+            value_range = {'range': name}
+            if any(any(r) for r in rows):
+                value_range['values'] = [list(r) for r in rows]
+            value_ranges.append(value_range)
+        return {'valueRanges': value_ranges}
+
+    def values_batch_update(self, body, **kwargs):
+        self.backend.api('spreadsheet.values_batch_update')
+        for data in body.get('data', []):
+            title, cells = _split_range(data['range'])
+            match = CELL_RE.match(cells or 'A1')
+            self._sheets[title]._write_block(int(match.group(2)) - 1, _column(match.group(1)) - 1, data['values'])
+        return {}
+
+    def batch_update(self, body):
+        """addSheet, updateCells, deleteDimension and appendCells, applied in order"""
+        self.backend.api('spreadsheet.batch_update')
+        replies = []
+        for request in body.get('requests', []):
+            if 'addSheet' in request:
+                title = request['addSheet']['properties']['title']
+                if title in self._sheets:
+                    raise FakeAPIError(400, f'A sheet with the name "{title}" already exists')
+                sheet = self._add(title)
+                replies.append({'addSheet': {'properties': {'sheetId': sheet.id, 'title': title}}})
+                continue
+            if 'updateCells' in request:
+                spec = request['updateCells']
+                grid = spec['range']
+                sheet = self._by_id(grid['sheetId'])
+                values = [[cell['userEnteredValue'].get('stringValue', '') for cell in row['values']]
+                          for row in spec['rows']]
+                sheet._write_block(grid['startRowIndex'], grid['startColumnIndex'], values)
+            elif 'deleteDimension' in request:
+                grid = request['deleteDimension']['range']
+                sheet = self._by_id(grid['sheetId'])
+                del sheet.rows[grid['startIndex']:grid['endIndex']]
+            elif 'appendCells' in request:
+                spec = request['appendCells']
+                sheet = self._by_id(spec['sheetId'])
+                sheet.rows.extend([cell['userEnteredValue'].get('stringValue', '') for cell in row['values']]
+                                  for row in spec['rows'])
+            replies.append({})
+        return {'replies': replies}
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        # Not `.spreadsheet`: the rate limiter labels objects carrying one as worksheets
+        self._spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        self._spreadsheet.backend.api('client.open_by_key')
+        return self._spreadsheet
+
+
+class FakeGspread:
+    """Replaces the `gspread` module in google_sheets_direct: authorize() returns the fake client"""
+
+    def __init__(self, spreadsheet):
+        self.client = FakeClient(spreadsheet)
+
+    def authorize(self, credentials):
+        return self.client
+
+
+class FakeCredentials:
+    @staticmethod
+    def from_service_account_info(info, scopes=None):
+        return object()
@@ -0,0 +1,274 @@
+"""
+Route Benchmarks - Drive the site's routes against a simulated Google Sheets backend
+Each dataset size runs in its own process with a fresh cache directory: the app is
+imported with gspread replaced by the in-process fake (benchmarks/fake_sheets.py), then
+/leaderboard, /student/login, /student/dashboard and the teacher POST routes are called
+through the Flask test client. Reports latency percentiles and Sheets API calls per scenario.
+
+    python benchmarks/run.py                                   # 100 and 1,000 students
+    python benchmarks/run.py --students 10000 --years 3        # large institute (~1.2M rows)
+    python benchmarks/run.py --latency 0.3 --quota-error-rate 0.05 --json results.json
+
+Needs the app's own dependencies installed (Flask, gspread, numpy, ...).
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# Teacher credentials the teacher routes check against
+TEACHER_LOGIN = {'username': 'admin', 'password': 'aswathama2024'}
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(name, durations, calls, errors, failures):
+    result = {
+        'scenario': name,
+        'requests': len(durations),
+        'failures': failures,
+        'mean_ms': 1000.0 * sum(durations) / len(durations) if durations else 0.0,
+        'max_ms': 1000.0 * max(durations) if durations else 0.0,
+        'api_calls': sum(calls.values()),
+        'api_calls_by_method': dict(sorted(calls.items())),
+        'quota_errors': sum(errors.values()),
+    }
+    for pct in PERCENTILES:
+        result[f'p{pct}_ms'] = 1000.0 * percentile(durations, pct)
+    return result
+
+
+# ==================== WORKER (one dataset size per process) ====================
+
+def configure_environment(args, cache_dir):
+    """Settings the app reads at import time; must run before it is imported"""
+    os.environ['SHARED_CACHE_DIR'] = cache_dir
+    os.environ['GOOGLE_SHEETS_CREDS'] = '{}'
+    os.environ['GOOGLE_SHEETS_ID'] = 'benchmark'
+    os.environ['METRICS_FLUSH_INTERVAL'] = '3600'
+    if args.quota_per_minute:
+        os.environ['SHEETS_QUOTA_PER_MINUTE'] = str(args.quota_per_minute)
+    if args.freshness:
+        # Keeps the background refresher out of the per-scenario call counts
+        for key in ('SHEETS_FRESHNESS_STUDENTS', 'SHEETS_FRESHNESS_LEADERBOARD', 'SHEETS_FRESHNESS_UPDATES'):
+            os.environ[key] = str(args.freshness)
+        os.environ['SHEETS_MAX_STALENESS'] = str(max(args.freshness * 2, 300))
+    if args.partitioned:
+        os.environ['PARTITION_BY_YEAR'] = '1'
+    if args.backend == 'sqlite':
+        os.environ['SHEETS_BACKEND'] = 'sqlite'
+    sys.path.insert(0, REPO_DIR)
+    sys.path.insert(0, BENCH_DIR)
+
+
+def run_worker(args):
+    cache_dir = tempfile.mkdtemp(prefix='bench-cache-')
+    configure_environment(args, cache_dir)
+
+    import datasets
+    import google_sheets_direct
+    import write_queue
+    from fake_sheets import Backend, FakeSpreadsheet, FakeGspread, FakeCredentials
+
+    # drain() is the only flusher, so each flush lands in its own scenario's counts
+    write_queue.WriteBehindQueue.start = lambda self: None
+
+    start = time.perf_counter()
+    tables = datasets.build_tables(args.students, args.years, args.sessions, args.tests,
+                                   partitioned=args.partitioned, seed=args.seed)
+    print(f"[INFO] Built {datasets.row_count(tables)} rows for {args.students} students "
+          f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    backend = Backend(latency=args.latency, jitter=args.jitter,
+                      quota_error_rate=args.quota_error_rate, seed=args.seed)
+    spreadsheet = FakeSpreadsheet(tables, backend)
+    del tables
+
+    # The service authenticates lazily on its first call; hand it the fake client instead
+    google_sheets_direct.gspread = FakeGspread(spreadsheet)
+    google_sheets_direct.Credentials = FakeCredentials
+
+    import main
+    app = main.app
+    app.config['TESTING'] = True
+    service = main.get_sheets_service()
+    rng = random.Random(args.seed)
+    results = []
+
+    def scenario(name, requests, client_call, expect=(200, 302)):
+        calls_before, errors_before = backend.calls.copy(), backend.errors.copy()
+        durations, failures = [], 0
+        for i in range(requests):
+            t0 = time.perf_counter()
+            status = client_call(i)
+            durations.append(time.perf_counter() - t0)
+            if status not in expect:
+                failures += 1
+        results.append(summarize(name, durations, backend.calls - calls_before,
+                                 backend.errors - errors_before, failures))
+
+    def drain(name):
+        """Push the write-behind journal to the fake sheets and record it as its own scenario"""
+        scenario(name, 1, lambda i: service.write_queue.flush_pending() or 200)
+
+    def random_student():
+        n = rng.randint(1, args.students)
+        return datasets.student_id(n), datasets.student_password(n)
+
+    client = app.test_client()
+    scenario('cold_start', 1, lambda i: client.get('/leaderboard').status_code)
+    if not backend.calls:
+        raise SystemExit("[ERROR] The app never reached the fake spreadsheet; rerun with --verbose")
+    scenario('leaderboard', args.requests, lambda i: client.get('/leaderboard').status_code)
+
+    def login(i):
+        sid, password = random_student()
+        response = client.post('/student/login', data={'student_id': sid, 'password': password})
+        # A successful login redirects to the dashboard; a failed one re-renders the form
+        return response.status_code if response.status_code == 302 else 401
+    scenario('student_login', args.requests, login)
+
+    def dashboard(i):
+        sid, _ = random_student()
+        with client.session_transaction() as session:
+            session['student_id'] = sid
+        return client.get('/student/dashboard').status_code
+    scenario('student_dashboard', args.requests, dashboard)
+
+    teacher = app.test_client()
+    teacher.post('/teacher/login', data=TEACHER_LOGIN)
+    everyone = [datasets.student_id(n) for n in range(1, args.students + 1)]
+
+    def attendance(i):
+        day = (date.today() - timedelta(days=i)).isoformat()
+        absent = rng.sample(everyone, max(1, len(everyone) // 12))
+        return teacher.post('/teacher/attendance', data={'date': day, 'absent_students': absent}).status_code
+    scenario('teacher_attendance', args.writes, attendance)
+    drain('attendance_flush')
+
+    def add_test(i):
+        form = {'test_name': f'Benchmark Test {i + 1}', 'test_date': date.today().isoformat(), 'total_marks': '100'}
+        form.update({f'marks_{sid}': str(rng.randint(20, 100)) for sid in everyone})
+        return teacher.post('/teacher/tests', data=form).status_code
+    scenario('teacher_tests', args.writes, add_test)
+    drain('tests_flush')
+
+    scenario('dashboard_after_writes', args.requests, dashboard)
+    scenario('leaderboard_after_writes', args.requests, lambda i: client.get('/leaderboard').status_code)
+
+    report = {'students': args.students, 'years': args.years, 'partitioned': args.partitioned,
+              'backend': args.backend, 'latency': args.latency, 'quota_error_rate': args.quota_error_rate,
+              'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+              'scenarios': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f)
+
+
+# ==================== DRIVER ====================
+
+def print_report(report):
+    layout = 'partitioned' if report['partitioned'] else 'single tabs'
+    print(f"\n{report['students']} students, {report['years']} years ({layout}, {report['backend']} backend, "
+          f"{report['latency'] * 1000:.0f}ms latency, {report['quota_error_rate']:.0%} quota errors, "
+          f"peak RSS {report['peak_rss_mb']:.0f} MB)")
+    header = f"{'scenario':<26}{'n':>6}{'fail':>6}" + ''.join(f"{f'p{p}':>9}" for p in PERCENTILES) \
+        + f"{'max':>9}{'calls':>7}{'calls/req':>10}{'429s':>6}"
+    print(header)
+    print('-' * len(header))
+    for s in report['scenarios']:
+        per_request = s['api_calls'] / s['requests'] if s['requests'] else 0.0
+        print(f"{s['scenario']:<26}{s['requests']:>6}{s['failures']:>6}"
+              + ''.join(f"{s[f'p{p}_ms']:>9.1f}" for p in PERCENTILES)
+              + f"{s['max_ms']:>9.1f}{s['api_calls']:>7}{per_request:>10.2f}{s['quota_errors']:>6}")
+    print("Sheets API calls by method:")
+    for s in report['scenarios']:
+        if s['api_calls_by_method']:
+            methods = ', '.join(f"{m} x{n}" for m, n in s['api_calls_by_method'].items())
+            print(f"  {s['scenario']}: {methods}")
+
+
+def worker_command(args, students, output):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--output', output,
+               '--students', str(students), '--years', str(args.years), '--sessions', str(args.sessions),
+               '--tests', str(args.tests), '--requests', str(args.requests), '--writes', str(args.writes),
+               '--latency', str(args.latency), '--jitter', str(args.jitter),
+               '--quota-error-rate', str(args.quota_error_rate), '--quota-per-minute', str(args.quota_per_minute),
+               '--freshness', str(args.freshness), '--seed', str(args.seed), '--backend', args.backend]
+    if args.partitioned:
+        command.append('--partitioned')
+    return command
+
+
+def run_all(args):
+    reports = []
+    for students in args.students_list:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            output = f.name
+        print(f"[INFO] Benchmarking {students} students...", file=sys.stderr)
+        completed = subprocess.run(worker_command(args, students, output), cwd=REPO_DIR,
+                                   capture_output=not args.verbose, text=True)
+        if completed.returncode != 0:
+            print(f"[ERROR] Benchmark for {students} students failed:", file=sys.stderr)
+            print((completed.stderr or '')[-4000:], file=sys.stderr)
+            continue
+        with open(output) as f:
+            report = json.load(f)
+        os.unlink(output)
+        print_report(report)
+        reports.append(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n[INFO] Results written to {args.json}")
+    return 0 if len(reports) == len(args.students_list) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', dest='students_list', type=int, nargs='+', default=[100, 1000],
+                        help="dataset sizes to run (each in its own process)")
+    parser.add_argument('--years', type=int, default=2, help="academic years of tests and attendance")
+    parser.add_argument('--sessions', type=int, default=40, help="attendance sessions per academic year")
+    parser.add_argument('--tests', type=int, default=10, help="tests per academic year")
+    parser.add_argument('--requests', type=int, default=200, help="requests per read scenario")
+    parser.add_argument('--writes', type=int, default=5, help="submissions per teacher write scenario")
+    parser.add_argument('--latency', type=float, default=0.15, help="simulated Sheets API latency (seconds)")
+    parser.add_argument('--jitter', type=float, default=0.3, help="latency jitter as a fraction of --latency")
+    parser.add_argument('--quota-error-rate', type=float, default=0.0, help="share of API calls answered with 429")
+    parser.add_argument('--quota-per-minute', type=int, default=55, help="SHEETS_QUOTA_PER_MINUTE for the run")
+    parser.add_argument('--freshness', type=int, default=3600,
+                        help="SHEETS_FRESHNESS_* seconds (0 keeps the app defaults)")
+    parser.add_argument('--partitioned', action='store_true', help="lay the data out in per-year tabs")
+    parser.add_argument('--backend', choices=['sheets', 'sqlite'], default='sheets', help="SHEETS_BACKEND to run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write every report to this file")
+    parser.add_argument('--verbose', action='store_true', help="show the app's own log output")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.students = args.students_list[0]
+        run_worker(args)
+        return 0
+    return run_all(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,32 +6,104 @@ import os
 import json
 import gspread
 import time
+import threading
 from datetime import datetime
 from google.oauth2.service_account import Credentials
+from sheets_snapshot import (SheetTable, SheetsSnapshot, date_month, load_snapshot, load_tables, normalize_id,
+                             normalize_credential)
+from shared_cache import get_shared_cache
+from write_queue import WriteBehindQueue
+from sheets_batch import diff_requests, update_cell_request, delete_rows_requests, append_rows_request
+from leaderboard import LeaderboardEngine
+from updates_feed import UpdatesIndex
+from analytics import StudentAnalytics, test_history
+from attendance_report import AttendanceReport
+from partitions import (PARTITIONED_SHEETS, PARTITION_BY_YEAR, current_year, parse_partition,
+                        partition_routes, partition_title, partition_years)
+import rate_limiter
+import metrics
+from rate_limiter import PRIORITY_HIGH, call as api_call, high_priority
+from single_flight import SingleFlight
+from refresher import BackgroundRefresher, FRESHNESS, MAX_STALENESS
+
+# Key of the parsed snapshot in the cross-worker shared cache
+SNAPSHOT_CACHE_KEY = 'sheets_snapshot'
+# Written whenever an announcement is posted
+UPDATES_POSTED_KEY = 'updates_posted'
+# Written whenever a worker changes a sheet; older snapshots in other workers reload
+SHEETS_WRITTEN_KEY = 'sheets_written'
+# Past academic years' Tests/Attendance partitions, shared across workers
+PARTITION_CACHE_KEY = 'sheets_partition:{}'
+# Closed years rarely change, so their partitions are reread at most hourly
+PAST_YEAR_MAX_AGE = 3600
+
+# Worksheets the app needs and the header row each one is created with
+WORKSHEET_HEADERS = {
+    "Students": ["id", "name", "password", "email", "phone", "student_class", "enrollment_date"],
+    "StudentAuth": ["Username", "Password", "StudentID"],
+    "Tests": ["StudentID", "TestName", "Date", "Marks", "Total"],
+    "Attendance": ["StudentID", "Date", "Status"],
+    "Updates": ["title", "description", "link", "type", "start_date", "end_date", "priority"],
+    "AttendanceSummary": ["StudentID", "Month", "Present", "Total"],
+    "AttendanceArchive": ["StudentID", "Date", "Status"],
+}
+# Shared-cache lease held while Attendance row numbers must not shift under a writer
+ATTENDANCE_LOCK = 'attendance_sheet'
+
 
 class GoogleSheetsService:
-    def __init__(self):
-        """Initialize Google Sheets service with service account credentials from environment variable"""
+    def __init__(self, start_background=True):
+        """
+        Read configuration only. Credentials, the API client and the worksheet check
+        are deferred until the first request that actually needs sheet data.
+        One-shot scripts pass start_background=False: no flusher or refresh thread.
+        """
+        # Concurrent cache misses in this worker share one in-flight fetch
+        self._flight = SingleFlight()
+        self._spreadsheet = None
+        self._worksheets = None
+        self._background_lock = threading.Lock()
+        # A script's process exits under its threads, leaving journal rows claimed
+        self._background_started = not start_background
+        self.refresher = None
+        try:
+            if not os.environ.get("GOOGLE_SHEETS_CREDS"):
+                raise ValueError("GOOGLE_SHEETS_CREDS environment variable not set")
+
+            self.sheet_id = os.environ.get('GOOGLE_SHEETS_ID', '').strip()
+            if not self.sheet_id:
+                raise ValueError("GOOGLE_SHEETS_ID environment variable not set")
+
+            # Teacher submissions are journaled locally and flushed in the background;
+            # the flusher only connects once there is something to send
+            self.write_queue = WriteBehindQueue(flush=self._flush_rows)
+            if start_background:
+                self.write_queue.start()
+
+            print("[INFO] Google Sheets service configured (connects on first data request)")
+
+        except Exception as e:
+            import traceback
+            error_msg = str(e) if str(e) else f"{type(e).__name__}: {traceback.format_exc()}"
+            print(f"[ERROR] Failed to initialize Google Sheets service: {error_msg}")
+            raise
+
+    def _connect(self):
+        """Authenticate, open the spreadsheet and make sure every worksheet exists"""
+        if self._worksheets is not None:
+            return self._worksheets
         try:
             # Authenticate with Google Sheets API
             scopes = [
                 'https://www.googleapis.com/auth/spreadsheets',
                 'https://www.googleapis.com/auth/drive'
             ]
-            
+
             # Load credentials from environment variable
-            creds_json = os.environ.get("GOOGLE_SHEETS_CREDS")
-            if not creds_json:
-                raise ValueError("GOOGLE_SHEETS_CREDS environment variable not set")
-                
-            service_account_info = json.loads(creds_json)
-            
+            service_account_info = json.loads(os.environ.get("GOOGLE_SHEETS_CREDS", ""))
+
             print("[INFO] Google Sheets creds loaded from environment variable")
-            
-            self.sheet_id = os.environ.get('GOOGLE_SHEETS_ID', '').strip()
-            if not self.sheet_id:
-                raise ValueError("GOOGLE_SHEETS_ID environment variable not set")
-            
+
             # Robust Private Key Formatting (in case user pasted it into the file with literal \n)
             if "private_key" in service_account_info and service_account_info["private_key"]:
                 pk = service_account_info["private_key"]
@@ -47,246 +119,404 @@ class GoogleSheetsService:
             # Create credentials
             credentials = Credentials.from_service_account_info(service_account_info, scopes=scopes)
             self.client = gspread.authorize(credentials)
-            
-            # Add simple retry for quota limits during initialization
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    self.spreadsheet = self.client.open_by_key(self.sheet_id)
-                    # Ensure required sheets exist
-                    self.sheet = self._get_or_create_sheet("Students", ["id", "name", "password", "email", "phone", "student_class", "enrollment_date"])
-                    self.auth_sheet = self._get_or_create_sheet("StudentAuth", ["Username", "Password", "StudentID"])
-                    self.tests_sheet = self._get_or_create_sheet("Tests", ["StudentID", "TestName", "Date", "Marks", "Total"])
-                    self.attendance_sheet = self._get_or_create_sheet("Attendance", ["StudentID", "Date", "Status"])
-                    self.updates_sheet = self._get_or_create_sheet("Updates", ["title", "description", "link", "type", "start_date", "end_date", "priority"])
-                    break
-                except Exception as e:
-                    if "429" in str(e) and attempt < max_retries - 1:
-                        time.sleep(2 * (attempt + 1))
-                        continue
-                    raise e
-            
+
+            # Quota errors are retried with backoff by the shared call wrapper
+            spreadsheet = api_call(self.client.open_by_key, self.sheet_id)
+            self._worksheets = self._ensure_worksheets(spreadsheet)
+            self._spreadsheet = spreadsheet
+
             print("[INFO] Google Sheets service initialized successfully")
-            
+            return self._worksheets
+
         except Exception as e:
             import traceback
             error_msg = str(e) if str(e) else f"{type(e).__name__}: {traceback.format_exc()}"
-            print(f"[ERROR] Failed to initialize Google Sheets service: {error_msg}")
+            print(f"[ERROR] Failed to connect to Google Sheets: {error_msg}")
             raise
 
-    def _get_or_create_sheet(self, title, headers):
-        try:
-            worksheet = self.spreadsheet.worksheet(title)
-            # Check if headers exist
-            rows = worksheet.get_all_values()
-            if not rows:
-                worksheet.append_row(headers)
-            return worksheet
-        except gspread.exceptions.WorksheetNotFound:
-            worksheet = self.spreadsheet.add_worksheet(title=title, rows=1000, cols=len(headers) + 5)
-            worksheet.append_row(headers)
-            return worksheet
-        except Exception as e:
-            # Handle potential race conditions by trying to fetch again
+    @staticmethod
+    def _required_worksheets():
+        """Every base tab plus the current year's partitions when partitioning is on"""
+        required = dict(WORKSHEET_HEADERS)
+        for sheet, title in partition_routes().items():
+            required[title] = WORKSHEET_HEADERS[sheet]
+        return required
+
+    def _ensure_worksheets(self, spreadsheet, required=None):
+        """
+        Check the required tabs from spreadsheet metadata, add the missing ones in a
+        single batch and write any absent header rows in one more request.
+        """
+        required = required or self._required_worksheets()
+        worksheets = {ws.title: ws for ws in api_call(spreadsheet.worksheets)}
+        missing = [title for title in required if title not in worksheets]
+        if missing:
             try:
-                return self.spreadsheet.worksheet(title)
-            except:
-                raise e
+                api_call(spreadsheet.batch_update, {'requests': [
+                    {'addSheet': {'properties': {
+                        'title': title,
+                        'gridProperties': {'rowCount': 1000, 'columnCount': len(required[title]) + 5}
+                    }}} for title in missing
+                ]})
+            except Exception as e:
+                # Another worker may have added them first; the re-read below decides
+                print(f"[WARNING] Could not add worksheets {missing}: {e}")
+            worksheets = {ws.title: ws for ws in api_call(spreadsheet.worksheets)}
+            still_missing = [title for title in missing if title not in worksheets]
+            if still_missing:
+                raise RuntimeError(f"Worksheets missing and could not be created: {still_missing}")
+
+        # Only the header rows are read, not the data below them
+        titles = list(required)
+        response = api_call(spreadsheet.values_batch_get, [f"'{title}'!1:1" for title in titles])
+        headerless = [title for title, value_range in zip(titles, response.get('valueRanges', []))
+                      if not value_range.get('values')]
+        if headerless:
+            api_call(spreadsheet.values_batch_update, {
+                'valueInputOption': 'RAW',
+                'data': [{'range': f"'{title}'!A1", 'values': [required[title]]} for title in headerless]
+            })
+        return worksheets
+
+    def _worksheet(self, title):
+        worksheets = self._worksheets
+        if worksheets is None:
+            worksheets = self._flight.do('connect', self._connect)
+        partition = parse_partition(title)
+        if title not in worksheets and partition:
+            # A new academic year started while running: add its tab on first use
+            worksheets = self._flight.do(('partition', title), lambda: self.add_worksheets(
+                {title: WORKSHEET_HEADERS[partition[0]]}))
+        return worksheets[title]
+
+    def add_worksheets(self, required):
+        """Create any missing tabs of {title: headers} and refresh the worksheet map"""
+        self._worksheets = self._ensure_worksheets(self.spreadsheet, required)
+        return self._worksheets
+
+    def _routed(self, sheet):
+        """Worksheet for a logical sheet: the current year's partition when partitioned"""
+        return self._worksheet(partition_routes().get(sheet, sheet))
+
+    @property
+    def spreadsheet(self):
+        if self._spreadsheet is None:
+            self._flight.do('connect', self._connect)
+        return self._spreadsheet
+
+    @property
+    def sheet(self):
+        return self._worksheet("Students")
+
+    @property
+    def auth_sheet(self):
+        return self._worksheet("StudentAuth")
+
+    @property
+    def tests_sheet(self):
+        return self._routed("Tests")
+
+    @property
+    def attendance_sheet(self):
+        return self._routed("Attendance")
+
+    @property
+    def updates_sheet(self):
+        return self._worksheet("Updates")
+
+    @property
+    def attendance_summary_sheet(self):
+        return self._worksheet("AttendanceSummary")
+
+    @property
+    def attendance_archive_sheet(self):
+        return self._worksheet("AttendanceArchive")
     
     def _get_headers(self):
         try:
-            return self.sheet.row_values(1)
+            return api_call(self.sheet.row_values, 1)
         except:
             return []
     
     def _find_row_by_id(self, student_id):
+        """Row number of a student from the snapshot's ID index"""
         try:
-            headers = self._get_headers()
-            if not headers: return None
-            id_index = headers.index('id')
-            cells = self.sheet.col_values(id_index + 1)
-            target_id = str(student_id).strip().lower()
-            for i, cell_value in enumerate(cells):
-                if str(cell_value).strip().lower() == target_id:
-                    return i + 1
-            return None
+            return self._get_snapshot().student_row_number(student_id)
         except:
             return None
     
+    def _ensure_background_refresh(self):
+        """Start this worker's refresh thread on first data access rather than at import"""
+        if self._background_started:
+            return
+        with self._background_lock:
+            if not self._background_started:
+                self._start_background_refresh()
+                self._background_started = True
+
+    def _start_background_refresh(self):
+        self.refresher = BackgroundRefresher(self)
+        self.refresher.start()
+
+    def _refresh_views(self, max_ages):
+        """
+        Reload the snapshot for the views ({view: max age}) it has aged past, then rebuild
+        their derived views; returns the views refreshed
+        """
+        snapshot = getattr(self, '_snapshot', None)
+        due = [view for view, max_age in max_ages.items() if snapshot is None or snapshot.age() >= max_age]
+        if not due:
+            return []
+        max_age = min(max_ages[view] for view in due)
+        self._flight.do('snapshot', lambda: self._reload_snapshot(False, max_age))
+        if 'leaderboard' in due:
+            self._leaderboard_engine()
+        return due
+
+    def _get_snapshot(self, force=False, view='students'):
+        """
+        Return the current snapshot of all worksheets. Past the view's freshness target
+        the last good copy is still served while the background refresher reloads it;
+        only a missing, dirty or too-stale snapshot is reloaded in the request.
+        """
+        self._ensure_background_refresh()
+        snapshot = getattr(self, '_snapshot', None)
+        dirty = force or getattr(self, '_snapshot_dirty', False)
+        written = self._sheets_written_at()
+        behind = snapshot is not None and written > snapshot.loaded_at
+        if self.refresher and not force:
+            self.refresher.touch(view)
+        if not dirty and snapshot and not behind:
+            age = snapshot.age()
+            if age >= FRESHNESS.get(view, FRESHNESS['students']) and self.refresher:
+                self.refresher.wake()
+            if age < MAX_STALENESS:
+                metrics.cache_lookup('snapshot', True)
+                return snapshot
+        metrics.cache_lookup('snapshot', False)
+        max_age = FRESHNESS.get(view, FRESHNESS['students'])
+        if behind:
+            # Another worker wrote since this copy was loaded; reuse its reload if there is one
+            max_age = min(max_age, time.time() - written)
+        try:
+            if force:
+                # Writers address rows by number: never share a load that began before their write
+                return self._reload_snapshot(True, max_age)
+            return self._flight.do('snapshot:fresh' if dirty else 'snapshot',
+                                   lambda: self._reload_snapshot(dirty, max_age))
+        except Exception as e:
+            print(f"[ERROR] Failed to load sheets snapshot: {e}")
+            # Serve the last good copy rather than an empty page (never to a writer)
+            if snapshot and not force:
+                return snapshot
+            raise
+
+    def _reload_snapshot(self, dirty, max_age):
+        # Cleared before fetching so a write landing mid-fetch marks it dirty again
+        self._snapshot_dirty = False
+        try:
+            # Other workers may already have fetched a fresh copy; only one of us refetches
+            self._snapshot = get_shared_cache().fetch(
+                SNAPSHOT_CACHE_KEY,
+                0 if dirty else max_age,
+                self._load_current
+            )
+        except Exception:
+            if dirty:
+                self._snapshot_dirty = True
+            raise
+        return self._snapshot
+
+    def _load_current(self):
+        """One batchGet of every sheet, reading only the current year's partitions"""
+        routes = partition_routes()
+        for title in routes.values():
+            self._worksheet(title)
+        return load_snapshot(self.spreadsheet, call=api_call, routes=routes, year=current_year())
+
+    def partition_years(self):
+        """Academic years that have partition tabs in the spreadsheet, oldest first"""
+        worksheets = self._worksheets
+        if worksheets is None:
+            worksheets = self._flight.do('connect', self._connect)
+        return partition_years(worksheets)
+
+    def _load_partitions(self, years):
+        """Tables of the given years' partitions in one batchGet, keyed by tab title"""
+        worksheets = self._worksheets or self._flight.do('connect', self._connect)
+        titles = [partition_title(sheet, year) for year in years for sheet in PARTITIONED_SHEETS
+                  if partition_title(sheet, year) in worksheets]
+        return load_tables(self.spreadsheet, titles, call=api_call) if titles else {}
+
+    def past_partition_tables(self, snapshot):
+        """Freshly read Tests/Attendance partitions of every year other than the snapshot's"""
+        return list(self._load_partitions([y for y in self.partition_years() if y != snapshot.year]).values())
+
+    def get_year_snapshot(self, year):
+        """
+        The current snapshot with Tests and Attendance swapped for one past academic
+        year's partitions. Only those two tabs are read, and only when asked for.
+        """
+        current = self._get_snapshot()
+        if not PARTITION_BY_YEAR or not year or int(year) == current.year:
+            return current
+        year = int(year)
+        cached = getattr(self, '_year_snapshots', {}).get(year)
+        if cached and cached.base is current:
+            return cached
+        tables = get_shared_cache().fetch(
+            PARTITION_CACHE_KEY.format(year), PAST_YEAR_MAX_AGE, lambda: self._load_partitions([year])
+        )
+        year_tables = dict(current.tables)
+        for sheet in PARTITIONED_SHEETS:
+            title = partition_title(sheet, year)
+            year_tables[sheet] = tables.get(title) or SheetTable(title, [])
+        snapshot = SheetsSnapshot(year_tables, year)
+        snapshot.base = current
+        self._year_snapshots = {**getattr(self, '_year_snapshots', {}), year: snapshot}
+        return snapshot
+
+    def _invalidate_snapshot(self):
+        """Force the next read to refetch after this worker changed a sheet"""
+        self._snapshot_dirty = True
+        shared = get_shared_cache()
+        shared.delete(SNAPSHOT_CACHE_KEY)
+        # Tells the other workers their snapshot is out of date
+        shared.set(SHEETS_WRITTEN_KEY, True)
+
+    @staticmethod
+    def _sheets_written_at():
+        try:
+            return get_shared_cache().stored_at(SHEETS_WRITTEN_KEY)
+        except Exception:
+            return 0
+
     def get_all_students(self):
-        """Get all students with simple caching"""
-        # Simple cache for 30 seconds
-        if hasattr(self, '_students_cache') and (time.time() - self._students_cache_time < 30):
-            return self._students_cache
-            
+        """Get all students from the shared snapshot"""
         try:
-            headers = self._get_headers()
-            rows = self.sheet.get_all_values()
-            students = []
-            for row in rows[1:]:
-                if row and any(row):
-                    student = {headers[i]: row[i] for i in range(len(headers)) if i < len(row)}
-                    students.append(student)
-            
-            self._students_cache = students
-            self._students_cache_time = time.time()
-            return students
+            return self._get_snapshot().students.records()
         except:
             return []
     
-    def get_student(self, student_id):
-        """Get full student data including tests and attendance from separate sheets"""
+    def get_student(self, student_id, year=None):
+        """
+        Get full student data including tests and attendance from separate sheets.
+        `year` selects a past academic year when the sheets are partitioned.
+        """
         try:
-            all_values = self.sheet.get_all_values()
-            if not all_values: return None
-            headers = [str(h).strip().lower() for h in all_values[0]]
-            id_col_idx = headers.index('id') if 'id' in headers else -1
-            if id_col_idx == -1: return None
-            
-            target_id = str(student_id).strip().lower()
-            student = None
-            for row in all_values[1:]:
-                if len(row) > id_col_idx and str(row[id_col_idx]).strip().lower() == target_id:
-                    student = {headers[i]: row[i] for i in range(len(headers)) if i < len(row)}
-                    break
+            snapshot = self.get_year_snapshot(year) if year else self._get_snapshot()
+            student = snapshot.student_record(student_id)
             
             if student:
-                # Fetch Tests
-                all_tests = self.tests_sheet.get_all_values()
-                student['tests'] = []
-                if all_tests and len(all_tests) > 1:
-                    test_headers = [h.lower() for h in all_tests[0]]
-                    s_id_idx = test_headers.index('studentid')
-                    for t_row in all_tests[1:]:
-                        if len(t_row) > s_id_idx and str(t_row[s_id_idx]).strip().lower() == target_id:
-                            student['tests'].append({test_headers[i]: t_row[i] for i in range(len(test_headers)) if i < len(t_row)})
-                
-                # Fetch Attendance
-                all_att = self.attendance_sheet.get_all_values()
-                student['attendance_log'] = []
-                if all_att and len(all_att) > 1:
-                    att_headers = [h.lower() for h in all_att[0]]
-                    s_id_idx = att_headers.index('studentid')
-                    for a_row in all_att[1:]:
-                        if len(a_row) > s_id_idx and str(a_row[s_id_idx]).strip().lower() == target_id:
-                            student['attendance_log'].append({att_headers[i]: a_row[i] for i in range(len(att_headers)) if i < len(a_row)})
-                
-                # Calculate attendance percentage
-                if student['attendance_log']:
-                    present = len([a for a in student['attendance_log'] if a.get('status', '').lower() == 'present'])
-                    total = len(student['attendance_log'])
-                    student['attendance_percentage'] = (present/total)*100 if total > 0 else 0
-                    student['progress'] = {"completion": student['attendance_percentage'], "status": "In Progress"}
-                else:
-                    student['attendance_percentage'] = 0
-                    student['progress'] = {"completion": 0, "status": "New"}
-
+                # Tests and attendance come straight from the per-student indexes
+                self._assemble_student(student, student_id,
+                                       snapshot.student_tests(student_id),
+                                       snapshot.student_attendance(student_id),
+                                       snapshot)
             return student
         except Exception as e:
             print(f"Error in get_student: {e}")
             return None
 
-    def get_leaderboard(self):
-        """Calculate leaderboard with caching"""
-        if hasattr(self, '_leaderboard_cache') and (time.time() - self._leaderboard_cache_time < 60):
-            return self._leaderboard_cache
+    def _assemble_student(self, student, student_id, tests, attendance_log, snapshot):
+        """Attach tests, attendance (plus queued rows) and the attendance percentage to a student record"""
+        student['tests'] = tests
+        student['attendance_log'] = attendance_log
+
+        # Include submissions still waiting in the write-behind journal (they go to the current year)
+        target_id = normalize_id(student_id)
+        live = snapshot.year == current_year()
+        for row in self.write_queue.pending_rows('Tests') if live else []:
+            if normalize_id(row[0]) == target_id:
+                student['tests'].append(snapshot.tests.record(row))
+        for row in self.write_queue.pending_rows('Attendance') if live else []:
+            if normalize_id(row[0]) == target_id:
+                # A queued mark replaces the saved one for the same date
+                pending = snapshot.attendance.record(row)
+                student['attendance_log'] = [a for a in student['attendance_log']
+                                             if str(a.get('date', '')).strip() != str(row[1]).strip()]
+                student['attendance_log'].append(pending)
 
+        # Trends, percentiles and streaks come precomputed for the whole snapshot
+        student['analytics'] = self._student_analytics(snapshot).for_student(student_id)
+        # Every test row, queued and non-numeric ones included, for the dashboards' history
+        student['test_history'] = test_history(student['tests'], student['analytics'])
+
+        # Calculate attendance percentage over compacted months plus the live rows
+        archived_present, archived_total = snapshot.student_attendance_summary(student_id)
+        student['attendance_archived'] = {'present': archived_present, 'total': archived_total}
+        # Counted like compaction does: the last mark of a resubmitted date wins
+        marks = {str(a.get('date', '')).strip(): a for a in student['attendance_log']}
+        if marks or archived_total:
+            present = len([a for a in marks.values() if a.get('status', '').lower() == 'present']) + archived_present
+            total = len(marks) + archived_total
+            student['attendance_percentage'] = (present/total)*100 if total > 0 else 0
+            student['progress'] = {"completion": student['attendance_percentage'], "status": "In Progress"}
+        else:
+            student['attendance_percentage'] = 0
+            student['progress'] = {"completion": 0, "status": "New"}
+        return student
+
+    def _student_analytics(self, snapshot):
+        """Analytics for every student, computed once per snapshot and kept per academic year"""
+        cached = getattr(self, '_analytics', {})
+        analytics = cached.get(snapshot.year)
+        metrics.cache_lookup('analytics', analytics is not None and analytics.snapshot is snapshot)
+        if analytics is None or analytics.snapshot is not snapshot:
+            analytics = self._flight.do(('analytics', id(snapshot)), lambda: StudentAnalytics(snapshot))
+            # Like _year_snapshots: a past-year view must not evict the current year's entry
+            self._analytics = {**cached, snapshot.year: analytics}
+        return analytics
+
+    def get_attendance_report(self):
+        """Class attendance report for the current snapshot, built once per snapshot"""
+        snapshot = self._get_snapshot()
+        report = getattr(self, '_attendance_report', None)
+        metrics.cache_lookup('attendance_report', report is not None and report.snapshot is snapshot)
+        if report is None or report.snapshot is not snapshot:
+            report = self._flight.do(('attendance_report', id(snapshot)), lambda: AttendanceReport(snapshot))
+            self._attendance_report = report
+        return report
+
+    def _leaderboard_engine(self):
+        """Leaderboard engine for the current snapshot, with newly queued marks applied"""
+        return self._flight.do('leaderboard', self._refresh_leaderboard)
+
+    def _refresh_leaderboard(self):
+        snapshot = self._get_snapshot(view='leaderboard')
+        engine = getattr(self, '_leaderboard', None)
+        if engine is None or (engine.snapshot is not snapshot and not getattr(self, '_leaderboard_carry', False)):
+            # Full build only when the snapshot was reloaded for a change we did not make
+            engine = LeaderboardEngine.from_snapshot(snapshot)
+        engine.snapshot = snapshot
+        self._leaderboard = engine
+        self._leaderboard_carry = False
+
+        for journal_id, row_key, row in self.write_queue.pending_since('Tests', engine.journal_id):
+            if len(row) >= 4:
+                engine.add_score(('journal', row_key), row[0], row[1], row[3])
+            engine.journal_id = journal_id
+        return engine
+
+    def get_leaderboard(self):
+        """Per-class toppers for every test, maintained incrementally"""
         try:
-            all_tests = self.tests_sheet.get_all_values()
-            if not all_tests or len(all_tests) < 2:
-                return {}
-            
-            headers = [h.lower().strip() for h in all_tests[0]]
-            try:
-                sid_idx = headers.index('studentid')
-                name_idx = headers.index('testname')
-                marks_idx = headers.index('marks')
-            except ValueError:
-                return {}
-            
-            # Map student IDs to Names and Classes
-            students = self.get_all_students()
-            student_info = {str(s.get('id')).strip().lower(): {
-                'name': s.get('name'),
-                'class': str(s.get('student_class', '')).strip()
-            } for s in students}
-            
-            # Group by Class, then by Test Name
-            class_rankings = {
-                'Class 8': {},
-                'Class 9': {},
-                'Class 10': {}
-            }
-
-            for row in all_tests[1:]:
-                if len(row) <= max(sid_idx, name_idx, marks_idx): continue
-                s_id = str(row[sid_idx]).strip().lower()
-                test_name = row[name_idx].strip()
-                
-                info = student_info.get(s_id)
-                # Fallback: If student class is not in Student info, we try to find it from the test name
-                # or default to Class 10 (most common for coaching)
-                s_class = info.get('class', '') if info else ''
-                
-                if not s_class:
-                    # Attempt to extract class from test name (e.g., "Class 9 - Math")
-                    test_name_lower = test_name.lower()
-                    if 'class 8' in test_name_lower or '8th' in test_name_lower: s_class = 'Class 8'
-                    elif 'class 9' in test_name_lower or '9th' in test_name_lower: s_class = 'Class 9'
-                    elif 'class 10' in test_name_lower or '10th' in test_name_lower: s_class = 'Class 10'
-                    else: s_class = 'Class 10' # Default fallback
-                
-                # Normalize class name to match our keys
-                key = 'Class 10'
-                if '8' in s_class: key = 'Class 8'
-                elif '9' in s_class: key = 'Class 9'
-                elif '10' in s_class: key = 'Class 10'
-                
-                try:
-                    marks = int(row[marks_idx])
-                except:
-                    marks = 0
-                
-                if test_name not in class_rankings[key]:
-                    class_rankings[key][test_name] = []
-                
-                student_name = info.get('name', s_id) if info else s_id
-                class_rankings[key][test_name].append({
-                    'name': student_name,
-                    'marks': marks
-                })
-            
-            # Sort and format for display
-            final_leaderboard = {}
-            if class_rankings:
-                for cls, tests in class_rankings.items():
-                    if not tests: continue
-                    final_leaderboard[cls] = []
-                    for test, scores in tests.items():
-                        sorted_scores = sorted(scores, key=lambda x: x['marks'], reverse=True)
-                        final_leaderboard[cls].append({
-                            'test_name': test,
-                            'toppers': sorted_scores[:3]
-                        })
-            
-            self._leaderboard_cache = final_leaderboard
-            self._leaderboard_cache_time = time.time()
-            return final_leaderboard
+            return self._leaderboard_engine().view()
         except Exception as e:
             print(f"Error in get_leaderboard: {e}")
             return {}
 
     def batch_update_attendance(self, attendance_data, date):
-        """Batch update attendance for multiple students at once to improve performance"""
+        """Queue attendance for multiple students; the write-behind flusher appends it"""
         try:
-            # 1. Prepare values to append
-            rows_to_append = []
+            # Keyed by (student, date) so a re-submission replaces the unsent one
+            entries = []
             for s_id, status in attendance_data.items():
-                rows_to_append.append([str(s_id), str(date), str(status)])
+                key = f"{normalize_id(s_id)}|{str(date).strip()}"
+                entries.append((key, [str(s_id), str(date), str(status)]))
             
-            # 2. Append all rows at once
-            if rows_to_append:
-                self.attendance_sheet.append_rows(rows_to_append)
+            if entries:
+                self.write_queue.enqueue('Attendance', entries)
             
             return True
         except Exception as e:
@@ -294,172 +524,349 @@ class GoogleSheetsService:
             return False
 
     def batch_add_tests(self, test_data, test_name, date, total_marks):
-        """Batch add test marks for multiple students"""
+        """Queue test marks for multiple students; the write-behind flusher appends them"""
         try:
-            rows_to_append = []
+            entries = []
             for s_id, marks in test_data.items():
                 if marks is not None and str(marks).strip() != '':
-                    rows_to_append.append([str(s_id), str(test_name), str(date), str(marks), str(total_marks)])
+                    key = f"{normalize_id(s_id)}|{str(test_name).strip().lower()}|{str(date).strip()}"
+                    entries.append((key, [str(s_id), str(test_name), str(date), str(marks), str(total_marks)]))
             
-            if rows_to_append:
-                self.tests_sheet.append_rows(rows_to_append)
-                # Invalidate leaderboard cache since new data added
-                if hasattr(self, '_leaderboard_cache'):
-                    delattr(self, '_leaderboard_cache')
+            if entries:
+                self.write_queue.enqueue('Tests', entries)
+                # Only the boards of this test are touched
+                self._leaderboard_engine()
             return True
         except Exception as e:
             print(f"Error in batch_add_tests: {e}")
             return False
 
+    def _append_rows(self, worksheet, rows):
+        """Append rows to a worksheet (every site append goes through here)"""
+        api_call(worksheet.append_rows, rows)
+
+    def _batch_update(self, requests):
+        """Send spreadsheets.batchUpdate requests (every row-addressed site write goes through here)"""
+        api_call(self.spreadsheet.batch_update, {'requests': requests})
+
+    def _flush_rows(self, worksheet, rows):
+        """Write-behind target: send one batch of queued rows (raises so the queue retries)"""
+        target = {'Attendance': self.attendance_sheet, 'Tests': self.tests_sheet}[worksheet]
+        # Queued teacher submissions go in the high-priority lane
+        with rate_limiter.priority(PRIORITY_HIGH):
+            if worksheet == 'Attendance':
+                self._upsert_attendance(target, rows)
+            else:
+                self._append_rows(target, rows)
+        self._invalidate_snapshot()
+        if worksheet == 'Tests':
+            # The engine already holds these rows from the journal; skip the rebuild
+            self._leaderboard_carry = True
+
+    def _upsert_attendance(self, target, rows):
+        """
+        Write attendance keyed by (StudentID, Date) in one batchUpdate: a pair already in
+        the sheet has its status rewritten in place (older duplicates of it are removed)
+        and only new pairs are appended.
+        """
+        # Compaction deletes Attendance rows; wait for it instead of writing to shifted rows
+        shared = get_shared_cache()
+        if not shared.acquire_lease(ATTENDANCE_LOCK, 120):
+            raise RuntimeError("Attendance sheet is locked by compaction, retrying later")
+        try:
+            self._write_attendance(target, rows)
+        finally:
+            shared.release_lease(ATTENDANCE_LOCK)
+
+    def _write_attendance(self, target, rows):
+        # Row numbers must be current, since edits and deletes shift them
+        snapshot = self._get_snapshot(force=True)
+        table = snapshot.attendance
+        status_idx = table.index('status')
+        if status_idx == -1 or table.index('date') == -1:
+            self._append_rows(target, rows)
+            return
+
+        # Months already compacted are counted in AttendanceSummary; a live row would count twice
+        closed = [row for row in rows if snapshot.summary_position(row[0], date_month(row[1])) is not None]
+        rows = [row for row in rows if snapshot.summary_position(row[0], date_month(row[1])) is None]
+
+        updates, deletes, appends = [], [], []
+        for row in rows:
+            positions = snapshot.attendance_positions(row[0], row[1])
+            if not positions:
+                appends.append(row)
+                continue
+            keep = positions[0]
+            if table.rows[keep][status_idx].strip() != str(row[2]).strip():
+                updates.append(update_cell_request(target.id, table.row_number(keep), status_idx, row[2]))
+            deletes += [table.row_number(p) for p in positions[1:]]
+
+        requests = updates + delete_rows_requests(target.id, deletes)
+        if appends:
+            requests.append(append_rows_request(target.id, appends))
+        if closed:
+            requests += self._summarized_attendance_requests(snapshot, closed)
+        if requests:
+            self._batch_update(requests)
+        for action, written in (('updated', updates), ('deduplicated', deletes),
+                                ('appended', appends), ('compacted', closed)):
+            metrics.inc('sheets_rows_written_total', len(written), worksheet='Attendance', action=action)
+
+    def _summarized_attendance_requests(self, snapshot, rows):
+        """
+        Requests applying attendance for compacted months the way compaction would have:
+        the AttendanceArchive copy is corrected or appended and the month's summary counts
+        move by the difference. The archive is only read when such a row arrives.
+        """
+        archive = load_tables(self.spreadsheet, ['AttendanceArchive'], call=api_call)['AttendanceArchive']
+        sid_idx, date_idx, status_idx = (archive.index(c) for c in ('studentid', 'date', 'status'))
+        # Compaction counted the last row of a resubmitted pair
+        archived = {}
+        if -1 not in (sid_idx, date_idx, status_idx):
+            for position, row in enumerate(archive.rows):
+                archived[(normalize_id(row[sid_idx]), str(row[date_idx]).strip())] = position
+
+        archive_id = self.attendance_archive_sheet.id
+        requests, appends, deltas = [], [], {}
+        for row in rows:
+            present = str(row[2]).strip().lower() == 'present'
+            delta = deltas.setdefault(snapshot.summary_position(row[0], date_month(row[1])), [0, 0])
+            position = archived.get((normalize_id(row[0]), str(row[1]).strip()))
+            if position is None:
+                appends.append(row)
+                delta[0] += present
+                delta[1] += 1
+                continue
+            previous = str(archive.rows[position][status_idx]).strip()
+            if previous != str(row[2]).strip():
+                requests.append(update_cell_request(archive_id, archive.row_number(position), status_idx, row[2]))
+                delta[0] += present - (previous.lower() == 'present')
+        if appends:
+            requests.append(append_rows_request(archive_id, appends))
+
+        summary = snapshot.attendance_summary
+        summary_id = self.attendance_summary_sheet.id
+        for position, (add_present, add_total) in deltas.items():
+            row = summary.rows[position]
+            for column, change in ((summary.index('present'), add_present), (summary.index('total'), add_total)):
+                try:
+                    value = int(row[column]) + change
+                except ValueError:
+                    # Compaction skips unreadable counts too
+                    continue
+                if change:
+                    requests.append(update_cell_request(summary_id, summary.row_number(position), column, value))
+        return requests
+
+    @high_priority
     def sync_auth_record(self, username, password, student_id):
+        """Upsert a StudentAuth row and patch the in-memory credential index"""
         try:
-            all_auth = self.auth_sheet.get_all_values()
-            clean_user = "".join(str(username).split()).lower()
-            found_idx = -1
-            for i, row in enumerate(all_auth):
-                if i == 0: continue
-                if len(row) > 0 and "".join(str(row[0]).split()).lower() == clean_user:
-                    found_idx = i + 1
-                    break
-            if found_idx != -1:
-                self.auth_sheet.update_cell(found_idx, 2, str(password))
-                self.auth_sheet.update_cell(found_idx, 3, str(student_id))
+            # auth_rows holds row numbers, which a delete elsewhere may have shifted
+            snapshot = self._get_snapshot(force=True)
+            found_idx = snapshot.auth_rows.get(normalize_credential(username))
+            if found_idx:
+                self._batch_update([update_cell_request(self.auth_sheet.id, found_idx, 1, password),
+                                    update_cell_request(self.auth_sheet.id, found_idx, 2, student_id)])
             else:
-                self.auth_sheet.append_row([str(username), str(password), str(student_id)])
+                self._append_rows(self.auth_sheet, [[str(username), str(password), str(student_id)]])
+            snapshot.set_credential(username, password, student_id)
+            # Other workers pick the change up on their next reload
+            get_shared_cache().delete(SNAPSHOT_CACHE_KEY)
             return True
         except:
             return False
 
+    @high_priority
     def authenticate_student(self, username, password):
+        """Check a login against the credential index (no network call when the snapshot is warm)"""
         try:
-            # First attempt: Exact match from StudentAuth sheet
-            all_auth = self.auth_sheet.get_all_values()
-            if not all_auth or len(all_auth) < 2: return None
-            
-            def super_clean(s):
-                return "".join(str(s).split()).lower()
-            
-            p_user = super_clean(username)
-            p_pass = super_clean(password)
-            
-            for row in all_auth[1:]:
-                if len(row) < 2: continue
-                # Match username and password
-                if super_clean(row[0]) == p_user and super_clean(row[1]) == p_pass:
-                    student_id = row[2] if len(row) > 2 else row[0]
-                    return self.get_student(student_id)
-            
-            # Fallback: Check Students sheet directly if Auth sheet fails
-            students = self.get_all_students()
-            for s in students:
-                if super_clean(s.get('name', '')) == p_user and super_clean(s.get('password', '')) == p_pass:
-                    return self.get_student(s.get('id'))
-                    
-            return None
+            student_id = self._get_snapshot().find_login(username, password)
+            if student_id is None:
+                return None
+            return self.get_student(student_id)
         except Exception as e:
             print(f"Error in authenticate_student: {e}")
             return None
     
+    @high_priority
     def add_student(self, data):
         try:
             headers = self._get_headers()
             row = [str(data.get(h, '')).strip() for h in headers]
-            self.sheet.append_row(row)
+            self._append_rows(self.sheet, [row])
+            self._invalidate_snapshot()
             return True
         except:
             return False
 
+    @high_priority
     def update_student(self, student_id, data):
+        """Diff the submitted data against the sheets and apply it in one batchUpdate call"""
         try:
-            row_num = self._find_row_by_id(student_id)
+            # Row numbers must be current, so diff against a fresh snapshot
+            snapshot = self._get_snapshot(force=True)
+            row_num = snapshot.student_row_number(student_id)
             if not row_num: return False
-            headers = self._get_headers()
+            target_id = normalize_id(student_id)
+
+            headers = snapshot.students.headers
+            current = snapshot.students.rows[row_num - 2]
             row = [str(data.get(h, '')).strip() for h in headers]
-            self.sheet.delete_rows(row_num)
-            self.sheet.insert_row(row, row_num)
+            requests = diff_requests(self.sheet.id, [(row_num, current)], [row])
             
             # Sync tests
             if 'tests' in data:
-                all_tests = self.tests_sheet.get_all_values()
-                if all_tests:
-                    rows_to_delete = []
-                    for i, t_row in enumerate(all_tests[1:], 2):
-                        if len(t_row) > 0 and str(t_row[0]).strip().lower() == str(student_id).strip().lower():
-                            rows_to_delete.append(i)
-                    for r in reversed(rows_to_delete):
-                        self.tests_sheet.delete_rows(r)
-                for t in data['tests']:
-                    self.tests_sheet.append_row([str(student_id), t.get('name'), t.get('date'), str(t.get('marks')), str(t.get('total'))])
+                existing = [(snapshot.tests.row_number(p), snapshot.tests.rows[p])
+                            for p in snapshot.tests_by_student.get(target_id, [])]
+                requests += diff_requests(self.tests_sheet.id, existing, self._test_rows(student_id, data['tests']))
 
             # Sync attendance
             if 'attendance_log' in data:
-                all_att = self.attendance_sheet.get_all_values()
-                if all_att:
-                    rows_to_delete = []
-                    for i, a_row in enumerate(all_att[1:], 2):
-                        if len(a_row) > 0 and str(a_row[0]).strip().lower() == str(student_id).strip().lower():
-                            rows_to_delete.append(i)
-                    for r in reversed(rows_to_delete):
-                        self.attendance_sheet.delete_rows(r)
-                for a in data['attendance_log']:
-                    self.attendance_sheet.append_row([str(student_id), a.get('date'), a.get('status')])
+                existing = [(snapshot.attendance.row_number(p), snapshot.attendance.rows[p])
+                            for p in snapshot.attendance_by_student.get(target_id, [])]
+                requests += diff_requests(self.attendance_sheet.id, existing,
+                                          self._attendance_rows(student_id, data['attendance_log']))
             
+            if requests:
+                # Sheets applies a batchUpdate atomically, so a failed save changes nothing
+                self._batch_update(requests)
+
+            self._student_saved(student_id, data)
+            self._invalidate_snapshot()
             return True
         except Exception as e:
             print(f"Error in update_student: {e}")
             return False
+
+    @staticmethod
+    def _test_rows(student_id, tests):
+        """Tests rows for the test list of the edit form"""
+        return [[str(student_id), t.get('name'), t.get('date'), str(t.get('marks')), str(t.get('total'))] for t in tests]
+
+    @staticmethod
+    def _attendance_rows(student_id, attendance_log):
+        """Attendance rows for the attendance log of the edit form"""
+        return [[str(student_id), a.get('date'), a.get('status')] for a in attendance_log]
+
+    def _student_saved(self, student_id, data):
+        """The form was rendered with queued rows merged in, so they are now saved too"""
+        target_id = normalize_id(student_id)
+        if 'tests' in data:
+            self.write_queue.discard('Tests', target_id)
+            engine = getattr(self, '_leaderboard', None)
+            if engine is not None:
+                engine.replace_student(dict(data, id=student_id), data['tests'])
+                self._leaderboard_carry = True
+        if 'attendance_log' in data:
+            self.write_queue.discard('Attendance', target_id)
     
+    @high_priority
     def delete_student(self, student_id):
+        """Delete a student with their Tests, Attendance and StudentAuth rows in one batchUpdate"""
+        # Attendance rows are deleted too, so queued upserts must not run meanwhile
+        shared = get_shared_cache()
+        if not shared.acquire_lease(ATTENDANCE_LOCK, 120):
+            print("[WARNING] Attendance sheet is locked, student not deleted")
+            return False
         try:
-            row_num = self._find_row_by_id(student_id)
+            # Row numbers must be current, since every sheet is edited by position
+            snapshot = self._get_snapshot(force=True)
+            row_num = snapshot.student_row_number(student_id)
             if not row_num: return False
-            self.sheet.delete_rows(row_num)
+            target_id = normalize_id(student_id)
+
+            rows = snapshot.dependent_rows(student_id, self.past_partition_tables(snapshot))
+            rows['Students'] = [row_num]
+            self.delete_rows(rows)
+            self._student_deleted(target_id)
+            self._invalidate_snapshot()
             return True
-        except:
+        except Exception as e:
+            print(f"Error in delete_student: {e}")
             return False
+        finally:
+            shared.release_lease(ATTENDANCE_LOCK)
+
+    def _student_deleted(self, target_id):
+        """Unsent marks would otherwise recreate the rows (kept if the delete failed)"""
+        self.write_queue.discard('Tests', target_id)
+        self.write_queue.discard('Attendance', target_id)
+
+    def delete_rows(self, rows):
+        """Delete row numbers from several worksheets ({title: [row, ...]}) in one batchUpdate"""
+        requests = []
+        for title, row_numbers in rows.items():
+            requests += delete_rows_requests(self._worksheet(title).id, row_numbers)
+        if requests:
+            self._batch_update(requests)
+        for title, row_numbers in rows.items():
+            metrics.inc('sheets_rows_written_total', len(row_numbers), worksheet=title, action='deleted')
     
     def get_active_updates(self):
-        """Fetch and filter active updates from the Updates sheet"""
+        """Active updates from the Updates sheet, highest priority first"""
         try:
-            all_rows = self.updates_sheet.get_all_values()
-            if not all_rows or len(all_rows) < 2:
-                return []
-                
-            headers = [h.lower().strip() for h in all_rows[0]]
-            updates = []
-            today = datetime.now().date()
-            
-            for row in all_rows[1:]:
-                if not any(row): continue
-                update = {headers[i]: row[i] for i in range(len(headers)) if i < len(row)}
-                
-                # Parse dates
-                try:
-                    start_date = datetime.strptime(update.get('start_date', ''), '%Y-%m-%d').date()
-                    end_date = datetime.strptime(update.get('end_date', ''), '%Y-%m-%d').date()
-                except:
-                    continue
-                    
-                # Filter by date
-                if start_date <= today <= end_date:
-                    try:
-                        update['priority'] = int(update.get('priority', 0))
-                    except:
-                        update['priority'] = 0
-                    updates.append(update)
-            
-            # Sort by priority descending
-            updates.sort(key=lambda x: x['priority'], reverse=True)
-            return updates
+            return list(self.get_updates_feed()[0])
         except Exception as e:
             print(f"Error fetching updates: {e}")
             return []
 
+    def get_updates_feed(self):
+        """
+        (active updates, ETag, last-modified timestamp) for /api/updates. The parsed
+        index lives as long as the snapshot; the active list as long as the date.
+        """
+        updates, etag, changed_on = self._updates_feed_index().active(datetime.now().date())
+        # From shared data, so every worker sends the same Last-Modified for the same feed
+        try:
+            posted = get_shared_cache().stored_at(UPDATES_POSTED_KEY)
+        except Exception:
+            posted = 0
+        changed_at = datetime.combine(changed_on, datetime.min.time()).timestamp() if changed_on else 0
+        return updates, etag, max(posted, changed_at)
+
+    def _updates_feed_index(self):
+        """UpdatesIndex of the current Updates rows, rebuilt only when the snapshot changes"""
+        snapshot = self._get_snapshot(view='updates')
+        try:
+            posted = get_shared_cache().stored_at(UPDATES_POSTED_KEY)
+        except Exception:
+            posted = 0
+        if posted > snapshot.loaded_at:
+            # Another worker posted an announcement; reuse its reload if there is one
+            snapshot = self._flight.do('snapshot', lambda: self._reload_snapshot(False, time.time() - posted))
+        index = getattr(self, '_updates_index', None)
+        if index is None or index[0] is not snapshot:
+            index = self._updates_index = (snapshot, UpdatesIndex(snapshot.updates))
+        return index[1]
+
+    @high_priority
+    def add_update(self, update_row):
+        """Append an announcement row to the Updates sheet"""
+        try:
+            self._append_rows(self.updates_sheet, [update_row])
+            # Tells the other workers their cached feed is out of date
+            get_shared_cache().set(UPDATES_POSTED_KEY, True)
+            self._invalidate_snapshot()
+            return True
+        except Exception as e:
+            print(f"Error in add_update: {e}")
+            return False
+
+def create_sheets_service(start_background=True):
+    """The service for the configured SHEETS_BACKEND (scripts pass start_background=False)"""
+    if os.environ.get('SHEETS_BACKEND', '').strip().lower() == 'sqlite':
+        # Local indexed store with the spreadsheet as a background sync target
+        from sqlite_store import SQLiteSheetsService
+        return SQLiteSheetsService(start_background)
+    return GoogleSheetsService(start_background)
+
 sheets_service = None
 def init_sheets_service(app):
     global sheets_service
     try:
-        sheets_service = GoogleSheetsService()
+        sheets_service = create_sheets_service()
         print("[INFO] Sheets service initialized successfully in init function")
     except Exception as e:
         import traceback
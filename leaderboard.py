@@ -0,0 +1,153 @@
+"""
+Leaderboard Engine - Per-class, per-test top-K toppers maintained incrementally
+Adding a test's marks touches only that test's board instead of rescanning every test
+"""
+import heapq
+
+from sheets_snapshot import normalize_id
+
+TOP_K = 3
+CLASS_KEYS = ['Class 8', 'Class 9', 'Class 10']
+
+
+def class_key(student_class, test_name):
+    """Leaderboard bucket for a score, falling back to hints in the test name"""
+    s_class = student_class or ''
+    if not s_class:
+        # Attempt to extract class from test name (e.g., "Class 9 - Math")
+        test_name_lower = test_name.lower()
+        if 'class 8' in test_name_lower or '8th' in test_name_lower: s_class = 'Class 8'
+        elif 'class 9' in test_name_lower or '9th' in test_name_lower: s_class = 'Class 9'
+        elif 'class 10' in test_name_lower or '10th' in test_name_lower: s_class = 'Class 10'
+        else: s_class = 'Class 10'  # Default fallback (most common for coaching)
+
+    # Normalize class name to match our keys
+    if '8' in s_class: return 'Class 8'
+    if '9' in s_class: return 'Class 9'
+    return 'Class 10'
+
+
+def parse_marks(value):
+    try:
+        return int(value)
+    except:
+        return 0
+
+
+class TestBoard:
+    """All scores of one test in one class plus a bounded min-heap of the best TOP_K"""
+
+    def __init__(self, test_name):
+        self.test_name = test_name
+        self.scores = {}  # entry key -> (marks, seq, student id)
+        self.heap = []    # (marks, -seq, entry key); earlier rows win ties
+
+    def add(self, key, marks, seq, student_id):
+        replaced = key in self.scores
+        self.scores[key] = (marks, seq, student_id)
+        if replaced and any(item[2] == key for item in self.heap):
+            self._rebuild()
+            return
+        item = (marks, -seq, key)
+        if len(self.heap) < TOP_K:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def remove(self, key):
+        if self.scores.pop(key, None) is not None and any(item[2] == key for item in self.heap):
+            self._rebuild()
+
+    def _rebuild(self):
+        """Recompute the top-K from this test's scores only: O(n log K)"""
+        self.heap = heapq.nlargest(TOP_K, ((m, -seq, k) for k, (m, seq, _) in self.scores.items()))
+        heapq.heapify(self.heap)
+
+    def toppers(self):
+        return [self.scores[key] for _, _, key in sorted(self.heap, reverse=True)]
+
+
+class LeaderboardEngine:
+    def __init__(self, students=None):
+        self.boards = {key: {} for key in CLASS_KEYS}  # class -> test name -> TestBoard
+        self.students = {}  # normalized id -> {'name', 'class'}
+        self.entries = {}   # normalized id -> {entry key: (class, test name)}
+        self.journal_id = 0  # highest write-behind journal row already applied
+        self.snapshot = None
+        self._seq = 0
+        self._view = None
+        for student in students or []:
+            self.set_student(student)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        engine = cls(snapshot.students.records())
+        tests = snapshot.tests
+        sid_idx, name_idx, marks_idx = tests.index('studentid'), tests.index('testname'), tests.index('marks')
+        if -1 not in (sid_idx, name_idx, marks_idx):
+            for position, row in enumerate(tests.rows):
+                engine.add_score(('row', position), row[sid_idx], row[name_idx], row[marks_idx])
+        engine.snapshot = snapshot
+        return engine
+
+    def set_student(self, student):
+        self.students[normalize_id(student.get('id'))] = {
+            'name': student.get('name'),
+            'class': str(student.get('student_class', '')).strip()
+        }
+
+    def add_score(self, key, student_id, test_name, marks):
+        """Add or replace one score; costs O(log K) unless it displaces a current topper"""
+        s_id = normalize_id(student_id)
+        test_name = str(test_name).strip()
+        info = self.students.get(s_id)
+        cls = class_key(info.get('class', '') if info else '', test_name)
+        previous = self.entries.get(s_id, {}).get(key)
+        if previous and previous != (cls, test_name):
+            self._remove_entry(key, *previous)
+        board = self.boards[cls].get(test_name)
+        if board is None:
+            board = self.boards[cls][test_name] = TestBoard(test_name)
+        self._seq += 1
+        board.add(key, parse_marks(marks), self._seq, s_id)
+        self.entries.setdefault(s_id, {})[key] = (cls, test_name)
+        self._view = None
+
+    def remove_student(self, student_id):
+        """Drop every score of one student, touching only the tests they sat"""
+        for key, (cls, test_name) in self.entries.pop(normalize_id(student_id), {}).items():
+            self._remove_entry(key, cls, test_name)
+        self._view = None
+
+    def _remove_entry(self, key, cls, test_name):
+        board = self.boards[cls].get(test_name)
+        if board:
+            board.remove(key)
+            if not board.scores:
+                del self.boards[cls][test_name]
+
+    def replace_student(self, student, tests):
+        """Re-file a student's scores after an edit (their class or marks may have changed)"""
+        student_id = student.get('id')
+        self.remove_student(student_id)
+        self.set_student(student)
+        for i, t in enumerate(tests):
+            self.add_score(('edit', normalize_id(student_id), i), student_id, t.get('name'), t.get('marks'))
+
+    def view(self):
+        """Leaderboard in the template's shape; names resolved from the current class lookup"""
+        if self._view is not None:
+            return self._view
+        final_leaderboard = {}
+        for cls in CLASS_KEYS:
+            tests = self.boards[cls]
+            if not tests: continue
+            final_leaderboard[cls] = []
+            for test_name, board in tests.items():
+                toppers = []
+                for marks, _, s_id in board.toppers():
+                    info = self.students.get(s_id)
+                    toppers.append({'name': info.get('name', s_id) if info else s_id, 'marks': marks})
+                final_leaderboard[cls].append({'test_name': test_name, 'toppers': toppers})
+        self._view = final_leaderboard
+        return final_leaderboard
@@ -14,6 +14,10 @@ from datetime import datetime, timedelta
 import os
 from youtube_service import yt_service
 from google_sheets_direct import init_sheets_service, get_sheets_service
+from partitions import PARTITION_BY_YEAR, current_year
+from response_cache import cacheable
+from static_assets import StaticAssets
+import metrics
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -22,6 +26,12 @@ app.config['SECRET_KEY'] = 'aswathama-classes-secret-key-secure'
 # Enable Gzip compression
 Compress(app)
 
+# Content-hashed static URLs served with immutable caching
+static_assets = StaticAssets(app)
+
+# Request timing, Server-Timing headers and the cross-worker /metrics endpoint
+metrics.init_app(app)
+
 # Initialize Google Sheets service
 init_sheets_service(app)
 
@@ -33,12 +43,12 @@ def authenticate_student(student_id, password):
         return None
     return service.authenticate_student(student_id, password)
 
-def get_student(student_id):
-    """Get student data from Google Sheets"""
+def get_student(student_id, year=None):
+    """Get student data from Google Sheets (`year` picks a past academic year partition)"""
     service = get_sheets_service()
     if not service:
         return None
-    student = service.get_student(student_id)
+    student = service.get_student(student_id, year) if year else service.get_student(student_id)
     if student and isinstance(student, dict):
         return student
     return None
@@ -46,11 +56,13 @@ def get_student(student_id):
 # ==================== ROUTES ====================
 
 @app.route('/')
+@cacheable
 def home():
     """Home page - Hero section with institute intro and CTA"""
     return render_template('index.html')
 
 @app.route('/about')
+@cacheable
 def about():
     """About page - Institute and founder details"""
     founder_data = {
@@ -65,6 +77,7 @@ def about():
     return render_template('about.html', founder=founder_data)
 
 @app.route('/courses')
+@cacheable
 def courses():
     """Courses page - Display available classes"""
     courses_data = [
@@ -94,6 +107,7 @@ def courses():
     return render_template('courses.html', courses=courses_data)
 
 @app.route('/admissions')
+@cacheable
 def admissions():
     """Admissions page - Admission details and requirements"""
     admission_steps = [
@@ -110,6 +124,7 @@ def admissions():
     return render_template('admissions.html', admission_steps=admission_steps, additional_info=additional_info)
 
 @app.route('/fees')
+@cacheable
 def fees():
     """Fees page - Fee structure information"""
     fees_list = [
@@ -126,6 +141,7 @@ def fees():
     return render_template('fees.html', fees=fees_list, notes=notes)
 
 @app.route('/gallery')
+@cacheable
 def gallery():
     """Gallery page - Image showcase"""
     gallery_items = [
@@ -148,9 +164,18 @@ def gallery():
 
 @app.route('/youtube')
 def youtube():
-    """YouTube page - Display latest videos"""
-    videos = yt_service.get_latest_videos(max_results=12) if yt_service.is_configured() else []
-    return render_template('youtube.html', videos=videos)
+    """YouTube page - Search and browse the channel catalogue"""
+    query = request.args.get('q', '').strip()[:100]
+    year = request.args.get('year', '').strip()[:4]
+    page = request.args.get('page', 1, type=int)
+    catalogue = yt_service.search_videos(query, year, page) if yt_service.is_configured() else None
+    if catalogue:
+        videos = catalogue['videos']
+    else:
+        # Catalogue not synced yet: fall back to the latest uploads feed
+        videos = yt_service.get_latest_videos(max_results=12) if yt_service.is_configured() else []
+    return render_template('youtube.html', videos=videos, catalogue=catalogue, query=query, year=year,
+                           configured=yt_service.is_configured())
 
 @app.route('/leaderboard')
 def leaderboard():
@@ -160,11 +185,13 @@ def leaderboard():
     return render_template('leaderboard.html', leaderboard_data=data)
 
 @app.route('/exams')
+@cacheable
 def exams():
     """Exams & Timetable page - Board exam schedules and countdowns"""
     return render_template('exams.html')
 
 @app.route('/instagram')
+@cacheable
 def instagram():
     """Instagram page - Link to Instagram profile"""
     return render_template('instagram.html')
@@ -195,19 +222,26 @@ def student_dashboard():
     if 'student_id' not in session:
         return redirect(url_for('student_login'))
     
-    student = get_student(session['student_id'])
+    # Earlier academic years are read from their own partitions only when asked for
+    year = request.args.get('year', type=int)
+    student = get_student(session['student_id'], year)
     
     if not student:
         session.clear()
         return redirect(url_for('student_login'))
     
+    service = get_sheets_service()
+    years = service.partition_years() if service and PARTITION_BY_YEAR else []
+
     # Class 10 students get the exam insights dashboard
     student_class = student.get('student_class') or student.get('class') or ''
     if 'Class 10' in student_class or '10' in student_class:
-        return render_template('class_10_dashboard.html', student=student)
+        return render_template('class_10_dashboard.html', student=student, years=years,
+                               year=year or current_year())
     
     # Classes 8 and 9 get the standard dashboard
-    return render_template('student_dashboard.html', student=student)
+    return render_template('student_dashboard.html', student=student, years=years,
+                           year=year or current_year())
 
 @app.route('/student/logout')
 def student_logout():
@@ -271,7 +305,7 @@ def teacher_updates():
             request.form.get('priority')
         ]
         if service:
-            service.updates_sheet.append_row(update_data)
+            service.add_update(update_data)
         return redirect(url_for('teacher_updates'))
     
     updates = service.get_active_updates() if service else []
@@ -347,7 +381,7 @@ def teacher_attendance():
     
     if request.method == 'POST':
         date = request.form.get('date', datetime.now().strftime('%Y-%m-%d'))
-        absent_ids = request.form.getlist('absent_students')
+        absent_ids = set(request.form.getlist('absent_students'))
         
         attendance_map = {}
         absentee_names = []
@@ -390,6 +424,21 @@ def teacher_attendance():
 
     return render_template('teacher_attendance.html', students=students, today=datetime.now().strftime('%Y-%m-%d'))
 
+@app.route('/teacher/attendance/report')
+def teacher_attendance_report():
+    """Class attendance report - daily rates per class, monthly trend and absence streaks"""
+    if not session.get('teacher_logged_in'):
+        return redirect(url_for('teacher_login'))
+
+    sessions = min(max(request.args.get('sessions', 30, type=int), 1), 366)
+    service = get_sheets_service()
+    try:
+        report = service.get_attendance_report() if service else None
+    except Exception as e:
+        print(f"Error building attendance report: {e}")
+        report = None
+    return render_template('teacher_attendance_report.html', report=report, sessions=sessions)
+
 @app.route('/teacher/tests', methods=['GET', 'POST'])
 def teacher_tests():
     if not session.get('teacher_logged_in'):
@@ -423,6 +472,7 @@ def teacher_logout():
     return redirect(url_for('teacher_login'))
 
 @app.route('/contact')
+@cacheable
 def contact():
     """Contact page - Address and contact form"""
     contact_data = {
@@ -504,8 +554,17 @@ def get_updates():
     service = get_sheets_service()
     if not service:
         return jsonify([])
-    updates = service.get_active_updates()
-    return jsonify(updates)
+    try:
+        updates, etag, last_modified = service.get_updates_feed()
+    except Exception as e:
+        print(f"Error fetching updates: {e}")
+        return jsonify([])
+    response = jsonify(updates)
+    response.set_etag(etag)
+    response.last_modified = int(last_modified)
+    # Clients keep their copy but revalidate each poll; unchanged feeds get a 304
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/manifest.json')
 def manifest():
@@ -513,9 +572,16 @@ def manifest():
 
 @app.route('/service-worker.js')
 def service_worker():
-    response = make_response(app.send_static_file('service-worker.js'))
+    """Service worker with a precache manifest generated from the asset hashes"""
+    response = make_response(render_template(
+        'service-worker.js',
+        version=static_assets.version,
+        precache_urls=static_assets.precache_urls(app.static_url_path)
+    ))
     response.headers['Content-Type'] = 'application/javascript'
     response.headers['Service-Worker-Allowed'] = '/'
+    # Browsers must see a new asset version as soon as it is deployed
+    response.cache_control.no_cache = True
     return response
 
 @app.route('/robots.txt')
@@ -0,0 +1,258 @@
+"""
+Metrics - Latency histograms, call and cache counters, Server-Timing headers
+Each worker counts in memory and adds its deltas to a shared SQLite file every
+few seconds, so /metrics (Prometheus text format) covers all gunicorn workers
+"""
+import contextlib
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+
+# Every metric the app records: name -> (type, help)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Flask request latency by endpoint'),
+    'http_requests_total': ('counter', 'Flask responses by endpoint and status'),
+    'sheets_api_duration_seconds': ('histogram', 'Google Sheets API call latency by method'),
+    'sheets_api_calls_total': ('counter', 'Google Sheets API calls by worksheet and method'),
+    'sheets_ratelimit_wait_seconds': ('histogram', 'Time spent waiting for a shared quota token'),
+    'youtube_api_duration_seconds': ('histogram', 'YouTube Data API call latency by resource'),
+    'apps_script_duration_seconds': ('histogram', 'Apps Script request latency by action'),
+    'quota_errors_total': ('counter', 'Quota (429 / quotaExceeded) errors by API'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result (hit or miss)'),
+    'sheets_rows_written_total': ('counter', 'Sheet rows changed by site writes by worksheet and action'),
+}
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Seconds between a worker's writes of its deltas to the shared file
+FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', '15'))
+
+_lock = threading.Lock()
+_pending = {}  # (metric, series name, rendered labels) -> delta since the last flush
+_flusher = {'pid': None}
+# Server-Timing entries of the request being handled: name -> [milliseconds, count]
+_timings = contextvars.ContextVar('server_timings', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+
+
+def _add(metric, name, labels, amount):
+    key = (metric, name, labels)
+    with _lock:
+        _pending[key] = _pending.get(key, 0.0) + amount
+    if _flusher['pid'] != os.getpid():
+        _start_flusher()
+
+
+def inc(metric, amount=1, **labels):
+    _add(metric, metric, _labels(labels), amount)
+
+
+def observe(metric, seconds, **labels):
+    rendered = _labels(labels)
+    bound = next((f'{b:g}' for b in LATENCY_BUCKETS if seconds <= b), '+Inf')
+    # Buckets are stored non-cumulatively (le last) and summed up when rendered
+    le = f'{rendered},le="{bound}"' if rendered else f'le="{bound}"'
+    with _lock:
+        for key, amount in (((metric, f'{metric}_bucket', le), 1.0),
+                            ((metric, f'{metric}_sum', rendered), seconds),
+                            ((metric, f'{metric}_count', rendered), 1.0)):
+            _pending[key] = _pending.get(key, 0.0) + amount
+    if _flusher['pid'] != os.getpid():
+        _start_flusher()
+
+
+def cache_lookup(cache, hit):
+    """Count one lookup of a named cache"""
+    inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def add_timing(name, seconds):
+    """Add to the current request's Server-Timing entry `name` (no-op outside requests)"""
+    timings = _timings.get()
+    if timings is not None:
+        entry = timings.setdefault(name, [0.0, 0])
+        entry[0] += seconds * 1000.0
+        entry[1] += 1
+
+
+@contextlib.contextmanager
+def timed(metric, timing=None, **labels):
+    """Observe the enclosed block's latency, optionally also as a Server-Timing entry"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(metric, elapsed, **labels)
+        if timing:
+            add_timing(timing, elapsed)
+
+
+class _Store:
+    def __init__(self):
+        from shared_cache import CACHE_DIR
+        self.path = os.path.join(CACHE_DIR, 'metrics.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS series (metric TEXT, name TEXT, labels TEXT, value REAL,"
+            " PRIMARY KEY (name, labels))"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add(self, deltas):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO series VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+                [(metric, name, labels, value) for (metric, name, labels), value in deltas.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def rows(self):
+        return self._conn().execute("SELECT metric, name, labels, value FROM series ORDER BY metric, name, labels")
+
+
+_store = None
+
+
+def _get_store():
+    global _store
+    if _store is None:
+        _store = _Store()
+    return _store
+
+
+def flush():
+    """Add this worker's counts to the shared file"""
+    global _pending
+    with _lock:
+        deltas, _pending = _pending, {}
+    if not deltas:
+        return
+    try:
+        _get_store().add(deltas)
+    except Exception as e:
+        # Keep the counts for the next attempt rather than losing them
+        with _lock:
+            for key, value in deltas.items():
+                _pending[key] = _pending.get(key, 0.0) + value
+        print(f"[WARNING] Metrics flush failed: {e}")
+
+
+def _start_flusher():
+    with _lock:
+        if _flusher['pid'] == os.getpid():
+            return
+        _flusher['pid'] = os.getpid()
+    threading.Thread(target=_flush_loop, name='metrics-flusher', daemon=True).start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _series(name, labels):
+    return f"{name}{{{labels}}}" if labels else name
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render():
+    """All workers' metrics in the Prometheus text exposition format"""
+    flush()
+    lines = []
+    by_metric = {}
+    for metric, name, labels, value in _get_store().rows():
+        by_metric.setdefault(metric, []).append((name, labels, value))
+    for metric, (kind, help_text) in METRICS.items():
+        series = by_metric.get(metric)
+        if not series:
+            continue
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        if kind != 'histogram':
+            lines += [f"{_series(name, labels)} {_number(value)}" for name, labels, value in series]
+            continue
+        # Stored buckets hold their own counts; Prometheus buckets are cumulative
+        buckets = {}
+        for name, labels, value in series:
+            if name.endswith('_bucket'):
+                base, _, bound = labels.rpartition('le="')
+                buckets.setdefault(base, {})[bound.rstrip('"')] = value
+        for base, counts in sorted(buckets.items()):
+            total = 0.0
+            for bound in [f'{b:g}' for b in LATENCY_BUCKETS] + ['+Inf']:
+                total += counts.get(bound, 0.0)
+                lines.append(f'{metric}_bucket{{{base}le="{bound}"}} {_number(total)}')
+        lines += [f"{_series(name, labels)} {_number(value)}" for name, labels, value in series
+                  if not name.endswith('_bucket')]
+    return '\n'.join(lines) + '\n'
+
+
+def server_timing_header(timings, total):
+    entries = [f'app;dur={total * 1000.0:.1f}']
+    for name, (ms, count) in timings.items():
+        entries.append(f'{name};dur={ms:.1f};desc="{count} call{"s" if count != 1 else ""}"')
+    return ', '.join(entries)
+
+
+def init_app(app):
+    """Time every request, add a Server-Timing header and serve GET /metrics"""
+    from flask import Response, g, request
+
+    token = os.getenv('METRICS_TOKEN', '')
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_token = _timings.set({})
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        observe('http_request_duration_seconds', elapsed, endpoint=endpoint, method=request.method)
+        inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+        response.headers['Server-Timing'] = server_timing_header(_timings.get() or {}, elapsed)
+        return response
+
+    @app.teardown_request
+    def _clear_timings(exc):
+        reset = g.pop('metrics_token', None)
+        if reset is not None:
+            _timings.reset(reset)
+
+    @app.route('/metrics')
+    def metrics():
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render(), mimetype='text/plain; version=0.0.4')
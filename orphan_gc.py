@@ -0,0 +1,53 @@
+"""
+Orphan GC - Purge Tests, Attendance and StudentAuth rows of deleted students
+Finds dependent rows (in every year partition too) whose StudentID no longer
+exists in Students and deletes them in one batchUpdate. Run it from a shell or
+a scheduler:
+
+    python orphan_gc.py [--dry-run]
+"""
+import argparse
+
+from shared_cache import get_shared_cache
+from google_sheets_direct import ATTENDANCE_LOCK, create_sheets_service
+
+# Seconds the Attendance lock is held for at most; queued upserts wait behind it
+GC_LEASE = 300
+
+
+def collect_orphans(service, dry_run=False):
+    """Delete (or with dry_run only report) orphaned rows; returns {title: [row numbers]}"""
+    shared = get_shared_cache()
+    if not shared.acquire_lease(ATTENDANCE_LOCK, GC_LEASE):
+        print("[WARNING] Attendance sheet is busy, orphan GC skipped")
+        return None
+    try:
+        snapshot = service._get_snapshot(force=True)
+        if not snapshot.student_positions:
+            # An empty or unreadable Students sheet would make every row look orphaned
+            print("[WARNING] No students loaded, orphan GC skipped")
+            return None
+        # Deleted students can still have rows in earlier years' partitions
+        orphans = snapshot.orphan_rows(service.past_partition_tables(snapshot))
+        for title, rows in orphans.items():
+            print(f"[INFO] {title}: {len(rows)} orphaned rows")
+        if not orphans:
+            print("[INFO] No orphaned rows found")
+        if dry_run or not orphans:
+            return orphans
+        service.delete_rows(orphans)
+        service._invalidate_snapshot()
+        return orphans
+    finally:
+        shared.release_lease(ATTENDANCE_LOCK)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help="report orphaned rows without deleting them")
+    args = parser.parse_args()
+    collect_orphans(create_sheets_service(start_background=False), args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Partition Migration - Split the Tests and Attendance sheets into academic-year tabs
+Every dated row of the base Tests/Attendance tabs is appended to its year's
+partition (Tests_2026, Attendance_2026, ...) and removed from the base tab in one
+batchUpdate. Rows without a readable date stay where they are. Set
+PARTITION_BY_YEAR=1 first (the site reads the partitions from then on), then run it:
+
+    python partition_migration.py [--dry-run]
+"""
+import argparse
+
+from partitions import PARTITIONED_SHEETS, PARTITION_BY_YEAR, academic_year, partition_title
+from sheets_batch import append_rows_request, delete_rows_requests
+from sheets_snapshot import load_tables
+from shared_cache import get_shared_cache
+from rate_limiter import call as api_call
+from google_sheets_direct import WORKSHEET_HEADERS, ATTENDANCE_LOCK, PARTITION_CACHE_KEY, create_sheets_service
+
+# Seconds the Attendance lock is held for at most; queued upserts wait behind it
+MIGRATION_LEASE = 600
+
+
+def plan_migration(tables):
+    """
+    {base sheet: {'years': {year: [rows]}, 'positions': [moved positions], 'undated': count}}
+    for the base tables, keeping each sheet's row order within a year
+    """
+    plan = {}
+    for sheet, table in tables.items():
+        entry = plan[sheet] = {'years': {}, 'positions': [], 'undated': 0}
+        date_idx = table.index('date')
+        for position, row in enumerate(table.rows):
+            if not any(row):
+                continue
+            year = academic_year(row[date_idx]) if date_idx != -1 else None
+            if year is None:
+                entry['undated'] += 1
+                continue
+            entry['years'].setdefault(year, []).append(row)
+            entry['positions'].append(position)
+    return plan
+
+
+def migrate(service, dry_run=False):
+    """Move dated base rows into their year partitions; returns the plan"""
+    shared = get_shared_cache()
+    # Attendance upserts address rows by number, so none may run while rows move
+    if not shared.acquire_lease(ATTENDANCE_LOCK, MIGRATION_LEASE):
+        print("[WARNING] Attendance sheet is busy, migration skipped")
+        return None
+    try:
+        tables = load_tables(service.spreadsheet, PARTITIONED_SHEETS, call=api_call)
+        plan = plan_migration(tables)
+        for sheet, entry in plan.items():
+            years = ", ".join(f"{partition_title(sheet, y)}: {len(rows)}" for y, rows in sorted(entry['years'].items()))
+            print(f"[INFO] {sheet}: {len(entry['positions'])} rows to move ({years or 'none'}), "
+                  f"{entry['undated']} undated rows stay")
+        if dry_run or not any(entry['positions'] for entry in plan.values()):
+            return plan
+        if not PARTITION_BY_YEAR:
+            # The site would still read the base tabs and show no tests or attendance
+            print("[ERROR] Set PARTITION_BY_YEAR=1 before migrating, nothing moved")
+            return None
+
+        worksheets = service.add_worksheets({
+            partition_title(sheet, year): WORKSHEET_HEADERS[sheet]
+            for sheet, entry in plan.items() for year in entry['years']
+        })
+        requests = []
+        for sheet, entry in plan.items():
+            for year, rows in sorted(entry['years'].items()):
+                requests.append(append_rows_request(worksheets[partition_title(sheet, year)].id, rows))
+            requests += delete_rows_requests(worksheets[sheet].id,
+                                             [tables[sheet].row_number(p) for p in entry['positions']])
+        service._batch_update(requests)
+
+        for year in {y for entry in plan.values() for y in entry['years']}:
+            shared.delete(PARTITION_CACHE_KEY.format(year))
+        service._invalidate_snapshot()
+        print("[INFO] Partition migration complete")
+        return plan
+    finally:
+        shared.release_lease(ATTENDANCE_LOCK)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help="report what would move without writing")
+    args = parser.parse_args()
+    migrate(create_sheets_service(start_background=False), args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Sheet Partitions - Per-academic-year worksheets for Tests and Attendance
+With PARTITION_BY_YEAR set, rows live in tabs such as Tests_2026 and Attendance_2026:
+writes go to the current year's tab and the snapshot reads only that year
+"""
+import os
+import re
+from datetime import date, datetime
+
+# Logical worksheets split into one tab per academic year
+PARTITIONED_SHEETS = ["Tests", "Attendance"]
+PARTITION_BY_YEAR = os.getenv('PARTITION_BY_YEAR', '').strip().lower() in ('1', 'true', 'yes')
+# Month the academic year starts in; the 2026 year runs from this month of 2026
+YEAR_START_MONTH = int(os.getenv('ACADEMIC_YEAR_START_MONTH', '4'))
+PARTITION_RE = re.compile(r'^(%s)_(\d{4})$' % '|'.join(PARTITIONED_SHEETS))
+
+
+def academic_year(value=None):
+    """Academic year of a date or 'YYYY-MM-DD' string (today by default); None if unreadable"""
+    if value is None:
+        value = date.today()
+    elif not isinstance(value, date):
+        try:
+            value = datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+        except ValueError:
+            return None
+    return value.year if value.month >= YEAR_START_MONTH else value.year - 1
+
+
+def month_year(month):
+    """Academic year of a 'YYYY-MM' month, or None"""
+    return academic_year(f"{str(month).strip()}-01")
+
+
+def partition_title(sheet, year):
+    return f"{sheet}_{year}"
+
+
+def parse_partition(title):
+    """(logical sheet, year) for a partition tab title, or None"""
+    match = PARTITION_RE.match(str(title))
+    return (match.group(1), int(match.group(2))) if match else None
+
+
+def current_year():
+    """The year the snapshot is scoped to, or None when partitioning is off"""
+    return academic_year() if PARTITION_BY_YEAR else None
+
+
+def partition_routes(year=None):
+    """Logical sheet -> tab that holds `year` (the current year by default); empty when off"""
+    if not PARTITION_BY_YEAR:
+        return {}
+    year = year or academic_year()
+    return {sheet: partition_title(sheet, year) for sheet in PARTITIONED_SHEETS}
+
+
+def partition_years(titles):
+    """Academic years that have at least one partition tab among `titles`, oldest first"""
+    return sorted({parsed[1] for parsed in map(parse_partition, titles) if parsed})
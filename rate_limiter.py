@@ -0,0 +1,204 @@
+"""
+Rate Limiter - One call wrapper for every Google Sheets API request
+Token bucket shared across gunicorn workers, priority lanes and
+exponential backoff with jitter on quota (429) and transient server errors
+"""
+import contextlib
+import contextvars
+import functools
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import metrics
+from shared_cache import CACHE_DIR
+
+# Sheets allows 60 requests per minute per user; stay a little under it
+QUOTA_PER_MINUTE = int(os.environ.get('SHEETS_QUOTA_PER_MINUTE', '55'))
+
+# Priority lanes: teacher writes and logins first, background refreshes last
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+LANE_NAMES = {PRIORITY_HIGH: 'high', PRIORITY_NORMAL: 'normal', PRIORITY_LOW: 'low'}
+
+# Share of the bucket a lane must leave untouched for the lanes above it
+LANE_RESERVE = {PRIORITY_HIGH: 0.0, PRIORITY_NORMAL: 0.2, PRIORITY_LOW: 0.5}
+# Longest a call waits for a token before it fails with RateLimited
+LANE_MAX_WAIT = {PRIORITY_HIGH: 15, PRIORITY_NORMAL: 5, PRIORITY_LOW: 2}
+LANE_MAX_ATTEMPTS = {PRIORITY_HIGH: 5, PRIORITY_NORMAL: 3, PRIORITY_LOW: 2}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Calls that may have run when a 5xx or timeout comes back; only a 429 is safe to resend
+NON_IDEMPOTENT_METHODS = {'append_row', 'append_rows'}
+NON_IDEMPOTENT_REQUESTS = ('appendCells', 'deleteDimension')
+BACKOFF_BASE = 1
+BACKOFF_MAX = 32
+
+_priority = contextvars.ContextVar('sheets_priority', default=PRIORITY_NORMAL)
+
+
+class RateLimited(Exception):
+    """Raised when no quota token came within the lane's max wait"""
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Run the enclosed Sheets calls in the given lane"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def high_priority(fn):
+    """Decorator for service methods on the login / teacher-write path"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with priority(PRIORITY_HIGH):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class TokenBucket:
+    """Token bucket stored in the shared SQLite file so all workers draw from one quota"""
+
+    def __init__(self, name, per_minute, path=None):
+        self.name = name
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.path = path or os.path.join(CACHE_DIR, 'shared_cache.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._conn().execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _try_take(self, floor):
+        """Take one token if that leaves at least `floor`; otherwise return seconds to wait"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+            wait = 0.0
+            if tokens - 1 >= floor:
+                tokens -= 1
+            else:
+                wait = (floor + 1 - tokens) / self.rate
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                         (self.name, tokens, now))
+            conn.execute("COMMIT")
+            return wait
+        except Exception as e:
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            # Never block the site because the limiter itself is unavailable
+            print(f"[WARNING] Rate limiter unavailable, proceeding: {e}")
+            return 0.0
+
+    def acquire(self, level):
+        """Wait for a token in the given lane; False if none came within the lane's max wait"""
+        floor = self.capacity * LANE_RESERVE[level]
+        deadline = time.time() + LANE_MAX_WAIT[level]
+        while True:
+            wait = self._try_take(floor)
+            if wait <= 0:
+                return True
+            if time.time() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+_bucket = None
+_bucket_lock = threading.Lock()
+
+
+def get_bucket():
+    global _bucket
+    if _bucket is None:
+        with _bucket_lock:
+            if _bucket is None:
+                _bucket = TokenBucket('sheets', QUOTA_PER_MINUTE)
+    return _bucket
+
+
+def error_status(e):
+    """HTTP status of a gspread/requests error, if it has one"""
+    status = getattr(getattr(e, 'response', None), 'status_code', None)
+    if status is None and '429' in str(e):
+        status = 429
+    return status
+
+
+def is_retryable(e):
+    # requests' connection errors and timeouts are OSError subclasses
+    return error_status(e) in RETRY_STATUSES or isinstance(e, OSError)
+
+
+def is_idempotent(method, args):
+    """False for appends and row deletes, which a resend would apply twice"""
+    if method in NON_IDEMPOTENT_METHODS:
+        return False
+    if method == 'batch_update' and args and isinstance(args[0], dict):
+        return not any(kind in request for request in args[0].get('requests', [])
+                       for kind in NON_IDEMPOTENT_REQUESTS)
+    return True
+
+
+def _call_labels(fn):
+    """(worksheet, method) of a bound gspread method for the call metrics"""
+    owner = getattr(fn, '__self__', None)
+    # Worksheet methods carry their tab; spreadsheet and client calls are labelled by type
+    if owner is None:
+        worksheet = ''
+    else:
+        worksheet = owner.title if hasattr(owner, 'spreadsheet') else type(owner).__name__.lower()
+    return worksheet, getattr(fn, '__name__', str(fn))
+
+
+def call(fn, *args, **kwargs):
+    """Run one Sheets API call under the shared quota with retries"""
+    level = _priority.get()
+    attempts = LANE_MAX_ATTEMPTS[level]
+    worksheet, method = _call_labels(fn)
+    idempotent = is_idempotent(method, args)
+    for attempt in range(attempts):
+        start = time.perf_counter()
+        acquired = get_bucket().acquire(level)
+        waited = time.perf_counter() - start
+        metrics.observe('sheets_ratelimit_wait_seconds', waited, lane=LANE_NAMES[level])
+        if waited > 0.001:
+            metrics.add_timing('quota-wait', waited)
+        if not acquired:
+            # Going ahead anyway would overdraw the quota every worker shares
+            raise RateLimited(f"No Sheets quota within {LANE_MAX_WAIT[level]}s ({LANE_NAMES[level]} lane)")
+        metrics.inc('sheets_api_calls_total', worksheet=worksheet, method=method)
+        try:
+            with metrics.timed('sheets_api_duration_seconds', 'sheets', method=method):
+                return fn(*args, **kwargs)
+        except Exception as e:
+            if error_status(e) == 429:
+                metrics.inc('quota_errors_total', api='sheets')
+            # A 429 was rejected before it ran; anything else may have applied an append or delete
+            retry = is_retryable(e) and (idempotent or error_status(e) == 429)
+            if not retry or attempt == attempts - 1:
+                raise
+            # Full jitter keeps the four workers from retrying in lockstep
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+            print(f"[WARNING] Sheets call {getattr(fn, '__name__', fn)} failed ({error_status(e) or type(e).__name__}), "
+                  f"retry {attempt + 1}/{attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
@@ -0,0 +1,74 @@
+"""
+Background Refresher - Stale-while-revalidate for the sheets snapshot and derived views
+Each worker runs one thread that reloads the snapshot before a view's freshness target
+runs out, so requests are served the last good copy without paying the fetch themselves.
+Only views read since their last refresh are kept warm; an idle site spends no quota
+"""
+import os
+import threading
+import time
+
+import rate_limiter
+from rate_limiter import PRIORITY_LOW, RateLimited
+
+# Seconds each view may age before a background refresh is due
+FRESHNESS = {
+    'students': int(os.environ.get('SHEETS_FRESHNESS_STUDENTS', '30')),
+    'leaderboard': int(os.environ.get('SHEETS_FRESHNESS_LEADERBOARD', '60')),
+    'updates': int(os.environ.get('SHEETS_FRESHNESS_UPDATES', '60')),
+}
+# Past this age a request blocks on a reload instead of serving the stale copy
+MAX_STALENESS = int(os.environ.get('SHEETS_MAX_STALENESS', '300'))
+# Start refreshing at this fraction of the freshness target, ahead of expiry
+REFRESH_AHEAD = 0.8
+
+
+class BackgroundRefresher:
+    def __init__(self, service):
+        self.service = service
+        self._wakeup = threading.Event()
+        self._thread = None
+        # {view: time} of the last request read and the last refresh of each view
+        self._read_at = {}
+        self._refreshed_at = {}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='sheets-refresher', daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Ask for a refresh now (called when a request sees an expired view)"""
+        self._wakeup.set()
+
+    def touch(self, view):
+        """Note that a request read `view`, so it is kept warm until the next refresh"""
+        self._read_at[view] = time.time()
+
+    def _read_views(self):
+        """Views read by a request since their last refresh"""
+        return [view for view, read_at in list(self._read_at.items()) if read_at > self._refreshed_at.get(view, 0)]
+
+    def _run(self):
+        # Wake often enough to refresh the tightest view ahead of expiry
+        tick = max(1, min(FRESHNESS.values()) * (1 - REFRESH_AHEAD))
+        while True:
+            self._wakeup.wait(tick)
+            self._wakeup.clear()
+            views = self._read_views()
+            if not views:
+                continue
+            try:
+                # Refreshes yield the Sheets quota to logins and teacher writes
+                with rate_limiter.priority(PRIORITY_LOW):
+                    refreshed = self.service._refresh_views(
+                        {view: FRESHNESS.get(view, FRESHNESS['students']) * REFRESH_AHEAD for view in views})
+                # Stamped after the refresh, so its own snapshot reads do not count as requests
+                now = time.time()
+                for view in refreshed:
+                    self._refreshed_at[view] = now
+            except RateLimited:
+                pass
+            except Exception as e:
+                print(f"[ERROR] Background refresh failed: {e}")
@@ -0,0 +1,100 @@
+"""
+Response Cache - Rendered marketing pages kept in memory with precompressed variants
+Each page is rendered once per deploy and served as identity, gzip or brotli with a strong ETag
+"""
+import functools
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import Response, current_app, request, session
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Pages may not vary for logged-in visitors; base.html shows their nav links
+SESSION_KEYS = ('student_id', 'teacher_logged_in')
+# Bounds the cache if clients send arbitrary Host headers
+MAX_PAGES = 64
+
+
+def _deploy_id():
+    """DEPLOY_ID from the environment, else a fingerprint of the code and templates"""
+    deploy_id = os.environ.get('DEPLOY_ID', '').strip()
+    if deploy_id:
+        return deploy_id
+    digest = hashlib.sha1()
+    for root in (os.path.join(BASE_DIR, 'templates'), BASE_DIR):
+        for name in sorted(os.listdir(root)):
+            path = os.path.join(root, name)
+            if name.endswith(('.html', '.py')) and os.path.isfile(path):
+                stat = os.stat(path)
+                digest.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+    return digest.hexdigest()[:12]
+
+
+DEPLOY_ID = _deploy_id()
+
+
+class CachedPage:
+    def __init__(self, body, content_type):
+        self.content_type = content_type
+        # A deploy changes every ETag, so browsers never keep a page across releases
+        tag = f"{DEPLOY_ID}-{hashlib.sha1(body).hexdigest()[:16]}"
+        # Strong ETags must differ per encoding, so each variant gets its own
+        self.variants = {None: (body, tag)}
+        self.variants['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f"{tag}-gz")
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(body, quality=11), f"{tag}-br")
+
+    def choose(self, accept_encodings):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings[encoding]:
+                return encoding
+        return None
+
+    def respond(self):
+        encoding = self.choose(request.accept_encodings)
+        body, etag = self.variants[encoding]
+        response = Response(body, content_type=self.content_type)
+        if encoding:
+            # An existing Content-Encoding also stops Flask-Compress from compressing again
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+_pages = {}
+_lock = threading.Lock()
+
+
+def cacheable(view):
+    """Serve an anonymous GET of this route from the rendered-page cache"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if (request.method != 'GET' or request.query_string or current_app.debug
+                or any(session.get(key) for key in SESSION_KEYS)):
+            return view(*args, **kwargs)
+        # The host is part of the key because templates render request.url
+        key = (request.host_url, request.path)
+        page = _pages.get(key)
+        metrics.cache_lookup('rendered_page', page is not None)
+        if page is None:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            page = CachedPage(response.get_data(), response.content_type)
+            with _lock:
+                if len(_pages) < MAX_PAGES:
+                    _pages[key] = page
+        return page.respond()
+    return wrapper
@@ -0,0 +1,173 @@
+"""
+Shared Cache - SQLite file under the instance dir that every gunicorn worker reads from
+One worker holds a short refresh lease and fetches; the others reuse its parsed result
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import metrics
+
+CACHE_DIR = os.environ.get(
+    'SHARED_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+)
+
+
+class SharedCache:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'shared_cache.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, stored_at REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+
+    def _conn(self):
+        """One connection per thread and process (gunicorn forks after import)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _owner(self):
+        return f"{os.getpid()}:{threading.get_ident()}"
+
+    def stored_at(self, key):
+        """When `key` was last written, without unpickling the value (0 if missing)"""
+        row = self._conn().execute("SELECT stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def get(self, key):
+        """Return (value, stored_at) or (None, 0) when the key is missing"""
+        try:
+            row = self._conn().execute("SELECT value, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None, 0
+            return pickle.loads(row[0]), row[1]
+        except Exception as e:
+            print(f"[WARNING] Shared cache read failed for {key}: {e}")
+            return None, 0
+
+    def set(self, key, value):
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO entries (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time())
+            )
+        except Exception as e:
+            print(f"[WARNING] Shared cache write failed for {key}: {e}")
+
+    def _publish(self, key, value, started):
+        """Store a loader result stamped with its start time, unless a later load already landed"""
+        try:
+            self._conn().execute(
+                "INSERT INTO entries (key, value, stored_at) VALUES (?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value, stored_at = excluded.stored_at"
+                " WHERE excluded.stored_at >= entries.stored_at",
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), started)
+            )
+        except Exception as e:
+            print(f"[WARNING] Shared cache write failed for {key}: {e}")
+
+    def delete(self, key):
+        try:
+            self._conn().execute("DELETE FROM entries WHERE key = ?", (key,))
+        except Exception as e:
+            print(f"[WARNING] Shared cache delete failed for {key}: {e}")
+
+    def acquire_lease(self, key, ttl):
+        """Elect this worker as the refresher for `key` for up to `ttl` seconds"""
+        conn = self._conn()
+        now = time.time()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+            if row and row[1] > now and row[0] != self._owner():
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, self._owner(), now + ttl)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception as e:
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            print(f"[WARNING] Shared cache lease failed for {key}: {e}")
+            return False
+
+    def release_lease(self, key):
+        try:
+            self._conn().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self._owner()))
+        except Exception:
+            pass
+
+    def fetch(self, key, max_age, loader, lease_ttl=30, wait_timeout=10):
+        """
+        Return the shared value for `key` if younger than `max_age` seconds.
+        Otherwise one worker runs `loader()` and publishes the result while the
+        others wait for it (or fall back to the stale copy). A loader result of
+        None is treated as a failed fetch and is not stored.
+
+        `max_age=0` forces a load: it must see every write made before the call,
+        so it never waits for (or returns) a load another worker already started.
+        """
+        value, stored_at = self.get(key)
+        fresh_enough = value is not None and time.time() - stored_at < max_age
+        # Labelled by key family ('sheets_partition:2025' counts as 'sheets_partition')
+        metrics.cache_lookup(f"shared:{key.split(':')[0]}", fresh_enough)
+        if fresh_enough:
+            return value
+
+        started = time.time()
+        if max_age <= 0:
+            fresh = loader()
+            if fresh is not None:
+                self._publish(key, fresh, started)
+            return fresh
+
+        if self.acquire_lease(key, lease_ttl):
+            try:
+                fresh = loader()
+                if fresh is not None:
+                    self._publish(key, fresh, started)
+                    return fresh
+                return value
+            finally:
+                self.release_lease(key)
+
+        # Another worker is refreshing - wait for its result
+        deadline = time.time() + wait_timeout
+        while time.time() < deadline:
+            time.sleep(0.1)
+            if self.stored_at(key) > stored_at:
+                fresh, _ = self.get(key)
+                if fresh is not None:
+                    return fresh
+        if value is not None:
+            return value
+        return loader()
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """Process-wide SharedCache, created on first use"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = SharedCache()
+    return _shared_cache
@@ -0,0 +1,96 @@
+"""
+Sheets Batch Helpers - Build spreadsheets.batchUpdate requests from row diffs
+Lets a multi-row edit go out as one API call instead of one call per row
+"""
+
+
+def _cell(value):
+    # Matches gspread's default RAW input: everything is stored as entered text
+    return {'userEnteredValue': {'stringValue': '' if value is None else str(value)}}
+
+
+def _clean(value):
+    return '' if value is None else str(value).strip()
+
+
+def diff_rows(existing, desired):
+    """
+    Compare a block of sheet rows against the rows that should exist.
+
+    `existing` is a list of (row_number, values) and `desired` a list of value lists.
+    Identical rows are left alone; the remaining rows are paired in order and only
+    differing cells are rewritten. Returns (cell_updates, row_deletes, row_appends)
+    where cell_updates is a list of (row_number, column_index, value).
+    """
+    width = max([len(values) for values in desired] or [0])
+    pool = {}
+    for i, values in enumerate(desired):
+        pool.setdefault(tuple(_clean(v) for v in values), []).append(i)
+
+    matched = set()
+    leftovers = []
+    for row_number, values in existing:
+        candidates = pool.get(tuple(_clean(v) for v in values[:width]))
+        if width and candidates:
+            matched.add(candidates.pop(0))
+        else:
+            leftovers.append((row_number, values))
+
+    new_rows = [values for i, values in enumerate(desired) if i not in matched]
+    updates = []
+    for (row_number, values), target in zip(leftovers, new_rows):
+        for col, value in enumerate(target):
+            if col >= len(values) or _clean(values[col]) != _clean(value):
+                updates.append((row_number, col, value))
+    deletes = [row_number for row_number, _ in leftovers[len(new_rows):]]
+    appends = new_rows[len(leftovers):]
+    return updates, deletes, appends
+
+
+def update_cell_request(sheet_id, row_number, col, value):
+    return {'updateCells': {
+        'range': {
+            'sheetId': sheet_id,
+            'startRowIndex': row_number - 1, 'endRowIndex': row_number,
+            'startColumnIndex': col, 'endColumnIndex': col + 1
+        },
+        'rows': [{'values': [_cell(value)]}],
+        'fields': 'userEnteredValue'
+    }}
+
+
+def delete_rows_requests(sheet_id, row_numbers):
+    """deleteDimension requests, bottom-up and merged into contiguous ranges"""
+    requests = []
+    rows = sorted(set(row_numbers), reverse=True)
+    i = 0
+    while i < len(rows):
+        end = rows[i]
+        start = end
+        while i + 1 < len(rows) and rows[i + 1] == start - 1:
+            i += 1
+            start = rows[i]
+        requests.append({'deleteDimension': {'range': {
+            'sheetId': sheet_id, 'dimension': 'ROWS',
+            'startIndex': start - 1, 'endIndex': end
+        }}})
+        i += 1
+    return requests
+
+
+def append_rows_request(sheet_id, rows):
+    return {'appendCells': {
+        'sheetId': sheet_id,
+        'rows': [{'values': [_cell(v) for v in row]} for row in rows],
+        'fields': 'userEnteredValue'
+    }}
+
+
+def diff_requests(sheet_id, existing, desired):
+    """Requests that turn `existing` rows into `desired` (updates, then deletes, then appends)"""
+    updates, deletes, appends = diff_rows(existing, desired)
+    requests = [update_cell_request(sheet_id, r, c, v) for r, c, v in updates]
+    requests += delete_rows_requests(sheet_id, deletes)
+    if appends:
+        requests.append(append_rows_request(sheet_id, appends))
+    return requests
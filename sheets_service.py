@@ -5,6 +5,7 @@ import os
 import json
 import requests
 from datetime import datetime
+import metrics
 
 class SheetsService:
     def __init__(self, app_script_url=None):
@@ -18,12 +19,15 @@ class SheetsService:
             url = f"{self.app_script_url}?action={action}"
             print(f"[DEBUG] {method} request to: {url[:80]}...")
             
-            if method == 'GET':
-                response = requests.get(url, timeout=10)
-            else:
-                response = requests.post(url, json=data, timeout=10)
+            with metrics.timed('apps_script_duration_seconds', 'apps-script', action=action):
+                if method == 'GET':
+                    response = requests.get(url, timeout=10)
+                else:
+                    response = requests.post(url, json=data, timeout=10)
             
             print(f"[DEBUG] Response status: {response.status_code}")
+            if response.status_code == 429:
+                metrics.inc('quota_errors_total', api='apps_script')
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -0,0 +1,270 @@
+"""
+Sheets Snapshot - Loads every worksheet in one batched values request
+Parses the raw values once into tables that all read methods share
+"""
+import time
+from datetime import datetime
+
+from partitions import current_year, month_year
+
+# Worksheets pulled together in a single values.batchGet call
+SNAPSHOT_SHEETS = ["Students", "StudentAuth", "Tests", "Attendance", "Updates", "AttendanceSummary"]
+
+
+def normalize_id(value):
+    """Canonical form of a StudentID used as an index key"""
+    return str(value).strip().lower()
+
+
+def date_month(value):
+    """'YYYY-MM' of a 'YYYY-MM-DD' date, or None if it does not parse"""
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').strftime('%Y-%m')
+    except ValueError:
+        return None
+
+
+def normalize_credential(value):
+    """Usernames and passwords are compared with all whitespace removed, case-insensitively"""
+    return "".join(str(value).split()).lower()
+
+
+class SheetTable:
+    """Parsed rows of one worksheet with normalized (stripped, lowercased) headers"""
+
+    def __init__(self, title, values):
+        self.title = title
+        values = values or []
+        self.headers = [str(h).strip().lower() for h in values[0]] if values else []
+        width = max([len(self.headers)] + [len(row) for row in values[1:]]) if values else 0
+        # Pad rows like get_all_values() does so column lookups never go out of range
+        self.rows = [row + [''] * (width - len(row)) for row in values[1:]]
+        self._records = None
+
+    def index(self, column):
+        """Column position of a normalized header name, or -1 if missing"""
+        return self.headers.index(column) if column in self.headers else -1
+
+    def record(self, row):
+        return {self.headers[i]: row[i] for i in range(len(self.headers)) if i < len(row)}
+
+    def row_number(self, position):
+        """1-based sheet row of the data row at `position` (the header is row 1)"""
+        return position + 2
+
+    def group_by(self, column):
+        """Map normalized values of `column` to the positions of the rows holding them"""
+        groups = {}
+        col_idx = self.index(column)
+        if col_idx == -1:
+            return groups
+        for position, row in enumerate(self.rows):
+            groups.setdefault(normalize_id(row[col_idx]), []).append(position)
+        return groups
+
+    def records(self):
+        """All non-empty rows as header -> value dicts (parsed once per snapshot)"""
+        if self._records is None:
+            self._records = [self.record(row) for row in self.rows if row and any(row)]
+        return self._records
+
+
+class SheetsSnapshot:
+    """Point-in-time copy of all worksheets the site reads from"""
+
+    def __init__(self, tables, year=None):
+        self.tables = tables
+        self.loaded_at = time.time()
+        # Academic year the Tests/Attendance tables hold when sheets are partitioned (else None)
+        self.year = year or current_year()
+        self.students = tables.get("Students") or SheetTable("Students", [])
+        self.auth = tables.get("StudentAuth") or SheetTable("StudentAuth", [])
+        self.tests = tables.get("Tests") or SheetTable("Tests", [])
+        self.attendance = tables.get("Attendance") or SheetTable("Attendance", [])
+        self.updates = tables.get("Updates") or SheetTable("Updates", [])
+        # Present/total counts per student per month for compacted attendance
+        self.attendance_summary = tables.get("AttendanceSummary") or SheetTable("AttendanceSummary", [])
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """Hash indexes keyed by normalized StudentID, built once per load"""
+        self.student_positions = {}
+        id_idx = self.students.index('id')
+        if id_idx != -1:
+            for position, row in enumerate(self.students.rows):
+                # First match wins, like the old linear scan
+                self.student_positions.setdefault(normalize_id(row[id_idx]), position)
+        self.tests_by_student = self.tests.group_by('studentid')
+        self.attendance_by_student = self.attendance.group_by('studentid')
+        self.summary_by_student = self.attendance_summary.group_by('studentid')
+        month_idx = self.attendance_summary.index('month')
+        if self.year and month_idx != -1:
+            # The summary tab spans every year; keep the months of this snapshot's year
+            rows = self.attendance_summary.rows
+            in_year = {}
+            for key, positions in self.summary_by_student.items():
+                kept = [p for p in positions if month_year(rows[p][month_idx]) == self.year]
+                if kept:
+                    in_year[key] = kept
+            self.summary_by_student = in_year
+        self._build_credential_index()
+
+    def _build_credential_index(self):
+        """normalized username -> [(normalized password, student ID)] for StudentAuth and Students"""
+        self.credentials = {}
+        self.auth_rows = {}
+        for position, row in enumerate(self.auth.rows):
+            if len(row) < 2: continue
+            user = normalize_credential(row[0])
+            student_id = row[2] if len(row) > 2 else row[0]
+            self.credentials.setdefault(user, []).append((normalize_credential(row[1]), student_id))
+            self.auth_rows.setdefault(user, self.auth.row_number(position))
+
+        # Fallback logins by student name and password from the Students sheet
+        self.student_credentials = {}
+        for student in self.students.records():
+            user = normalize_credential(student.get('name', ''))
+            self.student_credentials.setdefault(user, []).append(
+                (normalize_credential(student.get('password', '')), student.get('id')))
+
+    def find_login(self, username, password):
+        """Student ID for a username/password pair, or None"""
+        user = normalize_credential(username)
+        secret = normalize_credential(password)
+        for index in (self.credentials, self.student_credentials):
+            for stored_secret, student_id in index.get(user, []):
+                if stored_secret == secret:
+                    return student_id
+        return None
+
+    def set_credential(self, username, password, student_id):
+        """Apply a StudentAuth write to the index in place (first row for the username)"""
+        user = normalize_credential(username)
+        entry = (normalize_credential(password), str(student_id))
+        if self.credentials.get(user):
+            self.credentials[user][0] = entry
+        else:
+            self.credentials[user] = [entry]
+
+    def attendance_positions(self, student_id, date):
+        """Positions of the Attendance rows for one (StudentID, Date) pair, oldest first"""
+        if getattr(self, '_attendance_keys', None) is None:
+            keys = {}
+            date_idx = self.attendance.index('date')
+            if date_idx != -1:
+                for sid, positions in self.attendance_by_student.items():
+                    for position in positions:
+                        keys.setdefault((sid, str(self.attendance.rows[position][date_idx]).strip()), []).append(position)
+            self._attendance_keys = keys
+        return self._attendance_keys.get((normalize_id(student_id), str(date).strip()), [])
+
+    def student_attendance_summary(self, student_id):
+        """(present, total) over the compacted months of one student"""
+        table = self.attendance_summary
+        present_idx, total_idx = table.index('present'), table.index('total')
+        present = total = 0
+        if -1 in (present_idx, total_idx):
+            return present, total
+        for position in self.summary_by_student.get(normalize_id(student_id), []):
+            row = table.rows[position]
+            try:
+                present += int(row[present_idx])
+                total += int(row[total_idx])
+            except (ValueError, IndexError):
+                continue
+        return present, total
+
+    def summary_position(self, student_id, month):
+        """Position of the AttendanceSummary row for one student and 'YYYY-MM' month, or None"""
+        if getattr(self, '_summary_keys', None) is None:
+            keys = {}
+            table = self.attendance_summary
+            sid_idx, month_idx = table.index('studentid'), table.index('month')
+            if -1 not in (sid_idx, month_idx, table.index('present'), table.index('total')):
+                for position, row in enumerate(table.rows):
+                    keys.setdefault((normalize_id(row[sid_idx]), str(row[month_idx]).strip()), position)
+            self._summary_keys = keys
+        return self._summary_keys.get((normalize_id(student_id), month))
+
+    def _auth_positions(self):
+        """normalized StudentID -> StudentAuth positions (rows without a StudentID column are skipped)"""
+        positions = {}
+        for position, row in enumerate(self.auth.rows):
+            if len(row) > 2 and str(row[2]).strip():
+                positions.setdefault(normalize_id(row[2]), []).append(position)
+        return positions
+
+    def _dependents(self):
+        """(table, normalized StudentID -> positions) for every sheet keyed by StudentID"""
+        return [
+            (self.tests, self.tests_by_student),
+            (self.attendance, self.attendance_by_student),
+            (self.attendance_summary, self.summary_by_student),
+            (self.auth, self._auth_positions()),
+        ]
+
+    def _with(self, tables):
+        """Dependent sheets plus extra tables (e.g. past partitions) keyed by StudentID"""
+        return self._dependents() + [(table, table.group_by('studentid')) for table in tables]
+
+    def dependent_rows(self, student_id, tables=()):
+        """Sheet title -> row numbers of one student's Tests, Attendance, summary and login rows"""
+        key = normalize_id(student_id)
+        rows = {}
+        for table, index in self._with(tables):
+            if index.get(key):
+                rows[table.title] = [table.row_number(p) for p in index[key]]
+        return rows
+
+    def orphan_rows(self, tables=()):
+        """Sheet title -> row numbers of dependent rows whose StudentID is not in Students"""
+        rows = {}
+        for table, index in self._with(tables):
+            orphans = [table.row_number(p) for key, positions in index.items()
+                       if key and key not in self.student_positions for p in positions]
+            if orphans:
+                rows[table.title] = sorted(orphans)
+        return rows
+
+    def student_row_number(self, student_id):
+        """Sheet row number of a student in the Students sheet, or None"""
+        position = self.student_positions.get(normalize_id(student_id))
+        return self.students.row_number(position) if position is not None else None
+
+    def student_record(self, student_id):
+        position = self.student_positions.get(normalize_id(student_id))
+        return self.students.record(self.students.rows[position]) if position is not None else None
+
+    def student_tests(self, student_id):
+        return [self.tests.record(self.tests.rows[p]) for p in self.tests_by_student.get(normalize_id(student_id), [])]
+
+    def student_attendance(self, student_id):
+        return [self.attendance.record(self.attendance.rows[p]) for p in self.attendance_by_student.get(normalize_id(student_id), [])]
+
+    def age(self):
+        return time.time() - self.loaded_at
+
+
+def load_tables(spreadsheet, titles, call=None, routes=None):
+    """
+    Fetch worksheets with one values.batchGet request. `routes` maps a logical sheet
+    to the tab actually read (its year partition); tables stay keyed by logical name.
+    """
+    routes = routes or {}
+    titles = list(titles)
+    ranges = [f"'{routes.get(title, title)}'" for title in titles]
+    response = call(spreadsheet.values_batch_get, ranges) if call else spreadsheet.values_batch_get(ranges)
+    value_ranges = response.get('valueRanges', [])
+    tables = {}
+    for title, value_range in zip(titles, value_ranges):
+        tables[title] = SheetTable(routes.get(title, title), value_range.get('values', []))
+    return tables
+
+
+def load_snapshot(spreadsheet, titles=None, call=None, routes=None, year=None):
+    """Fetch all worksheets with one values.batchGet request and parse them"""
+    started = time.time()
+    snapshot = SheetsSnapshot(load_tables(spreadsheet, titles or SNAPSHOT_SHEETS, call, routes), year)
+    # The data is as of the request, so writes made while it was in flight count as newer
+    snapshot.loaded_at = started
+    return snapshot
@@ -0,0 +1,761 @@
+"""
+SQLite Storage Backend - Serves all reads from a local indexed database
+The spreadsheet stays the source of truth: a background sync pulls teacher edits
+made in Sheets. Teacher edits made on the site are applied to the store and queued
+in its outbox, which the sync thread replays against Sheets, so no request waits on it
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import rate_limiter
+from google_sheets_direct import UPDATES_POSTED_KEY, GoogleSheetsService
+from sheets_batch import append_rows_request, delete_rows_requests, diff_requests, update_cell_request
+from rate_limiter import PRIORITY_LOW, high_priority
+from shared_cache import CACHE_DIR, get_shared_cache
+from sheets_snapshot import SNAPSHOT_SHEETS, SheetTable, SheetsSnapshot, normalize_credential, normalize_id
+from partitions import current_year, partition_routes
+from updates_feed import UpdatesIndex
+
+# Seconds between background pulls from the spreadsheet
+SYNC_INTERVAL = int(os.environ.get('SQLITE_SYNC_INTERVAL', '60'))
+# Seconds between checks for site writes other workers mirrored into the store
+STORE_POLL_INTERVAL = 5
+# A queued site write that keeps failing is retried with backoff, then dropped
+OUTBOX_MAX_ATTEMPTS = 8
+# Seconds one worker may hold the sync lease while sending the outbox
+OUTBOX_LEASE = 300
+
+SCHEMA = [
+    # Raw worksheet values (position 0 is the header row) so snapshots rebuild exactly
+    "CREATE TABLE IF NOT EXISTS sheet_rows (sheet TEXT, position INTEGER, values_json TEXT, PRIMARY KEY (sheet, position))",
+    "CREATE TABLE IF NOT EXISTS students (position INTEGER PRIMARY KEY, id_key TEXT, name_key TEXT, pass_key TEXT, data_json TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_students_id ON students (id_key)",
+    "CREATE INDEX IF NOT EXISTS idx_students_login ON students (name_key, pass_key)",
+    "CREATE TABLE IF NOT EXISTS auth (position INTEGER PRIMARY KEY, user_key TEXT, pass_key TEXT, student_id TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_auth_login ON auth (user_key, pass_key)",
+    "CREATE TABLE IF NOT EXISTS tests (position INTEGER PRIMARY KEY, student_key TEXT, test_name TEXT, date TEXT, data_json TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_tests_student ON tests (student_key)",
+    "CREATE INDEX IF NOT EXISTS idx_tests_name ON tests (test_name)",
+    "CREATE INDEX IF NOT EXISTS idx_tests_date ON tests (date)",
+    "CREATE TABLE IF NOT EXISTS attendance (position INTEGER PRIMARY KEY, student_key TEXT, date TEXT, status TEXT, data_json TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_attendance_student ON attendance (student_key, date)",
+    "CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date)",
+    "CREATE TABLE IF NOT EXISTS updates (position INTEGER PRIMARY KEY, start_date TEXT, end_date TEXT, priority INTEGER, data_json TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_updates_dates ON updates (start_date, end_date)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    # Site writes applied locally and not yet replayed against Sheets, in order
+    "CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, method TEXT, args_json TEXT,"
+    " attempts INTEGER NOT NULL DEFAULT 0, next_at REAL NOT NULL DEFAULT 0)",
+]
+# Index table kept for each worksheet (AttendanceSummary only has raw rows)
+INDEX_TABLES = {'Students': 'students', 'StudentAuth': 'auth', 'Tests': 'tests',
+                'Attendance': 'attendance', 'Updates': 'updates'}
+
+
+def _iso_date(value):
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d').date().isoformat()
+    except:
+        return None
+
+
+def _priority(value):
+    try:
+        return int(value)
+    except:
+        return 0
+
+
+def _index_rows(sheet, table, items):
+    """Index-table rows for the (position, row) pairs of one worksheet; `table` supplies the headers"""
+    width = len(table.headers)
+    items = [(position, row + [''] * (width - len(row))) for position, row in items]
+    if sheet == 'Students':
+        out = []
+        for position, row in items:
+            if not any(row): continue
+            record = table.record(row)
+            out.append((position, normalize_id(record.get('id', '')), normalize_credential(record.get('name', '')),
+                        normalize_credential(record.get('password', '')), json.dumps(record)))
+        return out
+    if sheet == 'StudentAuth':
+        return [(position, normalize_credential(row[0]), normalize_credential(row[1]),
+                 row[2] if len(row) > 2 else row[0])
+                for position, row in items if len(row) >= 2]
+    if sheet == 'Tests':
+        sid_idx, name_idx, date_idx = table.index('studentid'), table.index('testname'), table.index('date')
+        return [(position, normalize_id(row[sid_idx]) if sid_idx != -1 else '',
+                 row[name_idx].strip() if name_idx != -1 else '',
+                 _iso_date(row[date_idx]) if date_idx != -1 else None,
+                 json.dumps(table.record(row)))
+                for position, row in items]
+    if sheet == 'Attendance':
+        sid_idx, date_idx, status_idx = table.index('studentid'), table.index('date'), table.index('status')
+        return [(position, normalize_id(row[sid_idx]) if sid_idx != -1 else '',
+                 _iso_date(row[date_idx]) if date_idx != -1 else None,
+                 row[status_idx] if status_idx != -1 else '',
+                 json.dumps(table.record(row)))
+                for position, row in items]
+    if sheet == 'Updates':
+        out = []
+        for position, row in items:
+            if not any(row): continue
+            record = table.record(row)
+            out.append((position, _iso_date(record.get('start_date', '')), _iso_date(record.get('end_date', '')),
+                        _priority(record.get('priority', 0)), json.dumps(record)))
+        return out
+    return []
+
+
+def _insert_index(conn, sheet, rows):
+    if rows:
+        marks = ', '.join('?' * len(rows[0]))
+        conn.executemany(f"INSERT OR REPLACE INTO {INDEX_TABLES[sheet]} VALUES ({marks})", rows)
+
+
+def _cell_values(rows):
+    """Plain values of the RowData of an updateCells/appendCells request"""
+    return [[cell.get('userEnteredValue', {}).get('stringValue', '') for cell in row.get('values', [])]
+            for row in rows]
+
+
+class SQLiteStore:
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('SQLITE_STORE_PATH') or os.path.join(CACHE_DIR, 'sheets_store.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def generation(self):
+        """Increments on every import; workers compare it to know when to reload"""
+        return int(self._meta('generation', '0'))
+
+    def revision(self, sheet=None):
+        """Changes on every import and on every mirrored site write (to `sheet`, or to any sheet)"""
+        key = f'revision:{sheet}' if sheet else 'revision'
+        values = dict(self._conn().execute(
+            "SELECT key, value FROM meta WHERE key IN ('generation', ?)", (key,)).fetchall())
+        return int(values.get('generation', 0)), int(values.get(key, 0))
+
+    def pulled_at(self):
+        return float(self._meta('pulled_at', '0'))
+
+    def request_sync(self):
+        """Ask the background sync for a pull that starts after now"""
+        self._conn().execute("INSERT OR REPLACE INTO meta VALUES ('sync_requested', ?)", (str(time.time()),))
+
+    def sync_due(self):
+        """True when a site write asked for a pull that has not started yet"""
+        return float(self._meta('sync_requested', '0')) > self.pulled_at()
+
+    def import_snapshot(self, snapshot, reapply=None):
+        """
+        Replace the local copy with a freshly pulled snapshot in one transaction; returns
+        its revision. `reapply(conn)` re-applies the queued site writes Sheets lacks yet.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ('sheet_rows', 'students', 'auth', 'tests', 'attendance', 'updates'):
+                conn.execute(f"DELETE FROM {table}")
+
+            for title, table in snapshot.tables.items():
+                values = ([table.headers] if table.headers else []) + table.rows
+                conn.executemany(
+                    "INSERT INTO sheet_rows (sheet, position, values_json) VALUES (?, ?, ?)",
+                    [(title, i, json.dumps(row)) for i, row in enumerate(values)]
+                )
+
+            for sheet in INDEX_TABLES:
+                table = snapshot.tables.get(sheet)
+                if table is not None:
+                    _insert_index(conn, sheet, _index_rows(sheet, table, enumerate(table.rows)))
+
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (str(self.generation() + 1),))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('pulled_at', ?)", (str(snapshot.loaded_at),))
+            if reapply:
+                reapply(conn)
+            revision = self.revision()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return revision
+
+    def append_rows(self, sheet, rows):
+        """Mirror rows a site write appended to `sheet`"""
+        self._mutate(lambda conn: self._append(conn, sheet, rows) or [sheet])
+
+    def apply_requests(self, requests, sheets):
+        """
+        Mirror a batchUpdate a site write sent. `sheets` maps sheet ids to the mirrored
+        worksheets; requests for any other tab (past partitions) are skipped.
+        """
+        self._mutate(lambda conn: self._apply(conn, requests, sheets.get))
+
+    def queue_write(self, method, args, plan):
+        """
+        Apply a site write to the store and queue `method(*args)` for Sheets, in one
+        transaction. `plan()` returns its requests against the store (sheet ids are the
+        logical sheet names), or None when there is nothing to write.
+        """
+        def change(conn):
+            requests = plan()
+            if requests is None:
+                return None
+            conn.execute("INSERT INTO outbox (method, args_json) VALUES (?, ?)", (method, json.dumps(args)))
+            return self.apply_local(conn, requests)
+        return self._mutate(change) is not None
+
+    def restore_write(self, plan):
+        """Re-apply a queued write a pull dropped from the store while Sheets still lacks it"""
+        self._mutate(lambda conn: self.apply_local(conn, plan() or []))
+
+    def apply_local(self, conn, requests):
+        """
+        Apply requests planned against the store. Deleted rows are blanked rather than
+        removed, so the rows the mirror addresses keep Sheets' row numbers until the next pull.
+        """
+        return self._apply(conn, requests, lambda sheet: sheet, blank_deletes=True)
+
+    def _apply(self, conn, requests, sheet_for, blank_deletes=False):
+        touched = []
+        for request in requests:
+            if 'updateCells' in request:
+                spec = request['updateCells']
+                sheet = sheet_for(spec['range']['sheetId'])
+                if sheet:
+                    self._set_cells(conn, sheet, spec['range']['startRowIndex'],
+                                    spec['range'].get('startColumnIndex', 0), _cell_values(spec['rows']))
+            elif 'deleteDimension' in request:
+                grid = request['deleteDimension']['range']
+                sheet = sheet_for(grid['sheetId'])
+                if sheet:
+                    delete = self._blank if blank_deletes else self._delete
+                    delete(conn, sheet, grid['startIndex'], grid['endIndex'])
+            elif 'appendCells' in request:
+                spec = request['appendCells']
+                sheet = sheet_for(spec['sheetId'])
+                if sheet:
+                    self._append(conn, sheet, _cell_values(spec['rows']))
+            else:
+                continue
+            if sheet:
+                touched.append(sheet)
+        return touched
+
+    def _mutate(self, change):
+        """Run `change(conn)` in one transaction; the sheets it returns get a new revision"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            touched = change(conn)
+            for sheet in set(touched or []) | ({None} if touched else set()):
+                conn.execute("INSERT INTO meta VALUES (?, '1') ON CONFLICT (key) DO UPDATE"
+                             " SET value = CAST(value AS INTEGER) + 1", (f'revision:{sheet}' if sheet else 'revision',))
+            conn.execute("COMMIT")
+            return touched
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def outbox(self):
+        """Queued site writes as (id, method, args, attempts), oldest first"""
+        cursor = self._conn().execute("SELECT id, method, args_json, attempts, next_at FROM outbox ORDER BY id")
+        return [(op_id, method, json.loads(args), attempts, next_at)
+                for op_id, method, args, attempts, next_at in cursor.fetchall()]
+
+    def outbox_pending(self):
+        return self._conn().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def outbox_done(self, op_id):
+        self._conn().execute("DELETE FROM outbox WHERE id = ?", (op_id,))
+
+    def outbox_retry(self, op_id, attempts):
+        """Back the write off: 5 s after the first failure, doubling up to 5 minutes"""
+        self._conn().execute("UPDATE outbox SET attempts = ?, next_at = ? WHERE id = ?",
+                             (attempts, time.time() + min(300, STORE_POLL_INTERVAL * 2 ** (attempts - 1)), op_id))
+
+    def header(self, sheet):
+        """Raw header row of a worksheet"""
+        row = self._conn().execute("SELECT values_json FROM sheet_rows WHERE sheet = ? AND position = 0",
+                                   (sheet,)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def rows_at(self, sheet, positions):
+        """{data position: row padded to the header} for the given data positions"""
+        width = len(self.header(sheet))
+        rows = {}
+        for position in positions:
+            found = self._conn().execute("SELECT values_json FROM sheet_rows WHERE sheet = ? AND position = ?",
+                                         (sheet, position + 1)).fetchone()
+            row = json.loads(found[0]) if found else []
+            rows[position] = row + [''] * (width - len(row))
+        return rows
+
+    def positions(self, sheet, student_id):
+        """Data positions of one student's rows in Students (first match only), Tests, Attendance or StudentAuth"""
+        key = normalize_id(student_id)
+        query = {
+            'Students': "SELECT position FROM students WHERE id_key = ? ORDER BY position LIMIT 1",
+            'Tests': "SELECT position FROM tests WHERE student_key = ? ORDER BY position",
+            'Attendance': "SELECT position FROM attendance WHERE student_key = ? ORDER BY position",
+            'StudentAuth': "SELECT position FROM auth WHERE lower(trim(student_id)) = ? AND trim(student_id) != ''"
+                           " ORDER BY position",
+        }[sheet]
+        return [r[0] for r in self._conn().execute(query, (key,)).fetchall()]
+
+    def login_position(self, username):
+        """Data position of the first StudentAuth row for a username, or None"""
+        row = self._conn().execute("SELECT MIN(position) FROM auth WHERE user_key = ?",
+                                   (normalize_credential(username),)).fetchone()
+        return row[0] if row else None
+
+    def summary_positions(self, student_id):
+        """Data positions of one student's AttendanceSummary rows"""
+        table = self.table('AttendanceSummary')
+        sid_idx = table.index('studentid')
+        if sid_idx == -1:
+            return []
+        return [p for p, row in enumerate(table.rows) if normalize_id(row[sid_idx]) == normalize_id(student_id)]
+
+    @staticmethod
+    def _header_table(conn, sheet):
+        row = conn.execute("SELECT values_json FROM sheet_rows WHERE sheet = ? AND position = 0", (sheet,)).fetchone()
+        return SheetTable(sheet, [json.loads(row[0])] if row else [])
+
+    def _reindex(self, conn, sheet, items):
+        """Rewrite the index rows of the given (grid row, values) pairs"""
+        if sheet not in INDEX_TABLES or not items:
+            return
+        # Grid row 0 is the header; index positions count data rows from 0
+        items = [(g - 1, row) for g, row in items if g > 0]
+        conn.executemany(f"DELETE FROM {INDEX_TABLES[sheet]} WHERE position = ?", [(p,) for p, _ in items])
+        # Blanked rows stay in sheet_rows but not in the index
+        items = [(p, row) for p, row in items if any(str(v).strip() for v in row)]
+        _insert_index(conn, sheet, _index_rows(sheet, self._header_table(conn, sheet), items))
+
+    def _append(self, conn, sheet, rows):
+        start = conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM sheet_rows WHERE sheet = ?",
+                             (sheet,)).fetchone()[0]
+        items = [(start + i, [str(v) for v in row]) for i, row in enumerate(rows)]
+        conn.executemany("INSERT INTO sheet_rows (sheet, position, values_json) VALUES (?, ?, ?)",
+                         [(sheet, g, json.dumps(row)) for g, row in items])
+        self._reindex(conn, sheet, items)
+
+    def _set_cells(self, conn, sheet, start_row, start_col, values):
+        items = []
+        for offset, cells in enumerate(values):
+            g = start_row + offset
+            found = conn.execute("SELECT values_json FROM sheet_rows WHERE sheet = ? AND position = ?",
+                                 (sheet, g)).fetchone()
+            row = json.loads(found[0]) if found else []
+            row += [''] * (start_col + len(cells) - len(row))
+            row[start_col:start_col + len(cells)] = [str(v) for v in cells]
+            conn.execute("INSERT OR REPLACE INTO sheet_rows (sheet, position, values_json) VALUES (?, ?, ?)",
+                         (sheet, g, json.dumps(row)))
+            items.append((g, row))
+        self._reindex(conn, sheet, items)
+
+    def _blank(self, conn, sheet, start, end):
+        """Empty grid rows [start, end) in place"""
+        conn.execute("UPDATE sheet_rows SET values_json = '[]' WHERE sheet = ? AND position >= ? AND position < ?",
+                     (sheet, start, end))
+        self._reindex(conn, sheet, [(g, []) for g in range(start, end)])
+
+    def _delete(self, conn, sheet, start, end):
+        """Remove grid rows [start, end) and shift the rows below up, like Sheets does"""
+        count = end - start
+        conn.execute("DELETE FROM sheet_rows WHERE sheet = ? AND position >= ? AND position < ?", (sheet, start, end))
+        # Negate first so the shift never collides with a row that has not moved yet
+        conn.execute("UPDATE sheet_rows SET position = -(position - ?) WHERE sheet = ? AND position >= ?",
+                     (count, sheet, end))
+        conn.execute("UPDATE sheet_rows SET position = -position WHERE sheet = ? AND position < 0", (sheet,))
+        table = INDEX_TABLES.get(sheet)
+        if table:
+            conn.execute(f"DELETE FROM {table} WHERE position >= ? AND position < ?", (start - 1, end - 1))
+            conn.execute(f"UPDATE {table} SET position = -(position - ?) WHERE position >= ?", (count, end - 1))
+            conn.execute(f"UPDATE {table} SET position = -position WHERE position < 0")
+
+    def table(self, sheet):
+        """One worksheet's current rows (including mirrored site writes) as a SheetTable"""
+        cursor = self._conn().execute("SELECT values_json FROM sheet_rows WHERE sheet = ? ORDER BY position", (sheet,))
+        return SheetTable(sheet, [json.loads(r[0]) for r in cursor.fetchall()])
+
+    def load_snapshot(self):
+        """Rebuild a SheetsSnapshot from the stored raw rows (None before the first import)"""
+        cursor = self._conn().execute("SELECT sheet, values_json FROM sheet_rows ORDER BY sheet, position")
+        values = {}
+        for sheet, values_json in cursor.fetchall():
+            values.setdefault(sheet, []).append(json.loads(values_json))
+        if not values:
+            return None
+        snapshot = SheetsSnapshot({title: SheetTable(title, values.get(title, [])) for title in SNAPSHOT_SHEETS})
+        snapshot.loaded_at = self.pulled_at()
+        return snapshot
+
+    def students(self):
+        cursor = self._conn().execute("SELECT data_json FROM students ORDER BY position")
+        return [json.loads(r[0]) for r in cursor.fetchall()]
+
+    def student(self, student_id):
+        row = self._conn().execute(
+            "SELECT data_json FROM students WHERE id_key = ? ORDER BY position LIMIT 1", (normalize_id(student_id),)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def tests_for(self, student_id):
+        cursor = self._conn().execute(
+            "SELECT data_json FROM tests WHERE student_key = ? ORDER BY position", (normalize_id(student_id),))
+        return [json.loads(r[0]) for r in cursor.fetchall()]
+
+    def attendance_for(self, student_id):
+        cursor = self._conn().execute(
+            "SELECT data_json FROM attendance WHERE student_key = ? ORDER BY position", (normalize_id(student_id),))
+        return [json.loads(r[0]) for r in cursor.fetchall()]
+
+    def find_login(self, username, password):
+        user, secret = normalize_credential(username), normalize_credential(password)
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT student_id FROM auth WHERE user_key = ? AND pass_key = ? ORDER BY position LIMIT 1", (user, secret)
+        ).fetchone()
+        if row is None:
+            # Fallback: student name and password from the Students sheet
+            row = conn.execute(
+                "SELECT json_extract(data_json, '$.id') FROM students WHERE name_key = ? AND pass_key = ?"
+                " ORDER BY position LIMIT 1", (user, secret)
+            ).fetchone()
+        return row[0] if row else None
+
+
+class SQLiteSheetsService(GoogleSheetsService):
+    """GoogleSheetsService whose reads are answered by the local SQLite store"""
+
+    def __init__(self, start_background=True):
+        self.store = SQLiteStore()
+        self._store_revision = None
+        self._sync_wakeup = threading.Event()
+        # The outbox entry (and the pull it starts from) this thread is replaying
+        self._replay = threading.local()
+        # An empty store is filled by the first data request, not at startup
+        super().__init__(start_background)
+
+    def _start_background_refresh(self):
+        """The periodic pull into the store replaces the snapshot refresher"""
+        threading.Thread(target=self._sync_loop, name='sqlite-sheets-sync', daemon=True).start()
+
+    def _pull(self):
+        """Download the spreadsheet and import it into the store (coalesced per worker)"""
+        return self._flight.do('pull', self._pull_now)
+
+    def _pull_now(self):
+        snapshot = self._load_current()
+        self._store_revision = self.store.import_snapshot(snapshot, self._reapply_outbox)
+        self._snapshot = snapshot
+        if self.store.outbox_pending():
+            # The pulled snapshot lacks the queued writes the store re-applied
+            self._store_revision = None
+            self._sync_wakeup.set()
+        print(f"[INFO] SQLite store synced from Google Sheets (generation {self.store.generation()})")
+        return snapshot
+
+    def _reapply_outbox(self, conn):
+        """Re-apply queued writes on top of a pull, except the one being replayed"""
+        replaying = getattr(self._replay, 'op', None)
+        for op_id, method, args, _, _ in self.store.outbox():
+            if op_id == replaying:
+                continue
+            try:
+                self.store.apply_local(conn, self._plan(method, args)() or [])
+            except Exception as e:
+                print(f"[WARNING] Could not re-apply queued {method}: {e}")
+
+    def _sync_loop(self):
+        while True:
+            self._sync_wakeup.wait(STORE_POLL_INTERVAL)
+            self._sync_wakeup.clear()
+            if self.store.outbox_pending():
+                try:
+                    self._push_outbox()
+                except Exception as e:
+                    print(f"[ERROR] SQLite outbox push failed: {e}")
+            if self.store.pulled_at() and self.store.revision() != self._store_revision:
+                try:
+                    # Picks up mirrored site writes without touching the request path
+                    self._flight.do('store', self._reload_from_store)
+                except Exception as e:
+                    print(f"[ERROR] SQLite snapshot rebuild failed: {e}")
+            # Only one worker pulls per interval; the rest see the new generation
+            if not self.store.sync_due() and time.time() - self.store.pulled_at() < SYNC_INTERVAL:
+                continue
+            shared = get_shared_cache()
+            if not shared.acquire_lease('sqlite_sync', SYNC_INTERVAL):
+                continue
+            try:
+                # Background refreshes yield the quota to logins and teacher writes
+                with rate_limiter.priority(PRIORITY_LOW):
+                    self._pull()
+            except Exception as e:
+                print(f"[ERROR] SQLite background sync failed: {e}")
+            finally:
+                shared.release_lease('sqlite_sync')
+
+    def _push_outbox(self):
+        """
+        Send queued site writes to Sheets in order, one worker at a time; True once the
+        outbox is empty. Each write runs the normal Sheets path on a pull that lacks only
+        that write, so its mirror lands on the rows Sheets changed.
+        """
+        shared = get_shared_cache()
+        # Shared with the pulls: one landing between a write and its mirror would apply it twice
+        if not shared.acquire_lease('sqlite_sync', OUTBOX_LEASE):
+            return False
+        try:
+            for op_id, method, args, attempts, next_at in self.store.outbox():
+                if next_at > time.time():
+                    return False
+                self._replay.op, pulled, done = op_id, None, False
+                try:
+                    pulled = self._replay.snapshot = self._pull_now()
+                    if self._plan(method, args)() is None:
+                        # Changed in Sheets meanwhile (the student is gone): nothing left to send
+                        print(f"[WARNING] Skipped queued {method}, its rows are no longer in Google Sheets")
+                        done = True
+                    else:
+                        done = getattr(GoogleSheetsService, method)(self, *args)
+                except Exception as e:
+                    print(f"[ERROR] Sending queued {method} to Google Sheets failed: {e}")
+                finally:
+                    self._replay.op = self._replay.snapshot = None
+                if not done and attempts + 1 < OUTBOX_MAX_ATTEMPTS:
+                    self.store.outbox_retry(op_id, attempts + 1)
+                    if pulled is not None:
+                        self.store.restore_write(self._plan(method, args))
+                    return False
+                if not done:
+                    print(f"[ERROR] Dropped queued {method} after {OUTBOX_MAX_ATTEMPTS} failed attempts")
+                self.store.outbox_done(op_id)
+            return True
+        finally:
+            shared.release_lease('sqlite_sync')
+
+    def _flush_rows(self, worksheet, rows):
+        # Queued marks must not reach Sheets ahead of the edits queued before them
+        if self.store.outbox_pending() and not self._push_outbox():
+            raise RuntimeError("Queued site edits are not in Google Sheets yet")
+        super()._flush_rows(worksheet, rows)
+
+    def _get_snapshot(self, force=False, view='students'):
+        """Snapshot rebuilt from the store; writes that need live row numbers pull first"""
+        self._ensure_background_refresh()
+        if force:
+            # Site writes only run the Sheets path from the outbox, which has pulled already
+            replayed = getattr(self._replay, 'snapshot', None)
+            return replayed if replayed is not None else self._pull_now()
+        if getattr(self, '_snapshot', None) is None:
+            return self._flight.do('store', self._reload_from_store)
+        if self.store.revision() != self._store_revision:
+            # The sync thread rebuilds it; serve the current copy meanwhile
+            self._sync_wakeup.set()
+        return self._snapshot
+
+    def _ready_store(self):
+        """The store, filled from Sheets first if no worker has pulled yet"""
+        self._ensure_background_refresh()
+        if not self.store.pulled_at():
+            self._pull()
+        return self.store
+
+    def _reload_from_store(self):
+        # Read first: a write landing during the rebuild triggers another one
+        revision = self.store.revision()
+        snapshot = self.store.load_snapshot()
+        if snapshot is None:
+            return self._pull()
+        self._snapshot = snapshot
+        self._store_revision = revision
+        return snapshot
+
+    def _invalidate_snapshot(self):
+        """Site writes are already mirrored into the store; Sheets is re-read in the background"""
+        self.store.request_sync()
+        self._sync_wakeup.set()
+
+    def _mirrored_sheets(self):
+        """{worksheet id: logical sheet} for the tabs the store holds"""
+        routes = partition_routes()
+        return {self._worksheet(routes.get(sheet, sheet)).id: sheet for sheet in SNAPSHOT_SHEETS}
+
+    def _append_rows(self, worksheet, rows):
+        super()._append_rows(worksheet, rows)
+        sheet = self._mirrored_sheets().get(worksheet.id)
+        if sheet:
+            self._mirror(lambda: self.store.append_rows(sheet, rows))
+
+    def _batch_update(self, requests):
+        super()._batch_update(requests)
+        self._mirror(lambda: self.store.apply_requests(requests, self._mirrored_sheets()))
+
+    def _mirror(self, change):
+        """Apply a write Sheets accepted to the store; on failure the next pull catches up"""
+        try:
+            change()
+        except Exception as e:
+            print(f"[WARNING] SQLite store mirror failed, waiting for the next sync: {e}")
+            self.store.request_sync()
+
+    def get_all_students(self):
+        try:
+            revision = self._ready_store().revision('Students')
+            if getattr(self, '_students_revision', None) != revision:
+                self._students = self.store.students()
+                self._students_revision = revision
+            return self._students
+        except Exception as e:
+            print(f"Error in get_all_students: {e}")
+            return []
+
+    def _updates_feed_index(self):
+        """UpdatesIndex of the stored Updates rows, rebuilt only when they change"""
+        revision = self._ready_store().revision('Updates')
+        index = getattr(self, '_updates_index', None)
+        if index is None or index[0] != revision:
+            index = self._updates_index = (revision, UpdatesIndex(self.store.table('Updates')))
+        return index[1]
+
+    def get_student(self, student_id, year=None):
+        if year and int(year) != current_year():
+            # Past partitions are not in the store; read them through the router
+            return super().get_student(student_id, year)
+        try:
+            student = self._ready_store().student(student_id)
+            if student:
+                self._assemble_student(student, student_id,
+                                       self.store.tests_for(student_id),
+                                       self.store.attendance_for(student_id),
+                                       self._get_snapshot())
+            return student
+        except Exception as e:
+            print(f"Error in get_student: {e}")
+            return None
+
+    @high_priority
+    def authenticate_student(self, username, password):
+        try:
+            student_id = self._ready_store().find_login(username, password)
+            return self.get_student(student_id) if student_id is not None else None
+        except Exception as e:
+            print(f"Error in authenticate_student: {e}")
+            return None
+
+    @high_priority
+    def add_student(self, data):
+        return self._queue('add_student', data)
+
+    @high_priority
+    def update_student(self, student_id, data):
+        if not self._queue('update_student', student_id, data):
+            return False
+        self._student_saved(student_id, data)
+        return True
+
+    @high_priority
+    def delete_student(self, student_id):
+        if not self._queue('delete_student', student_id):
+            return False
+        self._student_deleted(normalize_id(student_id))
+        return True
+
+    def add_update(self, update_row):
+        if not self._queue('add_update', update_row):
+            return False
+        get_shared_cache().set(UPDATES_POSTED_KEY, True)
+        return True
+
+    @high_priority
+    def sync_auth_record(self, username, password, student_id):
+        return self._queue('sync_auth_record', username, password, student_id)
+
+    def _queue(self, method, *args):
+        """Apply a site write to the store and leave sending it to the sync thread"""
+        try:
+            queued = self._ready_store().queue_write(method, list(args), self._plan(method, args))
+        except Exception as e:
+            print(f"Error in {method}: {e}")
+            return False
+        if queued:
+            self._sync_wakeup.set()
+        return queued
+
+    def _plan(self, method, args):
+        """`plan()` for a queued write: its requests against the store, None if it no longer applies"""
+        return lambda: getattr(self, f'_plan_{method}')(*args)
+
+    def _plan_add_student(self, data):
+        return [append_rows_request('Students', [[str(data.get(h, '')).strip() for h in self.store.header('Students')]])]
+
+    def _plan_update_student(self, student_id, data):
+        positions = self.store.positions('Students', student_id)
+        if not positions:
+            return None
+        current = self.store.rows_at('Students', positions)[positions[0]]
+        row = [str(data.get(h, '')).strip() for h in self.store.header('Students')]
+        requests = diff_requests('Students', [(positions[0] + 2, current)], [row])
+        if 'tests' in data:
+            existing = self.store.rows_at('Tests', self.store.positions('Tests', student_id))
+            requests += diff_requests('Tests', [(p + 2, r) for p, r in existing.items()],
+                                      self._test_rows(student_id, data['tests']))
+        if 'attendance_log' in data:
+            existing = self.store.rows_at('Attendance', self.store.positions('Attendance', student_id))
+            requests += diff_requests('Attendance', [(p + 2, r) for p, r in existing.items()],
+                                      self._attendance_rows(student_id, data['attendance_log']))
+        return requests
+
+    def _plan_delete_student(self, student_id):
+        positions = self.store.positions('Students', student_id)
+        if not positions:
+            return None
+        requests = delete_rows_requests('Students', [positions[0] + 2])
+        for sheet in ('Tests', 'Attendance', 'StudentAuth'):
+            requests += delete_rows_requests(sheet, [p + 2 for p in self.store.positions(sheet, student_id)])
+        return requests + delete_rows_requests('AttendanceSummary',
+                                               [p + 2 for p in self.store.summary_positions(student_id)])
+
+    def _plan_add_update(self, update_row):
+        return [append_rows_request('Updates', [update_row])]
+
+    def _plan_sync_auth_record(self, username, password, student_id):
+        position = self.store.login_position(username)
+        if position is None:
+            return [append_rows_request('StudentAuth', [[str(username), str(password), str(student_id)]])]
+        return [update_cell_request('StudentAuth', position + 2, 1, password),
+                update_cell_request('StudentAuth', position + 2, 2, student_id)]
+
+    def _student_saved(self, student_id, data):
+        # Done when the edit was queued; marks queued since then must survive its replay
+        if getattr(self._replay, 'op', None) is None:
+            super()._student_saved(student_id, data)
+
+    def _student_deleted(self, target_id):
+        if getattr(self._replay, 'op', None) is None:
+            super()._student_deleted(target_id)
@@ -0,0 +1,81 @@
+"""
+Static Assets - Content-hashed static URLs with immutable caching
+Hashes every file under static/ at startup, rewrites url_for('static', ...) to the
+fingerprinted names and serves those names with far-future immutable headers
+"""
+import hashlib
+import os
+
+from flask import send_from_directory
+
+# One year, the longest lifetime caches honour
+IMMUTABLE_MAX_AGE = 31536000
+# Unhashed static URLs are revalidated after this long
+DEFAULT_MAX_AGE = 3600
+# Files whose URL must stay stable (the PWA manifest is referenced by its path)
+UNHASHED = {'manifest.json'}
+# Assets the service worker precaches on install
+PRECACHE_EXTENSIONS = ('.css', '.js', '.png')
+
+
+def _digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()[:10]
+
+
+def build_manifest(static_folder):
+    """Map each static file to its fingerprinted name, e.g. css/style.css -> css/style.1a2b3c4d5e.css"""
+    manifest = {}
+    for root, _, files in os.walk(static_folder):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            if filename in UNHASHED:
+                continue
+            stem, ext = os.path.splitext(filename)
+            manifest[filename] = f"{stem}.{_digest(path)}{ext}"
+    return manifest
+
+
+class StaticAssets:
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.originals = {}
+        self.version = ''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.manifest = build_manifest(app.static_folder)
+        self.originals = {hashed: filename for filename, hashed in self.manifest.items()}
+        self.version = hashlib.sha256(
+            "".join(sorted(self.manifest.values())).encode()
+        ).hexdigest()[:10]
+        app.url_defaults(self.fingerprint_url)
+        app.view_functions['static'] = self.serve
+        app.extensions['static_assets'] = self
+        print(f"[INFO] Fingerprinted {len(self.manifest)} static files (version {self.version})")
+
+    def fingerprint_url(self, endpoint, values):
+        """url_defaults hook: point url_for('static', filename=...) at the hashed name"""
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.manifest.get(values['filename'], values['filename'])
+
+    def serve(self, filename):
+        original = self.originals.get(filename)
+        if original is None:
+            return send_from_directory(self.static_folder, filename, max_age=DEFAULT_MAX_AGE)
+        response = send_from_directory(self.static_folder, original, max_age=IMMUTABLE_MAX_AGE)
+        # The name changes whenever the content does, so browsers never need to revalidate
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def precache_urls(self, static_url_path):
+        """Fingerprinted URLs of the assets worth installing with the service worker"""
+        return [f"{static_url_path}/{hashed}" for filename, hashed in sorted(self.manifest.items())
+                if filename.endswith(PRECACHE_EXTENSIONS) and not filename.startswith('images/gallery/')]
@@ -0,0 +1,44 @@
+// Generated by the /service-worker.js route; the cache name and asset list
+// change whenever a static file's content hash does.
+const CACHE_NAME = 'ashwathama-{{ version }}';
+const ASSETS_TO_CACHE = {{ precache_urls | tojson }};
+const OFFLINE_URL = '/';
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(CACHE_NAME).then((cache) => {
+      return cache.addAll(ASSETS_TO_CACHE.concat([OFFLINE_URL]));
+    }).then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', (event) => {
+  // Drop caches left behind by earlier asset versions
+  event.waitUntil(
+    caches.keys().then((names) => Promise.all(
+      names.filter((name) => name !== CACHE_NAME).map((name) => caches.delete(name))
+    )).then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  if (request.method !== 'GET') return;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) return;
+
+  // Fingerprinted assets never change under the same URL: cache first
+  if (ASSETS_TO_CACHE.includes(url.pathname)) {
+    event.respondWith(
+      caches.match(request).then((response) => response || fetch(request))
+    );
+    return;
+  }
+
+  // Pages always come from the network so content stays fresh; offline, show the home page
+  if (request.mode === 'navigate') {
+    event.respondWith(
+      fetch(request).catch(() => caches.match(OFFLINE_URL))
+    );
+  }
+});
@@ -0,0 +1,54 @@
+"""
+Updates Feed - Announcements parsed once per snapshot into a date-interval index
+Active-today lookups bisect on start date and are cached until the date changes
+"""
+import bisect
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+
+def _parse_date(value):
+    return datetime.strptime(str(value or '').strip(), '%Y-%m-%d').date()
+
+
+class UpdatesIndex:
+    def __init__(self, table):
+        """Parse every Updates row once; rows with unreadable dates are skipped"""
+        entries = []
+        for position, row in enumerate(table.rows):
+            if not any(row): continue
+            update = table.record(row)
+            try:
+                start_date = _parse_date(update.get('start_date'))
+                end_date = _parse_date(update.get('end_date'))
+            except:
+                continue
+            try:
+                update['priority'] = int(update.get('priority', 0))
+            except:
+                update['priority'] = 0
+            entries.append((start_date, end_date, position, update))
+        entries.sort(key=lambda e: (e[0], e[2]))
+        self.entries = entries
+        self.starts = [e[0] for e in entries]
+        self._day = None
+        self._active = ([], '', None)
+
+    def active(self, today):
+        """
+        (updates running on `today` by priority, ETag of that list, the last day an update
+        started or ended); cached per day. Every worker derives the same values.
+        """
+        if self._day != today:
+            # Only intervals that have started can be running; check their end dates
+            started = self.entries[:bisect.bisect_right(self.starts, today)]
+            running = [e for e in started if e[1] >= today]
+            running.sort(key=lambda e: (-e[3]['priority'], e[2]))
+            updates = [e[3] for e in running]
+            body = json.dumps(updates, sort_keys=True, default=str).encode('utf-8')
+            # An update leaves the feed the day after its end date
+            changes = [e[0] for e in running] + [e[1] + timedelta(days=1) for e in started if e[1] < today]
+            self._active = (updates, hashlib.sha1(body).hexdigest()[:20], max(changes, default=None))
+            self._day = today
+        return self._active
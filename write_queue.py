@@ -0,0 +1,176 @@
+"""
+Write-Behind Queue - Durable local journal for teacher submissions
+Rows are written to SQLite first and pushed to Google Sheets by a background flusher
+that batches per worksheet, retries with backoff and coalesces repeated submissions
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from shared_cache import CACHE_DIR
+
+# Seconds between flush passes when nothing new is queued
+FLUSH_INTERVAL = 5
+# How long a worker may hold claimed rows before another worker retries them
+CLAIM_TIMEOUT = 120
+# Backoff bounds for failed flushes (seconds)
+BACKOFF_BASE = 2
+BACKOFF_MAX = 600
+
+
+class WriteBehindQueue:
+    def __init__(self, flush, path=None):
+        """`flush(worksheet, rows)` sends a list of rows to one worksheet and raises on failure"""
+        self.flush = flush
+        self.path = path or os.path.join(CACHE_DIR, 'write_journal.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS pending_writes ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " worksheet TEXT NOT NULL,"
+            " row_key TEXT NOT NULL,"
+            " row_json TEXT NOT NULL,"
+            " queued_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt REAL NOT NULL DEFAULT 0,"
+            " claimed_until REAL NOT NULL DEFAULT 0,"
+            " UNIQUE (worksheet, row_key) ON CONFLICT REPLACE)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Submissions must survive a crash right after the response is sent
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, worksheet, entries):
+        """
+        Journal `entries` as (row_key, row) pairs for `worksheet`.
+        A later entry with the same key replaces an unsent earlier one.
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO pending_writes (worksheet, row_key, row_json, queued_at) VALUES (?, ?, ?, ?)",
+                [(worksheet, key, json.dumps(row), now) for key, row in entries]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.start()
+        self._wakeup.set()
+
+    def pending_rows(self, worksheet):
+        """Rows still waiting to be sent to `worksheet`, oldest first"""
+        try:
+            cursor = self._conn().execute(
+                "SELECT row_json FROM pending_writes WHERE worksheet = ? ORDER BY id", (worksheet,)
+            )
+            return [json.loads(r[0]) for r in cursor.fetchall()]
+        except Exception as e:
+            print(f"[WARNING] Could not read write journal: {e}")
+            return []
+
+    def pending_since(self, worksheet, last_id):
+        """(journal id, row key, row) for queued rows newer than `last_id`"""
+        try:
+            cursor = self._conn().execute(
+                "SELECT id, row_key, row_json FROM pending_writes WHERE worksheet = ? AND id > ? ORDER BY id",
+                (worksheet, last_id)
+            )
+            return [(r[0], r[1], json.loads(r[2])) for r in cursor.fetchall()]
+        except Exception as e:
+            print(f"[WARNING] Could not read write journal: {e}")
+            return []
+
+    def discard(self, worksheet, student_key):
+        """Drop unsent rows for one student, e.g. after a full edit already saved them"""
+        try:
+            prefix = f"{student_key}|"
+            self._conn().execute(
+                "DELETE FROM pending_writes WHERE worksheet = ? AND substr(row_key, 1, ?) = ?",
+                (worksheet, len(prefix), prefix)
+            )
+        except Exception as e:
+            print(f"[WARNING] Could not discard queued rows: {e}")
+
+    def version(self):
+        """Cheap fingerprint of the journal contents for cache keys"""
+        try:
+            return self._conn().execute("SELECT COUNT(*), MAX(id) FROM pending_writes").fetchone()
+        except Exception:
+            return (0, None)
+
+    def start(self):
+        """Start this worker's background flusher thread once"""
+        if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='sheets-write-behind', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush_pending()
+            except Exception as e:
+                print(f"[ERROR] Write-behind flush pass failed: {e}")
+
+    def _claim(self):
+        """Atomically claim due rows so two workers never send the same batch"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, worksheet, row_json, attempts FROM pending_writes"
+                " WHERE next_attempt <= ? AND claimed_until <= ? ORDER BY id",
+                (now, now)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE pending_writes SET claimed_until = ? WHERE id = ?",
+                    [(now + CLAIM_TIMEOUT, r[0]) for r in rows]
+                )
+            conn.execute("COMMIT")
+            return rows
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def flush_pending(self):
+        """Send every due row, one batch per worksheet"""
+        batches = {}
+        for row_id, worksheet, row_json, attempts in self._claim():
+            batches.setdefault(worksheet, []).append((row_id, json.loads(row_json), attempts))
+
+        conn = self._conn()
+        for worksheet, items in batches.items():
+            try:
+                self.flush(worksheet, [row for _, row, _ in items])
+                conn.executemany("DELETE FROM pending_writes WHERE id = ?", [(i[0],) for i in items])
+                print(f"[INFO] Flushed {len(items)} queued rows to {worksheet}")
+            except Exception as e:
+                attempts = max(i[2] for i in items) + 1
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempts)) * random.uniform(0.5, 1.5)
+                print(f"[ERROR] Flush to {worksheet} failed (attempt {attempts}), retrying in {delay:.0f}s: {e}")
+                conn.executemany(
+                    "UPDATE pending_writes SET attempts = ?, next_attempt = ?, claimed_until = 0 WHERE id = ?",
+                    [(attempts, time.time() + delay, i[0]) for i in items]
+                )
@@ -0,0 +1,122 @@
+"""
+YouTube Catalogue - Local index of every upload on the channel
+Videos and a token index over their titles and descriptions live in SQLite,
+so /youtube can search and paginate without calling the YouTube API
+"""
+import os
+import re
+import sqlite3
+import threading
+
+from shared_cache import CACHE_DIR
+
+PAGE_SIZE = 12
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+# Shorter tokens match too much to be worth indexing
+MIN_TOKEN_LENGTH = 2
+
+
+def tokenize(text):
+    return {t for t in TOKEN_RE.findall(str(text or '').lower()) if len(t) >= MIN_TOKEN_LENGTH}
+
+
+def summarize(description):
+    return description[:200] + '...' if len(description) > 200 else description
+
+
+class VideoCatalogue:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'youtube_catalogue.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(
+            "CREATE TABLE IF NOT EXISTS videos ("
+            " id TEXT PRIMARY KEY, title TEXT, description TEXT, thumbnail TEXT, published_at TEXT);"
+            "CREATE INDEX IF NOT EXISTS videos_published ON videos (published_at);"
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            " token TEXT NOT NULL, video_id TEXT NOT NULL, PRIMARY KEY (token, video_id)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        if value is None:
+            self._conn().execute("DELETE FROM meta WHERE key = ?", (key,))
+        else:
+            self._conn().execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def known_ids(self, video_ids):
+        """Which of `video_ids` are already in the catalogue"""
+        if not video_ids:
+            return set()
+        marks = ','.join('?' * len(video_ids))
+        rows = self._conn().execute(f"SELECT id FROM videos WHERE id IN ({marks})", list(video_ids))
+        return {r[0] for r in rows}
+
+    def add_videos(self, videos):
+        """Insert or refresh videos and their tokens in one transaction"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for v in videos:
+                conn.execute("INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?)",
+                             (v['id'], v['title'], v['description'], v['thumbnail'], v['published_at']))
+                conn.execute("DELETE FROM tokens WHERE video_id = ?", (v['id'],))
+                conn.executemany("INSERT INTO tokens VALUES (?, ?)",
+                                 [(t, v['id']) for t in tokenize(f"{v['title']} {v['description']}")])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+
+    def years(self):
+        rows = self._conn().execute(
+            "SELECT DISTINCT substr(published_at, 1, 4) FROM videos ORDER BY 1 DESC"
+        )
+        return [r[0] for r in rows if r[0]]
+
+    def search(self, query='', year=None, page=1, per_page=PAGE_SIZE):
+        """
+        One page of videos, newest first. Every query token must prefix-match a token
+        of the title or description. Returns (videos, total matches).
+        """
+        where, params = [], []
+        for token in sorted(tokenize(query)):
+            where.append("id IN (SELECT video_id FROM tokens WHERE token >= ? AND token < ?)")
+            params += [token, token + '\uffff']
+        if year:
+            where.append("substr(published_at, 1, 4) = ?")
+            params.append(str(year))
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM videos{clause}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT id, title, description, thumbnail, published_at FROM videos{clause}"
+            " ORDER BY published_at DESC LIMIT ? OFFSET ?",
+            params + [per_page, (max(1, page) - 1) * per_page]
+        ).fetchall()
+        videos = [{
+            'id': video_id,
+            'title': title,
+            'description': summarize(description or ''),
+            'thumbnail': thumbnail,
+            'url': f'https://www.youtube.com/watch?v={video_id}',
+            'published_at': published_at,
+            'embed_url': f'https://www.youtube.com/embed/{video_id}'
+        } for video_id, title, description, thumbnail, published_at in rows]
+        return videos, total
@@ -8,111 +8,299 @@ import requests
 from datetime import datetime
 from functools import lru_cache
 import time
+import threading
+import metrics
+from shared_cache import get_shared_cache
+from youtube_catalogue import VideoCatalogue, PAGE_SIZE, summarize
+
+# Shared-cache keys: the channel lookup never changes, feeds are refreshed in the background
+CHANNEL_CACHE_KEY = 'youtube_channel'
+FEED_CACHE_KEY = 'youtube_feed:{}'
+# Seconds between background checks for new uploads (conditional, so usually a 304)
+REFRESH_INTERVAL = int(os.getenv('YOUTUBE_REFRESH_INTERVAL', '900'))
+API_URL = 'https://www.googleapis.com/youtube/v3'
+# Lease held by the worker paging the uploads playlist into the catalogue
+CATALOGUE_LEASE = 'youtube_catalogue_sync'
+
+def _api_get(resource, params, **kwargs):
+    """GET one YouTube Data API resource, timed and with quota errors counted"""
+    with metrics.timed('youtube_api_duration_seconds', 'youtube', resource=resource):
+        response = requests.get(f'{API_URL}/{resource}', params=params, **kwargs)
+    if response.status_code == 403 and 'quotaExceeded' in response.text:
+        metrics.inc('quota_errors_total', api='youtube')
+    return response
 
 class YouTubeService:
     def __init__(self):
         self.api_key = os.getenv('YOUTUBE_API_KEY', '')
         self.channel_username = '@ASHWATHAMACLASSES'
         self.initialized = bool(self.api_key)
-        self.cache_time = 0
-        self.cached_videos = []
-        self.cache_duration = 3600  # Cache for 1 hour
+        self.cache_time = {}
+        self.cached_videos = {}
+        self.cache_duration = 3600  # Feeds older than this are refreshed ahead of the interval
+        self._feed_sizes = set()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._catalogue = None
     
-    def get_channel_id(self):
-        """Get channel ID from username"""
+    @property
+    def catalogue(self):
+        if self._catalogue is None:
+            self._catalogue = VideoCatalogue()
+        return self._catalogue
+
+    def get_channel(self):
+        """Channel and uploads playlist IDs, looked up once and persisted in the shared cache"""
         if not self.initialized:
             return None
         
+        shared = get_shared_cache()
+        channel, _ = shared.get(CHANNEL_CACHE_KEY)
+        if channel:
+            return channel
+
         try:
-            url = 'https://www.googleapis.com/youtube/v3/search'
+            # forHandle costs 1 quota unit and returns the uploads playlist too (search costs 100)
             params = {
-                'part': 'snippet',
-                'q': self.channel_username,
-                'type': 'channel',
-                'key': self.api_key,
-                'maxResults': 1
+                'part': 'contentDetails',
+                'forHandle': self.channel_username,
+                'key': self.api_key
             }
             
-            response = requests.get(url, params=params, timeout=5)
+            response = _api_get('channels', params, timeout=5)
             if response.status_code == 200:
-                data = response.json()
-                if data.get('items'):
-                    return data['items'][0]['snippet']['channelId']
+                items = response.json().get('items')
+                if items:
+                    channel = {
+                        'channel_id': items[0]['id'],
+                        'uploads_playlist_id': items[0]['contentDetails']['relatedPlaylists']['uploads']
+                    }
+                    shared.set(CHANNEL_CACHE_KEY, channel)
+                    return channel
         except Exception as e:
             print(f"⚠️ Error fetching channel ID: {e}")
         
         return None
+
+    def get_channel_id(self):
+        """Get channel ID from username"""
+        channel = self.get_channel()
+        return channel['channel_id'] if channel else None
     
     def get_latest_videos(self, max_results=10):
-        """Fetch latest videos from the channel"""
+        """Latest videos from the shared cache; never waits on the YouTube API"""
         if not self.initialized:
             return []
         
-        # Return cached if still fresh
-        if self.cached_videos and (time.time() - self.cache_time) < self.cache_duration:
-            return self.cached_videos
+        self._feed_sizes.add(max_results)
+        self.start()
+
+        key = FEED_CACHE_KEY.format(max_results)
+        shared = get_shared_cache()
+        try:
+            stored_at = shared.stored_at(key)
+        except Exception:
+            stored_at = 0
+        metrics.cache_lookup('youtube_feed', bool(stored_at))
+        if not stored_at:
+            # Nothing fetched yet by any worker: ask the refresher; the page shows a loading state
+            self._wakeup.set()
+            return self.cached_videos.get(max_results, [])
         
+        # Only unpickle when another worker (or our thread) stored something newer
+        if self.cache_time.get(max_results) != stored_at:
+            feed, stored_at = shared.get(key)
+            if feed:
+                self.cached_videos[max_results] = feed['videos']
+                self.cache_time[max_results] = stored_at
+        if time.time() - stored_at > self.cache_duration:
+            self._wakeup.set()
+        return self.cached_videos.get(max_results, [])
+
+    def start(self):
+        """Start this worker's background feed refresher once"""
+        if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='youtube-refresher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            for max_results in list(self._feed_sizes):
+                try:
+                    self.refresh_feed(max_results)
+                except Exception as e:
+                    print(f"❌ YouTube refresh failed: {e}")
+            try:
+                self.sync_catalogue()
+            except Exception as e:
+                print(f"❌ YouTube catalogue sync failed: {e}")
+            self._wakeup.wait(REFRESH_INTERVAL)
+            self._wakeup.clear()
+
+    def refresh_feed(self, max_results):
+        """Revalidate one shared feed unless another worker did so recently"""
+        key = FEED_CACHE_KEY.format(max_results)
+        shared = get_shared_cache()
+        feed, stored_at = shared.get(key)
+        if feed and time.time() - stored_at < REFRESH_INTERVAL / 2:
+            return
+        # One worker per feed talks to the API; the others pick up its result
+        if not shared.acquire_lease(key, 60):
+            return
         try:
-            channel_id = self.get_channel_id()
-            if not channel_id:
+            fresh = self._fetch_latest_videos(max_results, feed)
+            if fresh is not None:
+                shared.set(key, fresh)
+        finally:
+            shared.release_lease(key)
+
+    def _fetch_latest_videos(self, max_results, previous=None):
+        """
+        Fetch the uploads playlist, revalidating with the previous ETag.
+        Returns {'etag', 'videos'}, the unchanged previous feed on a 304, or None on failure.
+        """
+        try:
+            channel = self.get_channel()
+            if not channel:
                 print("⚠️ Could not find YouTube channel")
-                return []
-            
-            # Get uploads playlist
-            url = 'https://www.googleapis.com/youtube/v3/channels'
-            params = {
-                'part': 'contentDetails',
-                'id': channel_id,
-                'key': self.api_key
-            }
-            
-            response = requests.get(url, params=params, timeout=5)
-            if response.status_code != 200:
-                print("⚠️ Error fetching channel details")
-                return []
-            
-            uploads_playlist_id = response.json()['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+                return None
             
             # Get videos from uploads playlist
-            url = 'https://www.googleapis.com/youtube/v3/playlistItems'
             params = {
                 'part': 'snippet,contentDetails',
-                'playlistId': uploads_playlist_id,
+                'playlistId': channel['uploads_playlist_id'],
                 'key': self.api_key,
                 'maxResults': max_results,
                 'order': 'date'
             }
+            headers = {}
+            if previous and previous.get('etag'):
+                headers['If-None-Match'] = previous['etag']
             
-            response = requests.get(url, params=params, timeout=5)
+            response = _api_get('playlistItems', params, headers=headers, timeout=5)
+            if response.status_code == 304:
+                return previous
             if response.status_code != 200:
                 print("⚠️ Error fetching videos")
-                return []
+                return None
             
+            data = response.json()
             videos = []
-            for item in response.json().get('items', []):
-                snippet = item['snippet']
-                video_id = snippet['resourceId']['videoId']
-                
-                videos.append({
-                    'id': video_id,
-                    'title': snippet['title'],
-                    'description': snippet['description'][:200] + '...' if len(snippet['description']) > 200 else snippet['description'],
-                    'thumbnail': snippet['thumbnails']['high']['url'],
-                    'url': f'https://www.youtube.com/watch?v={video_id}',
-                    'published_at': snippet['publishedAt'],
-                    'embed_url': f'https://www.youtube.com/embed/{video_id}'
-                })
-            
-            # Cache the results
-            self.cached_videos = videos
-            self.cache_time = time.time()
+            for item in data.get('items', []):
+                video = self._video_from_item(item)
+                if video:
+                    video['description'] = summarize(video['description'])
+                    videos.append(video)
             
             print(f"✓ Fetched {len(videos)} videos from YouTube channel")
-            return videos
+            return {'etag': data.get('etag') or response.headers.get('ETag'), 'videos': videos}
         
         except Exception as e:
             print(f"❌ YouTube API error: {e}")
-            return []
+            return None
+
+    @staticmethod
+    def _video_from_item(item):
+        """Video dict from a playlistItems entry; None for private or deleted uploads"""
+        snippet = item['snippet']
+        thumbnails = snippet.get('thumbnails') or {}
+        thumbnail = thumbnails.get('high') or thumbnails.get('medium') or thumbnails.get('default')
+        if not thumbnail:
+            return None
+        video_id = snippet['resourceId']['videoId']
+        return {
+            'id': video_id,
+            'title': snippet['title'],
+            'description': snippet.get('description', ''),
+            'thumbnail': thumbnail['url'],
+            'url': f'https://www.youtube.com/watch?v={video_id}',
+            'published_at': item.get('contentDetails', {}).get('videoPublishedAt') or snippet['publishedAt'],
+            'embed_url': f'https://www.youtube.com/embed/{video_id}'
+        }
+
+    def sync_catalogue(self):
+        """
+        Page the uploads playlist (newest first) into the local catalogue. The first sync
+        walks every page and resumes if interrupted; later syncs stop at the first known video.
+        """
+        catalogue = self.catalogue
+        if time.time() - float(catalogue.get_meta('synced_at', 0)) < REFRESH_INTERVAL / 2:
+            return
+        shared = get_shared_cache()
+        if not shared.acquire_lease(CATALOGUE_LEASE, 300):
+            return
+        try:
+            channel = self.get_channel()
+            if not channel:
+                return
+            complete = catalogue.get_meta('complete') == '1'
+            page_token = None if complete else catalogue.get_meta('resume_token')
+            added = 0
+            while True:
+                params = {
+                    'part': 'snippet,contentDetails',
+                    'playlistId': channel['uploads_playlist_id'],
+                    'key': self.api_key,
+                    'maxResults': 50
+                }
+                if page_token:
+                    params['pageToken'] = page_token
+                response = _api_get('playlistItems', params, timeout=10)
+                if response.status_code != 200:
+                    print(f"⚠️ Error paging uploads playlist ({response.status_code})")
+                    return
+                data = response.json()
+                videos = [v for v in (self._video_from_item(i) for i in data.get('items', [])) if v]
+                page_token = data.get('nextPageToken')
+
+                if complete:
+                    # Uploads are newest first: everything after a known video is indexed already
+                    known = catalogue.known_ids([v['id'] for v in videos])
+                    new_videos = []
+                    for video in videos:
+                        if video['id'] in known:
+                            page_token = None
+                            break
+                        new_videos.append(video)
+                    videos = new_videos
+
+                catalogue.add_videos(videos)
+                added += len(videos)
+                if not complete:
+                    catalogue.set_meta('resume_token', page_token)
+                if not page_token:
+                    break
+
+            catalogue.set_meta('complete', 1)
+            catalogue.set_meta('synced_at', time.time())
+            if added:
+                print(f"✓ Indexed {added} new videos ({catalogue.count()} in catalogue)")
+        finally:
+            shared.release_lease(CATALOGUE_LEASE)
+
+    def search_videos(self, query='', year=None, page=1):
+        """A page of catalogue search results, or None until the catalogue has been synced"""
+        if not self.initialized:
+            return None
+        self.start()
+        try:
+            catalogue = self.catalogue
+            if not catalogue.count():
+                return None
+            page = max(1, page)
+            videos, total = catalogue.search(query, year, page)
+            return {
+                'videos': videos,
+                'total': total,
+                'page': page,
+                'pages': max(1, -(-total // PAGE_SIZE)),
+                'years': catalogue.years()
+            }
+        except Exception as e:
+            print(f"❌ YouTube catalogue error: {e}")
+            return None
     
     def is_configured(self):
         """Check if YouTube API is configured"""